@@ -0,0 +1,201 @@
+"""
+Headless benchmarks for the render-preparation stages of the plot package
+
+Run from the root of the repository, for instance::
+
+    python -m benchmarks.render --duration 120 --sr 44100 --output results.json
+
+Each stage is timed over ``--repeat`` runs and the results are written as
+JSON so that runs from different commits can be compared.  Stages that
+need Qt or an OpenGL context are run on Qt's offscreen platform when no
+display is available, and are reported as skipped if that fails.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+import numpy as np
+
+from .synthetic import SyntheticDiscourse
+
+
+def time_stage(function, repeat):
+    timings = []
+    for i in range(repeat):
+        begin = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - begin)
+    timings = np.array(timings)
+    return {'mean': float(timings.mean()), 'min': float(timings.min()),
+            'max': float(timings.max()), 'repeat': repeat}
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                        stderr = subprocess.DEVNULL).decode('utf8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def data_stages(discourse, view_begin, view_end, pixel_width):
+    from speechtools.plot.helper import (generate_boundaries, label_level_of_detail,
+                                        get_envelope_mesh_data)
+    from speechtools.plot.visuals import WaveformVisual
+
+    hierarchy = discourse.hierarchy
+    annotations = discourse.annotations(view_begin, view_end)
+    sound = discourse.sound
+    sig = sound.signal[:, 0]
+    data = np.empty((sig.shape[0], 2), dtype = np.float32)
+    data[:, 0] = np.arange(sig.shape[0]) / sound.sr
+    data[:, 1] = sig
+    pps = pixel_width / (view_end - view_begin)
+    line_data, text_data = generate_boundaries(annotations, hierarchy, view_begin, view_end)
+
+    def label_lod():
+        for k in text_data.keys():
+            labels, pos, widths = text_data[k]
+            label_level_of_detail(pos, widths, pps, view_begin, view_end)
+
+    def waveform_levels():
+        for f in WaveformVisual.level_factors:
+            if data.shape[0] // f >= 2:
+                get_envelope_mesh_data(data, data.shape[0] // f)
+
+    return {'generate_boundaries': lambda: generate_boundaries(annotations, hierarchy,
+                                                                view_begin, view_end),
+            'label_level_of_detail': label_lod,
+            'waveform_envelope': lambda: get_envelope_mesh_data(data, pixel_width),
+            'waveform_cache_levels': waveform_levels}
+
+
+def spectrogram_stages(discourse, view_begin, view_end):
+    from speechtools.plot.visuals import SCTSpectrogramVisual
+
+    sound = discourse.sound
+    spec = SCTSpectrogramVisual()
+    spec.set_sampling_rate(sound.sr)
+    spec._signal = sound.visible_preemph_signal(view_begin, view_end)
+    spec._n_fft = 256
+    return {'spectrogram': spec._do_spec}
+
+
+def audio_window_stages(discourse, view_begin, view_end):
+    from speechtools.audio_cache import AudioWindow
+
+    sound = discourse.sound
+    window = AudioWindow(sound)
+    return {'audio_window': lambda: AudioWindow(sound),
+            'visible_preemph_signal': lambda: window.visible_preemph_signal(view_begin, view_end)}
+
+
+def tracking_stages(discourse, view_begin, view_end):
+    from speechtools.tracking import TrackCache
+
+    sound = discourse.sound
+    return {'local_tracks': lambda: TrackCache().compute(sound, 0, view_begin, view_end)}
+
+
+def widget_stages(discourse, view_begin, view_end):
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication(sys.argv)
+
+    from speechtools.plot import SpectralWidget
+    from speechtools.widgets.selectable_audio import SelectableAudioWidget
+    from speechtools.audio_cache import AudioWindow
+
+    spectral = SpectralWidget()
+    spectral.update_sampling_rate(discourse.sound.sr)
+    spectral.update_signal(discourse.sound.visible_preemph_signal(view_begin, view_end))
+    pitch = discourse.pitch_from_begin(view_begin, view_end)
+    formants = discourse.formants_from_begin(view_begin, view_end)
+
+    widget = SelectableAudioWidget()
+    widget.updateHierachy(discourse.hierarchy)
+    widget.discourse_model = discourse
+    widget.audio = AudioWindow(discourse.sound)
+    widget.view_begin, widget.view_end = view_begin, view_end
+    widget.uploadSignal()
+
+    def update_visible():
+        widget.updateVisible()
+        app.processEvents()
+
+    return {'set_pitch': lambda: spectral.update_pitch(pitch),
+            'set_formants': lambda: spectral.update_formants(formants),
+            'update_visible': update_visible}
+
+
+def run(args):
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    discourse = SyntheticDiscourse(duration = args.duration,
+                                    words_per_second = args.words_per_second,
+                                    phones_per_word = args.phones_per_word,
+                                    subannotations = args.subannotations,
+                                    sr = args.sr, seed = args.seed)
+    view_begin = 0
+    view_end = min(args.view, args.duration)
+
+    results = {}
+    skipped = {}
+    for name, factory, factory_args in [
+                ('data', data_stages, (discourse, view_begin, view_end, args.pixel_width)),
+                ('spectrogram', spectrogram_stages, (discourse, view_begin, view_end)),
+                ('audio_window', audio_window_stages, (discourse, view_begin, view_end)),
+                ('tracking', tracking_stages, (discourse, view_begin, view_end)),
+                ('widgets', widget_stages, (discourse, view_begin, view_end))]:
+        try:
+            stages = factory(*factory_args)
+        except Exception as e:
+            skipped[name] = '{}: {}'.format(type(e).__name__, e)
+            continue
+        for stage, function in stages.items():
+            if args.stages and stage not in args.stages:
+                continue
+            try:
+                results[stage] = time_stage(function, args.repeat)
+            except Exception as e:
+                skipped[stage] = '{}: {}'.format(type(e).__name__, e)
+
+    return {'commit': current_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': vars(args),
+            'results': results,
+            'skipped': skipped}
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark render preparation of the plot package')
+    parser.add_argument('--duration', type = float, default = 60, help = 'Discourse duration in seconds')
+    parser.add_argument('--view', type = float, default = 15, help = 'Visible window in seconds')
+    parser.add_argument('--words-per-second', type = float, default = 3)
+    parser.add_argument('--phones-per-word', type = int, default = 4)
+    parser.add_argument('--subannotations', type = int, default = 0, help = 'Subannotations per phone')
+    parser.add_argument('--sr', type = int, default = 16000, help = 'Sampling rate of the synthetic audio')
+    parser.add_argument('--pixel-width', type = int, default = 1200)
+    parser.add_argument('--repeat', type = int, default = 10)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--stages', nargs = '*', help = 'Only run these stages')
+    parser.add_argument('--output', help = 'Write JSON results to this path instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 2)
+    else:
+        json.dump(report, sys.stdout, indent = 2)
+        sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    main()
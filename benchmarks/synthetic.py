@@ -0,0 +1,148 @@
+"""
+Synthetic discourses for benchmarking, shaped like the objects that the
+plot package receives from polyglotdb
+"""
+import random
+
+import numpy as np
+
+
+class SyntheticHierarchy(object):
+    def __init__(self, highest_to_lowest, subannotations = None):
+        self.highest_to_lowest = list(highest_to_lowest)
+        if subannotations is None:
+            subannotations = {}
+        self.subannotations = subannotations
+
+    @property
+    def highest(self):
+        return self.highest_to_lowest[0]
+
+    @property
+    def lowest(self):
+        return self.highest_to_lowest[-1]
+
+    def keys(self):
+        return list(self.highest_to_lowest)
+
+    def __contains__(self, key):
+        return key in self.highest_to_lowest
+
+    def get_lower_types(self, annotation_type):
+        ind = self.highest_to_lowest.index(annotation_type)
+        return self.highest_to_lowest[ind + 1:]
+
+
+class SyntheticAnnotation(object):
+    def __init__(self, annotation_type, begin, end, label):
+        self._type = annotation_type
+        self.begin = begin
+        self.end = end
+        self.label = label
+        self.checked = False
+
+
+class SyntheticSound(object):
+    """
+    Stand-in for a fully cached ``LongSoundFile``
+    """
+    def __init__(self, duration, sr, num_channels = 1, seed = 0):
+        rng = np.random.RandomState(seed)
+        num_samples = int(duration * sr)
+        t = np.arange(num_samples) / sr
+        signal = 0.3 * np.sin(2 * np.pi * 150 * t)[:, np.newaxis] + \
+                    0.05 * rng.randn(num_samples, num_channels)
+        self.path = None
+        self.sr = sr
+        self.duration = duration
+        self.num_channels = num_channels
+        self.cached_begin = 0
+        self.cached_end = duration
+        self.signal = signal.astype(np.float32)
+        self.preemph_signal = self.signal.copy()
+        self.preemph_signal[1:] -= 0.95 * self.signal[:-1]
+
+    def visible_preemph_signal(self, begin, end, channel = 0):
+        begin -= self.cached_begin
+        end -= self.cached_begin
+        min_samp = int(np.floor(begin * self.sr))
+        max_samp = int(np.ceil(end * self.sr))
+        return self.preemph_signal[min_samp:max_samp, channel]
+
+
+class SyntheticDiscourse(object):
+    """
+    Stand-in for the discourse model used by ``SelectableAudioWidget``
+
+    Parameters
+    ----------
+    duration : float
+        Length of the discourse in seconds
+    words_per_second : float
+        Density of the word tier
+    phones_per_word : int
+        Number of phones in each word
+    subannotations : int
+        Number of subannotations (i.e., bursts) on each phone
+    sr : int
+        Sampling rate of the synthetic audio
+    """
+    def __init__(self, duration = 60, words_per_second = 3, phones_per_word = 4,
+                subannotations = 0, sr = 16000, seed = 0):
+        rng = random.Random(seed)
+        self.name = 'synthetic'
+        self.duration = duration
+        self.max_time = duration
+        self.cached_begin = 0
+        self.cached_end = duration
+        self.cached_to_begin = True
+        self.cached_to_end = True
+        self.sound_file = None
+        sub_types = {}
+        if subannotations:
+            sub_types['phone'] = ['burst']
+        self.hierarchy = SyntheticHierarchy(['utterance', 'word', 'phone'], sub_types)
+        self.sound = SyntheticSound(duration, sr, seed = seed)
+
+        self.utterances = []
+        word_dur = 1 / words_per_second
+        utt_begin = 0
+        while utt_begin < duration:
+            utt_end = min(duration, utt_begin + rng.uniform(2, 8))
+            utt = SyntheticAnnotation('utterance', utt_begin, utt_end, None)
+            utt.word = []
+            utt.phone = []
+            word_begin = utt_begin
+            while word_begin + word_dur <= utt_end:
+                word = SyntheticAnnotation('word', word_begin, word_begin + word_dur,
+                                        'word{}'.format(rng.randint(0, 500)))
+                phone_dur = word_dur / phones_per_word
+                word.phone = []
+                for i in range(phones_per_word):
+                    begin = word_begin + i * phone_dur
+                    phone = SyntheticAnnotation('phone', begin, begin + phone_dur,
+                                            rng.choice(['AA1', 'B', 'K', 'IY0', 'S', 'T']))
+                    sub_dur = phone_dur / max(subannotations, 1)
+                    phone.burst = [SyntheticAnnotation('burst', begin + j * sub_dur,
+                                            begin + (j + 1) * sub_dur, None)
+                                    for j in range(subannotations)]
+                    word.phone.append(phone)
+                utt.word.append(word)
+                utt.phone.extend(word.phone)
+                word_begin += word_dur
+            self.utterances.append(utt)
+            utt_begin = utt_end
+
+    def annotations(self, begin = None, end = None, channel = 0):
+        return [x for x in self.utterances if x.end > begin and x.begin < end]
+
+    def pitch_from_begin(self, begin = None, end = None, channel = 0):
+        times = np.arange(0, end - begin, 0.01)
+        track = 120 + 20 * np.sin(times)
+        track[::17] = 0
+        return list(zip(times, track))
+
+    def formants_from_begin(self, begin = None, end = None, channel = 0):
+        times = np.arange(0, end - begin, 0.01)
+        return {'F{}'.format(i): list(zip(times, 500 * (2 * i - 1) + 50 * np.sin(times)))
+                for i in range(1, 4)}
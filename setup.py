@@ -35,6 +35,8 @@ setup(name='speechtools',
       author='Montreal Corpus Tools',
       author_email='michael.e.mcauliffe@gmail.com',
       packages=['speechtools',
+                'speechtools.command_line',
+                'speechtools.profiles',
                 'speechtools.plot',
                 'speechtools.plot.widgets',
                 'speechtools.widgets',
@@ -45,7 +47,8 @@ setup(name='speechtools',
           'librosa',
       ],
       entry_points = {
-        'console_scripts': ['sct=speechtools.command_line.sct:main',],
+        'console_scripts': ['sct=speechtools.command_line.sct:main',
+                            'sct-batch=speechtools.command_line.batch:main',],
     },
     cmdclass={'test': PyTest},
     extras_require={
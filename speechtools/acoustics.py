@@ -0,0 +1,398 @@
+import os
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import librosa
+
+from polyglotdb.config import BASE_DIR
+from polyglotdb.exceptions import PGError
+from polyglotdb.sql.models import SoundFile, Discourse, Pitch, Formants
+
+from .tracking import track_pitch, track_formants, TrackCache
+
+RECORD_DIR = os.path.join(BASE_DIR, 'acoustic_records')
+
+TRACK_MODELS = {'pitch': Pitch, 'formants': Formants}
+
+# Stored as the source of each track point, and part of the signature of
+# an analysis, so changing a tracker marks existing tracks as outdated
+TRACK_SOURCES = {'pitch': 'sct_autocorrelation', 'formants': 'sct_lpc'}
+
+# Time between track points in seconds
+TIME_STEP = 0.01
+
+# Track points computed at once, which bounds the memory used for the
+# analysis windows of long files
+BLOCK_POINTS = 1000
+
+
+def analyses(acoustics):
+    """
+    Analyses to run for an ``acoustics`` setting, which is 'pitch',
+    'formants', 'all' or a list of analyses.
+    """
+    if acoustics in (None, 'all'):
+        return ['pitch', 'formants']
+    if isinstance(acoustics, (list, tuple)):
+        return list(acoustics)
+    return [acoustics]
+
+
+def analysis_signature(analysis, sound_file_id, path):
+    """
+    Signature of the inputs of an analysis of a sound file: the database
+    row of the sound file, which changes when its discourse is imported
+    again, the size and modification time of the file and the tracker
+    used.  Tracks are outdated when their signature no longer matches.
+    """
+    st = os.stat(path)
+    return [sound_file_id, st.st_size, st.st_mtime, TRACK_SOURCES[analysis]]
+
+
+class AnalysisRecord(object):
+    """
+    Record of which analyses each sound file of a corpus has tracks for,
+    and the signature of the inputs they were computed from.
+
+    The record is an append-only file of JSON lines, one per analysed
+    sound file, where later lines take precedence.  Lines are flushed to
+    disk as files finish, so an interrupted analysis only redoes the files
+    that were in progress.
+
+    Parameters
+    ----------
+    corpus_name : str
+        Name of the corpus being analysed
+    """
+    def __init__(self, corpus_name):
+        self.corpus_name = corpus_name
+        self._file = None
+
+    @property
+    def path(self):
+        return os.path.join(RECORD_DIR, self.corpus_name.replace(' ', '_') + '.jsonl')
+
+    def load(self):
+        """
+        Return the recorded signatures, keyed by discourse and analysis.
+        """
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r', encoding = 'utf8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Line cut short by an interruption
+                    continue
+                records.setdefault(entry['discourse'], {}).update(entry['analyses'])
+        return records
+
+    def commit(self, discourse, signatures):
+        os.makedirs(RECORD_DIR, exist_ok = True)
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding = 'utf8')
+        self._file.write(json.dumps({'discourse': discourse, 'analyses': signatures}) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def compact(self, discourses = None):
+        """
+        Rewrite the record with one line per discourse, dropping discourses
+        not in `discourses` if given.
+        """
+        self.close()
+        records = self.load()
+        if not records:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding = 'utf8') as f:
+            for d, signatures in sorted(records.items()):
+                if discourses is not None and d not in discourses:
+                    continue
+                f.write(json.dumps({'discourse': d, 'analyses': signatures}) + '\n')
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def sound_files(corpus_context):
+    """
+    Ids and paths of the sound files of a corpus, keyed by discourse name.
+    """
+    results = corpus_context.sql_session.query(SoundFile).join(Discourse).all()
+    return {sf.discourse.name: (sf.id, sf.filepath) for sf in results}
+
+
+class PendingAnalysis(object):
+    """
+    Analyses that have to be run to bring the tracks of a corpus up to date.
+
+    Attributes
+    ----------
+    tasks : dict
+        Analyses to run for each discourse
+    signatures : dict
+        Signatures to record for each discourse once its analyses finish
+    files : dict
+        Sound file id and path of each discourse to analyse
+    new : list
+        Discourses with analyses that were never run
+    outdated : list
+        Discourses with analyses whose inputs changed
+    missing : list
+        Discourses whose sound file could not be found
+    total : int
+        Number of sound files in the corpus
+    size : int
+        Total size in bytes of the sound files to analyse
+    """
+    def __init__(self):
+        self.tasks = {}
+        self.signatures = {}
+        self.files = {}
+        self.new = []
+        self.outdated = []
+        self.missing = []
+        self.total = 0
+        self.size = 0
+
+    def report(self):
+        if not self.tasks:
+            lines = ['All {} sound files are up to date.'.format(self.total)]
+        else:
+            lines = ['{} of {} sound files need analyzing ({:.1f} MB of audio):'.format(len(self.tasks),
+                                                                self.total, self.size / 1e6)]
+            counts = {}
+            for todo in self.tasks.values():
+                for a in todo:
+                    counts[a] = counts.get(a, 0) + 1
+            for a, count in sorted(counts.items()):
+                lines.append('    {}: {} files'.format(a, count))
+            lines.append('    {} not analyzed yet, {} changed since their last analysis'.format(len(self.new),
+                                                                                    len(self.outdated)))
+        if self.missing:
+            lines.append('{} sound files could not be found and will be skipped.'.format(len(self.missing)))
+        return '\n'.join(lines)
+
+
+def find_pending(corpus_context, acoustics, record, reanalyze = False):
+    """
+    Work out which sound files are missing tracks for `acoustics` or have
+    tracks computed from different inputs.
+
+    Parameters
+    ----------
+    corpus_context : :class:`~polyglotdb.corpus.CorpusContext`
+        Corpus to check
+    acoustics : str
+        Analyses to run, 'pitch', 'formants' or 'all'
+    record : :class:`AnalysisRecord`
+        Record of previous analyses
+    reanalyze : bool
+        If True, every sound file is pending
+
+    Returns
+    -------
+    :class:`PendingAnalysis`
+        The pending work
+    """
+    recorded = record.load()
+    pending = PendingAnalysis()
+    for d, (sound_file_id, path) in sorted(sound_files(corpus_context).items()):
+        pending.total += 1
+        if path is None or not os.path.exists(path):
+            pending.missing.append(d)
+            continue
+        signatures = {a: analysis_signature(a, sound_file_id, path)
+                    for a in analyses(acoustics)}
+        previous = recorded.get(d, {})
+        todo = [a for a in analyses(acoustics) if reanalyze or previous.get(a) != signatures[a]]
+        if not todo:
+            continue
+        if any(a in previous for a in todo):
+            pending.outdated.append(d)
+        else:
+            pending.new.append(d)
+        pending.tasks[d] = todo
+        pending.signatures[d] = {a: signatures[a] for a in todo}
+        pending.files[d] = (sound_file_id, path)
+        pending.size += os.path.getsize(path)
+    return pending
+
+
+def compute_track(signal, sr, analysis, time_step = TIME_STEP):
+    """
+    Track of one channel of a signal, computed every `time_step` seconds
+    in blocks of ``BLOCK_POINTS`` points.
+
+    Returns
+    -------
+    numpy.ndarray
+        Times of the track points
+    dict
+        Values at each time, keyed by measure ('F0', or 'F1', 'F2'...)
+    """
+    times = np.arange(0, signal.shape[0] / sr, time_step)
+    blocks = []
+    for first in range(0, len(times), BLOCK_POINTS):
+        block = times[first:first + BLOCK_POINTS]
+        begin = int(np.floor(max(block[0] - TrackCache.margin, 0) * sr))
+        end = int(np.ceil((block[-1] + TrackCache.margin) * sr))
+        relative = block - begin / sr
+        if analysis == 'pitch':
+            blocks.append({'F0': track_pitch(signal[begin:end], sr, relative)})
+        else:
+            blocks.append(track_formants(signal[begin:end], sr, relative))
+    if not blocks:
+        return times, {}
+    return times, {k: np.concatenate([b[k] for b in blocks]) for k in blocks[0]}
+
+
+def analyze_sound_file(discourse, path, todo):
+    """
+    Compute the tracks of one sound file from its audio, so that it can
+    run in a separate process.  Nothing is read from or written to the
+    database, the tracks are returned for :func:`write_tracks` to store
+    from the main process.
+
+    Returns
+    -------
+    tuple
+        Discourse name, rows of each analysis as dicts of column values,
+        and an error message, or None on success
+    """
+    try:
+        signal, sr = librosa.load(path, sr = None, mono = False)
+        signal = np.atleast_2d(signal).astype(float)
+        tracks = {}
+        for a in todo:
+            rows = []
+            for channel in range(signal.shape[0]):
+                times, values = compute_track(signal[channel], sr, a)
+                for i, t in enumerate(times.tolist()):
+                    row = {'time': t, 'channel': channel, 'source': TRACK_SOURCES[a]}
+                    for k, v in values.items():
+                        row[k] = float(v[i])
+                    rows.append(row)
+            tracks[a] = rows
+    except Exception as e:
+        return discourse, None, str(e)
+    return discourse, tracks, None
+
+
+def write_tracks(corpus_context, sound_file_id, tracks):
+    """
+    Replace the tracks of a sound file with newly computed ones, in a
+    single short transaction.
+    """
+    session = corpus_context.sql_session
+    try:
+        for a, rows in tracks.items():
+            model = TRACK_MODELS[a]
+            columns = set(c.name for c in model.__table__.columns)
+            session.query(model).filter(model.sound_file_id == sound_file_id).delete()
+            mappings = []
+            for row in rows:
+                mapping = {k: v for k, v in row.items() if k in columns}
+                mapping['sound_file_id'] = sound_file_id
+                mappings.append(mapping)
+            session.bulk_insert_mappings(model, mappings)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+
+def analyze_parallel(corpus_context, pending, num_processes = None, record = None,
+                    call_back = None, stop_check = None):
+    """
+    Run pending analyses with one task per sound file spread over a
+    process pool.  Workers only compute tracks, which are written from
+    this process one file at a time as they come back.
+
+    Only as many files as there are processes are in flight at once, so a
+    cancelled analysis stops once the files being analysed are finished.
+
+    Parameters
+    ----------
+    corpus_context : :class:`~polyglotdb.corpus.CorpusContext`
+        Corpus to analyse
+    pending : :class:`PendingAnalysis`
+        Analyses to run
+    num_processes : int, optional
+        Number of processes, defaults to the number of CPUs
+    record : :class:`AnalysisRecord`, optional
+        Record to add each finished file to
+    call_back : callable, optional
+        Progress callback
+    stop_check : callable, optional
+        Returns True when the analysis should stop
+
+    Returns
+    -------
+    dict
+        Error message for each discourse that could not be analysed
+    """
+    if num_processes is None:
+        num_processes = multiprocessing.cpu_count()
+    discourses = sorted(pending.tasks)
+    errors = {}
+    if call_back is not None:
+        call_back('Analyzing {} sound files...'.format(len(discourses)))
+        call_back(0, len(discourses))
+
+    def finished(discourse, tracks, error, done):
+        if error is None:
+            try:
+                write_tracks(corpus_context, pending.files[discourse][0], tracks)
+            except Exception as e:
+                error = str(e)
+        if error is not None:
+            errors[discourse] = error
+        elif record is not None:
+            record.commit(discourse, pending.signatures[discourse])
+        if call_back is not None:
+            call_back('Analyzed {} ({} of {})...'.format(discourse, done, len(discourses)))
+            call_back(done)
+
+    if num_processes <= 1:
+        for i, d in enumerate(discourses):
+            if stop_check is not None and stop_check():
+                break
+            finished(*analyze_sound_file(d, pending.files[d][1], pending.tasks[d]), done = i + 1)
+        return errors
+    remaining = iter(discourses)
+    done = 0
+    with ProcessPoolExecutor(max_workers = num_processes) as executor:
+        running = set()
+        while True:
+            while len(running) < num_processes and (stop_check is None or not stop_check()):
+                d = next(remaining, None)
+                if d is None:
+                    break
+                running.add(executor.submit(analyze_sound_file, d, pending.files[d][1],
+                                                pending.tasks[d]))
+            if not running:
+                break
+            complete, running = wait(running, return_when = FIRST_COMPLETED)
+            for future in complete:
+                done += 1
+                finished(*future.result(), done = done)
+    return errors
+
+
+def analysis_error(errors):
+    return PGError('The following sound files could not be analyzed, run the analysis again to retry them:\n\n' +
+                '\n'.join('{}: {}'.format(k, v) for k, v in sorted(errors.items())))
@@ -0,0 +1,225 @@
+import os
+import wave
+import hashlib
+import threading
+
+import numpy as np
+import librosa
+
+from polyglotdb.config import BASE_DIR
+
+from .plot.helper import get_waveform_levels
+
+DECODED_DIR = os.path.join(BASE_DIR, 'decoded_audio')
+
+# Formats that are read and played directly
+PCM_EXTENSIONS = ('.wav',)
+
+# Formats that are decoded to WAV first
+COMPRESSED_EXTENSIONS = ('.flac', '.mp3', '.ogg', '.m4a')
+
+# All formats sound files can be in, in order of preference
+SOUND_EXTENSIONS = PCM_EXTENSIONS + COMPRESSED_EXTENSIONS
+
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+
+
+def write_pcm(path, signal, sr):
+    """
+    Write a float signal, with one column per channel, as a 16 bit WAV
+    file.
+    """
+    if signal.ndim == 1:
+        signal = signal[:, np.newaxis]
+    data = (np.clip(signal, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(data.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(int(sr))
+        f.writeframes(data.tobytes())
+
+
+class DecodedAudioCache(object):
+    """
+    Cache of compressed sound files (MP3, FLAC, etc.) decoded to WAV, so
+    that each file is only decoded once for display and playback.
+
+    Cached files are named after the path, size and modification time of
+    the original, so edited files are decoded again.  Once the cache
+    grows past `max_size` bytes the least recently used files are removed.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to keep decoded files in
+    max_size : int
+        Size limit of the cache in bytes
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, directory = None, max_size = DEFAULT_MAX_SIZE):
+        if directory is None:
+            directory = DECODED_DIR
+        self.directory = directory
+        self.max_size = max_size
+
+    def cache_path(self, path):
+        st = os.stat(path)
+        key = '{}:{}:{}'.format(os.path.abspath(path), st.st_size, st.st_mtime)
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf8')).hexdigest() + '.wav')
+
+    def get(self, path):
+        """
+        Path of a PCM version of a sound file, decoding it if needed.
+
+        Parameters
+        ----------
+        path : str
+            Path of the original sound file
+
+        Returns
+        -------
+        str
+            `path` itself for WAV files, otherwise the decoded file
+        """
+        if os.path.splitext(path)[1].lower() in PCM_EXTENSIONS:
+            return path
+        cached = self.cache_path(path)
+        with self._lock:
+            if os.path.exists(cached):
+                # Modification time orders files for eviction
+                os.utime(cached)
+                return cached
+        signal, sr = librosa.load(path, sr = None, mono = False)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok = True)
+            temp_path = cached + '.tmp'
+            write_pcm(temp_path, signal.T, sr)
+            os.replace(temp_path, cached)
+            self.evict(keep = cached)
+        return cached
+
+    def size(self):
+        return sum(size for path, mtime, size in self._entries())
+
+    def _entries(self):
+        if not os.path.exists(self.directory):
+            return []
+        entries = []
+        for f in os.listdir(self.directory):
+            if not f.endswith('.wav'):
+                continue
+            path = os.path.join(self.directory, f)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_mtime, st.st_size))
+        return entries
+
+    def evict(self, keep = None):
+        """
+        Remove the least recently used files until the cache fits in
+        `max_size`, never removing `keep`.
+        """
+        entries = sorted(self._entries(), key = lambda x: x[1])
+        total = sum(x[2] for x in entries)
+        for path, mtime, size in entries:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            for path, mtime, size in self._entries():
+                os.remove(path)
+
+
+class DecodedSoundFile(object):
+    """
+    Sound file record whose path points to its decoded version, for
+    passing to :class:`~polyglotdb.graph.discourse.LongSoundFile`.
+    """
+    def __init__(self, sound_file, path):
+        self._sound_file = sound_file
+        self.filepath = path
+
+    def __getattr__(self, name):
+        return getattr(self._sound_file, name)
+
+
+def decoded_sound_file(sound_file, cache = None):
+    """
+    Sound file record reading from the decoded audio cache.
+    """
+    if cache is None:
+        cache = DecodedAudioCache()
+    path = cache.get(sound_file.filepath)
+    if path == sound_file.filepath:
+        return sound_file
+    return DecodedSoundFile(sound_file, path)
+
+
+def preemphasize(signal, coefficient = 0.95):
+    """
+    First order preemphasis filter, as ``lfilter([1, -coefficient], 1, signal)``.
+    """
+    out = np.empty_like(signal)
+    out[0] = signal[0]
+    np.subtract(signal[1:], coefficient * signal[:-1], out = out[1:])
+    return out
+
+
+class AudioWindow(object):
+    """
+    Audio of the window a sound file has cached, with the signal products
+    the discourse viewer draws from computed once per window: a float32
+    time and amplitude buffer and waveform envelopes for each channel,
+    and the preemphasized signal for the spectrogram.  Views of the
+    window are returned as slices of these, without copying or filtering.
+
+    Parameters
+    ----------
+    sound : :class:`~polyglotdb.graph.discourse.LongSoundFile`
+        Sound file with its window loaded
+    """
+    def __init__(self, sound):
+        self.sound = sound
+        self.path = sound.path
+        self.sr = sound.sr
+        self.duration = sound.duration
+        self.num_channels = sound.num_channels
+        self.cached_begin = sound.cached_begin
+        self.cached_end = sound.cached_end
+        self.signal = sound.signal
+        num_samples = self.signal.shape[0]
+        times = np.arange(num_samples) / self.sr + self.cached_begin
+        self.waveforms = []
+        self.preemph_signals = []
+        self.levels = []
+        for i in range(self.signal.shape[1]):
+            data = np.empty((num_samples, 2), dtype = np.float32)
+            data[:, 0] = times
+            data[:, 1] = self.signal[:, i]
+            self.waveforms.append(data)
+            self.preemph_signals.append(preemphasize(data[:, 1]) if num_samples else data[:, 1])
+            self.levels.append(get_waveform_levels(data))
+
+    def _samples(self, begin, end):
+        begin = int(np.floor((begin - self.cached_begin) * self.sr))
+        end = int(np.ceil((end - self.cached_begin) * self.sr))
+        return max(begin, 0), max(end, 0)
+
+    def visible_signal(self, begin, end, channel = 0):
+        begin, end = self._samples(begin, end)
+        return self.waveforms[channel][begin:end, 1]
+
+    def visible_preemph_signal(self, begin, end, channel = 0):
+        begin, end = self._samples(begin, end)
+        return self.preemph_signals[channel][begin:end]
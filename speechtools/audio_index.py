@@ -0,0 +1,290 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from polyglotdb.config import BASE_DIR
+from polyglotdb.sql.models import SoundFile
+from polyglotdb.acoustics.io import add_discourse_sound_info
+
+from .acoustics import sound_files
+from .audio_cache import SOUND_EXTENSIONS
+
+INDEX_DIR = os.path.join(BASE_DIR, 'audio_indexes')
+
+
+def _preference(file_name):
+    return SOUND_EXTENSIONS.index(os.path.splitext(file_name)[1].lower())
+
+
+def scan_directory(path):
+    """
+    List the sound files and subdirectories of a single directory.
+
+    Returns
+    -------
+    float
+        Modification time of the directory
+    dict
+        Name, modification time and size of each sound file, keyed by
+        file name without extension
+    list
+        Names of the subdirectories
+    """
+    mtime = os.stat(path).st_mtime
+    files = {}
+    subdirectories = []
+    # Not a context manager before Python 3.6
+    for entry in os.scandir(path):
+        try:
+            if entry.is_dir(follow_symlinks = False):
+                subdirectories.append(entry.name)
+                continue
+            name, ext = os.path.splitext(entry.name)
+            if ext.lower() not in SOUND_EXTENSIONS:
+                continue
+            # WAV files are preferred as they need no decoding
+            if name in files and _preference(files[name][0]) < _preference(entry.name):
+                continue
+            st = entry.stat()
+        except OSError:
+            # Broken links and files removed while scanning
+            continue
+        files[name] = [entry.name, st.st_mtime, st.st_size]
+    return mtime, files, sorted(subdirectories)
+
+
+class AudioIndex(object):
+    """
+    Persistent index of the sound files under a directory, mapping file
+    names without extension (which match discourse names) to paths.
+
+    The index stores the listing and modification time of each directory.
+    Updating it only lists directories whose modification time changed,
+    which is when files were added, removed or renamed in them, so
+    looking up sound files again on a large network share only costs a
+    stat per directory.  Directories are scanned by a pool of threads, as
+    the walk is bound by file system latency.
+
+    Parameters
+    ----------
+    directory : str
+        Root directory of the sound files
+    """
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.directories = {}
+        self.scanned = 0
+        self.reused = 0
+        self.load()
+
+    @property
+    def path(self):
+        digest = hashlib.sha1(self.directory.encode('utf8')).hexdigest()
+        return os.path.join(INDEX_DIR, digest + '.json')
+
+    def load(self):
+        self.directories = {}
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding = 'utf8') as f:
+                data = json.load(f)
+        except ValueError:
+            # Index cut short by an interruption, scan from scratch
+            return
+        if data.get('directory') == self.directory:
+            self.directories = data['directories']
+
+    def save(self):
+        os.makedirs(INDEX_DIR, exist_ok = True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding = 'utf8') as f:
+            json.dump({'directory': self.directory, 'directories': self.directories}, f)
+        os.replace(temp_path, self.path)
+
+    def _visit(self, relative):
+        """
+        Return the entry for a directory, listing it again only if it
+        changed since the index was last updated.
+        """
+        path = os.path.join(self.directory, relative)
+        previous = self.directories.get(relative)
+        if previous is not None and os.stat(path).st_mtime == previous['mtime']:
+            return relative, previous, False
+        mtime, files, subdirectories = scan_directory(path)
+        return relative, {'mtime': mtime, 'files': files,
+                        'subdirectories': subdirectories}, True
+
+    def update(self, num_threads = 8, call_back = None, stop_check = None):
+        """
+        Walk the directory tree, rescanning changed directories and
+        dropping directories that no longer exist.
+
+        Returns
+        -------
+        bool
+            False if the update was stopped, in which case the index is
+            not saved
+        """
+        self.scanned = 0
+        self.reused = 0
+        directories = {}
+        if call_back is not None:
+            call_back('Looking for sound files in {}...'.format(self.directory))
+            call_back(0, 0)
+        with ThreadPoolExecutor(max_workers = num_threads) as executor:
+            running = set([executor.submit(self._visit, '')])
+            while running:
+                if stop_check is not None and stop_check():
+                    for future in running:
+                        future.cancel()
+                    return False
+                complete, running = wait(running, return_when = FIRST_COMPLETED)
+                for future in complete:
+                    try:
+                        relative, entry, changed = future.result()
+                    except OSError:
+                        # Directory removed or unreadable
+                        continue
+                    directories[relative] = entry
+                    if changed:
+                        self.scanned += 1
+                    else:
+                        self.reused += 1
+                    for d in entry['subdirectories']:
+                        running.add(executor.submit(self._visit, os.path.join(relative, d)))
+                if call_back is not None:
+                    call_back('Looked in {} directories...'.format(len(directories)))
+        self.directories = directories
+        self.save()
+        return True
+
+    def paths(self):
+        """
+        Paths of the sound files in the index, keyed by file name without
+        extension.  When names are repeated in several directories, the
+        first path in sorted order is used.
+
+        Returns
+        -------
+        dict
+            Path for each name
+        dict
+            All paths for each name found more than once
+        """
+        found = {}
+        for relative in sorted(self.directories):
+            entry = self.directories[relative]
+            for name, (file_name, mtime, size) in entry['files'].items():
+                found.setdefault(name, []).append(os.path.join(self.directory, relative, file_name))
+        duplicates = {k: v for k, v in found.items() if len(v) > 1}
+        return {k: v[0] for k, v in found.items()}, duplicates
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class AudioMatch(object):
+    """
+    Result of matching the discourses of a corpus against an
+    :class:`AudioIndex`.
+
+    Attributes
+    ----------
+    matched : dict
+        Sound file path for each discourse that has one
+    missing : list
+        Discourses without a sound file
+    duplicates : dict
+        Every path found for discourses with more than one sound file
+    added : list
+        Discourses whose sound file was newly registered in the corpus
+    scanned : int
+        Number of directories listed
+    reused : int
+        Number of directories unchanged since the last lookup
+    """
+    def __init__(self):
+        self.matched = {}
+        self.missing = []
+        self.duplicates = {}
+        self.added = []
+        self.scanned = 0
+        self.reused = 0
+
+    @property
+    def all_found(self):
+        return not self.missing
+
+    def report(self):
+        total = len(self.matched) + len(self.missing)
+        lines = ['Found sound files for {} of {} discourses ({} newly added).'.format(
+                                        len(self.matched), total, len(self.added)),
+                '{} directories scanned, {} unchanged since the last lookup.'.format(
+                                        self.scanned, self.reused)]
+        if self.missing:
+            lines.append('')
+            lines.append('No sound file was found for:')
+            lines.extend('    ' + d for d in self.missing)
+        if self.duplicates:
+            lines.append('')
+            lines.append('Several sound files were found for the following, the first was used:')
+            for d, paths in sorted(self.duplicates.items()):
+                lines.append('    {}: {}'.format(d, ', '.join(paths)))
+        return '\n'.join(lines)
+
+
+def match_discourses(index, discourses):
+    """
+    Match discourse names against the sound files in an index.
+
+    Returns
+    -------
+    :class:`AudioMatch`
+        Matched and missing discourses
+    """
+    paths, duplicates = index.paths()
+    match = AudioMatch()
+    match.scanned = index.scanned
+    match.reused = index.reused
+    for d in sorted(discourses):
+        if d in paths:
+            match.matched[d] = paths[d]
+            if d in duplicates:
+                match.duplicates[d] = duplicates[d]
+        else:
+            match.missing.append(d)
+    return match
+
+
+def register_sound_files(corpus_context, match, call_back = None, stop_check = None):
+    """
+    Add the matched sound files to the corpus, for discourses that have no
+    sound file yet or whose sound file no longer exists.  Discourses are
+    added to ``match.added``.
+
+    Returns
+    -------
+    bool
+        False if stopped
+    """
+    existing = sound_files(corpus_context)
+    to_add = [(d, p) for d, p in sorted(match.matched.items())
+            if d not in existing or existing[d][1] is None or not os.path.exists(existing[d][1])]
+    if call_back is not None:
+        call_back('Adding {} sound files...'.format(len(to_add)))
+        call_back(0, len(to_add))
+    for i, (d, path) in enumerate(to_add):
+        if stop_check is not None and stop_check():
+            return False
+        if d in existing:
+            sound_file = corpus_context.sql_session.query(SoundFile).get(existing[d][0])
+            sound_file.filepath = path
+        else:
+            add_discourse_sound_info(corpus_context, d, path)
+        match.added.append(d)
+        if call_back is not None:
+            call_back(i + 1)
+    return True
@@ -0,0 +1,137 @@
+import time
+import uuid
+import threading
+import traceback
+
+from polyglotdb import CorpusContext
+from polyglotdb.exceptions import (PGError, ConnectionError, NetworkAddressError,
+                                TemporaryConnectionError)
+
+
+class QueryCancelled(PGError):
+    pass
+
+
+def procedure_missing(error):
+    """
+    Whether an error from the server is because a procedure is not
+    available, as on servers older than Neo4j 3.1 for the query
+    management procedures.
+    """
+    code = getattr(error, 'code', None)
+    if code == 'Neo.ClientError.Procedure.ProcedureNotFound':
+        return True
+    return 'ProcedureNotFound' in str(error) or 'no procedure with the name' in str(error)
+
+
+# Errors the server reports for a statement terminated by dbms.killQuery
+TERMINATED_CODES = ['Neo.TransientError.Transaction.Terminated',
+                    'Neo.TransientError.Transaction.LockClientStopped']
+
+
+def is_cancellation(error, query_tag = None):
+    """
+    Whether an error was caused by cancelling, either because the context
+    refused a statement or because the server terminated one of the
+    statements tagged with `query_tag`.  Other errors raised while a
+    cancel was pending are real errors.
+    """
+    if isinstance(error, QueryCancelled):
+        return True
+    code = getattr(error, 'code', None)
+    if code in TERMINATED_CODES:
+        return True
+    message = str(error)
+    if 'TransactionTerminated' in message or any(c in message for c in TERMINATED_CODES):
+        return True
+    return query_tag is not None and query_tag in message
+
+
+class CancellableCorpusContext(CorpusContext):
+    """
+    Corpus context that tags every statement it sends, so that statements
+    still running on the server can be found and terminated from another
+    thread.
+
+    Terminating statements uses the query management procedures of
+    Neo4j 3.1 and later (``dbms.listQueries`` and ``dbms.killQuery``).  On
+    servers without them, cancelling only stops any further statements
+    from being sent.
+    """
+    def __init__(self, *args, **kwargs):
+        super(CancellableCorpusContext, self).__init__(*args, **kwargs)
+        self.query_tag = 'sct-{}'.format(uuid.uuid4().hex)
+        self.cancelled = False
+
+    def execute_cypher(self, statement, **parameters):
+        if self.cancelled:
+            raise(QueryCancelled('The query was cancelled.'))
+        statement = '// {}\n{}'.format(self.query_tag, statement)
+        return super(CancellableCorpusContext, self).execute_cypher(statement, **parameters)
+
+    def running_queries(self):
+        """
+        Ids of the statements of this context running on the server.
+        """
+        # Sent untagged, so that it does not match itself
+        running = CorpusContext.execute_cypher(self, '''CALL dbms.listQueries()
+            YIELD queryId, query RETURN queryId, query''')
+        return [row['queryId'] for row in running if self.query_tag in row['query']]
+
+    def kill_running(self, timeout = 30, interval = 0.1):
+        """
+        Terminate the statements of this context that are running on the
+        server and refuse any further ones.
+
+        Statements are listed again after killing until none are left, as
+        one may have been sent just before the context was cancelled, and
+        killed statements can take a moment to stop.
+
+        Returns
+        -------
+        bool
+            False if the server does not support terminating statements,
+            could not be reached, or still runs statements of this context
+            after `timeout` seconds; other errors are raised
+        """
+        self.cancelled = True
+        killed = set()
+        deadline = time.time() + timeout
+        try:
+            while True:
+                running = self.running_queries()
+                if not running:
+                    break
+                if time.time() > deadline:
+                    return False
+                for query_id in running:
+                    if query_id in killed:
+                        continue
+                    CorpusContext.execute_cypher(self, 'CALL dbms.killQuery({id}) YIELD message RETURN message',
+                                                id = query_id)
+                    killed.add(query_id)
+                time.sleep(interval)
+        except (ConnectionError, NetworkAddressError, TemporaryConnectionError):
+            return False
+        except Exception as e:
+            if procedure_missing(e):
+                return False
+            raise
+        return True
+
+    def cancel(self):
+        """
+        Terminate running statements in a background thread, so that the
+        caller is not blocked by the round trip to the server.  Errors other
+        than the server not supporting it are printed.
+        """
+        def kill():
+            try:
+                self.kill_running()
+            except Exception:
+                traceback.print_exc()
+
+        thread = threading.Thread(target = kill)
+        thread.daemon = True
+        thread.start()
+        return thread
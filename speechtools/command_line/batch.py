@@ -0,0 +1,240 @@
+"""
+Run imports, enrichments, queries and exports from a job file without
+the graphical interface.
+
+Usage::
+
+    sct-batch job.json
+
+See the "Batch jobs" section of the documentation for the job file format.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import multiprocessing
+
+from PyQt5 import QtCore
+
+from polyglotdb.config import CorpusConfig
+
+from speechtools.workers import (ImportCorpusWorker, QueryWorker, ExportQueryWorker,
+                                EnrichmentPipelineWorker, ENRICHMENT_WORKERS, run_worker)
+from speechtools.profiles import QueryProfile, ExportProfile
+
+
+class JobError(Exception):
+    pass
+
+
+class ProgressPrinter(object):
+    """
+    Writes the progress signals of a worker to a stream as lines of text,
+    prefixed by the name of the stage.
+    """
+    def __init__(self, stage, stream = None):
+        self.stage = stage
+        self.stream = stream if stream is not None else sys.stdout
+        self.maximum = 0
+        self.last_percent = None
+
+    def write(self, text):
+        self.stream.write('[{}] {}\n'.format(self.stage, text))
+        self.stream.flush()
+
+    def setText(self, text):
+        self.write(text)
+
+    def setMaximum(self, maximum):
+        self.maximum = maximum
+        self.last_percent = None
+
+    def setProgress(self, value):
+        if not self.maximum:
+            return
+        percent = int(100 * value / self.maximum)
+        if percent == self.last_percent:
+            return
+        self.last_percent = percent
+        self.write('{} of {} ({}%)'.format(value, self.maximum, percent))
+
+
+class BatchRunner(object):
+    """
+    Runs the workers of a job one after another in the calling thread.
+
+    Workers are run with :meth:`QThread.run` rather than ``start``, and
+    their signals are connected directly, so no Qt event loop is needed.
+
+    Parameters
+    ----------
+    job : dict
+        Parsed job file
+    stream : file, optional
+        Stream to write progress to, defaults to stdout
+    """
+    def __init__(self, job, stream = None):
+        if 'corpus' not in job:
+            raise(JobError('The job file must specify a corpus.'))
+        self.job = job
+        self.stream = stream if stream is not None else sys.stdout
+        connection = job.get('connection', {})
+        kwargs = {'graph_host': connection.get('host', 'localhost'),
+                'graph_port': connection.get('port', 7474)}
+        if 'user' in connection:
+            kwargs['graph_user'] = connection['user']
+            kwargs['graph_password'] = connection.get('password', '')
+        self.config = CorpusConfig(job['corpus'], **kwargs)
+        self.current_worker = None
+        self.cancelled = False
+        self.timings = []
+
+    def cancel(self):
+        self.cancelled = True
+        if self.current_worker is not None:
+            self.current_worker.stop()
+
+    def run_worker(self, worker, kwargs, stage):
+        printer = ProgressPrinter(stage, self.stream)
+        direct = QtCore.Qt.DirectConnection
+        worker.updateProgressText.connect(printer.setText, direct)
+        worker.updateMaximum.connect(printer.setMaximum, direct)
+        worker.updateProgress.connect(printer.setProgress, direct)
+        worker.connectionIssues.connect(lambda: printer.write('Having connection issues...'), direct)
+        self.current_worker = worker
+        begin = time.time()
+        try:
+            result, error = run_worker(worker, kwargs)
+        finally:
+            self.current_worker = None
+        elapsed = time.time() - begin
+        self.timings.append((stage, elapsed))
+        if error is not None:
+            raise(JobError('{} failed:\n{}'.format(stage, error)))
+        if worker.stopped:
+            raise(JobError('{} was cancelled.'.format(stage)))
+        printer.write('Finished in {:.1f} seconds.'.format(elapsed))
+        return result
+
+    def run_import(self, options):
+        kwargs = dict(options)
+        if 'directory' not in kwargs:
+            raise(JobError('The import section must specify a directory.'))
+        kwargs['name'] = self.config.corpus_name
+        kwargs['config'] = self.config
+        could_not_parse = self.run_worker(ImportCorpusWorker(), kwargs, 'import')
+        if could_not_parse:
+            printer = ProgressPrinter('import', self.stream)
+            printer.write('{} files could not be parsed:'.format(len(could_not_parse)))
+            for path in could_not_parse:
+                printer.write('    ' + path)
+
+    def run_enrichments(self, enrichments):
+        targets = []
+        force = set()
+        for options in enrichments:
+            kwargs = dict(options)
+            # Some enrichments have a type option of their own
+            try:
+                enrichment = kwargs.pop('enrichment')
+            except KeyError:
+                raise(JobError('Every enrichment must specify which enrichment it is.'))
+            if enrichment not in ENRICHMENT_WORKERS:
+                raise(JobError('Unknown enrichment \'{}\', options are: {}.'.format(enrichment,
+                                        ', '.join(sorted(ENRICHMENT_WORKERS)))))
+            if kwargs.pop('force', False):
+                force.add(enrichment)
+            targets.append((enrichment, kwargs))
+        self.run_worker(EnrichmentPipelineWorker(), {'config': self.config,
+                                        'targets': targets, 'force': force,
+                                        'max_workers': self.job.get('max_parallel_enrichments', 2)},
+                                        'enrichment')
+
+    def run_query(self, options):
+        try:
+            query_profile = QueryProfile.load_profile(options['query_profile'])
+        except KeyError:
+            raise(JobError('Every query must specify a query_profile.'))
+        except FileNotFoundError:
+            raise(JobError('No query profile named \'{}\' was found.'.format(options['query_profile'])))
+        stage = 'query {}'.format(options['query_profile'])
+        if 'path' not in options:
+            query, results = self.run_worker(QueryWorker(), {'config': self.config,
+                                            'profile': query_profile}, stage)
+            if results is not None:
+                ProgressPrinter(stage, self.stream).write('{} results.'.format(len(results)))
+            return
+        if 'export_profile' not in options:
+            raise(JobError('Queries with a path must specify an export_profile.'))
+        try:
+            export_profile = ExportProfile.load_profile(options['export_profile'])
+        except FileNotFoundError:
+            raise(JobError('No export profile named \'{}\' was found.'.format(options['export_profile'])))
+        self.run_worker(ExportQueryWorker(), {'config': self.config,
+                                            'profile': query_profile,
+                                            'export_profile': export_profile,
+                                            'path': options['path']}, stage)
+
+    def run(self):
+        begin = time.time()
+        if 'import' in self.job:
+            self.run_import(self.job['import'])
+        if self.job.get('enrichments') and not self.cancelled:
+            self.run_enrichments(self.job['enrichments'])
+        for query in self.job.get('queries', []):
+            if self.cancelled:
+                break
+            self.run_query(query)
+        self.stream.write('Job finished in {:.1f} seconds.\n'.format(time.time() - begin))
+        for stage, elapsed in self.timings:
+            self.stream.write('    {}: {:.1f} seconds\n'.format(stage, elapsed))
+        self.stream.flush()
+
+
+def load_job(path):
+    with open(path, 'r', encoding = 'utf8') as f:
+        try:
+            job = json.load(f)
+        except ValueError as e:
+            raise(JobError('Could not read the job file {}: {}'.format(path, e)))
+    base = os.path.dirname(os.path.abspath(path))
+    # Relative paths are relative to the job file
+    if 'import' in job and 'directory' in job['import']:
+        job['import']['directory'] = os.path.join(base, os.path.expanduser(job['import']['directory']))
+    for section in ('enrichments', 'queries'):
+        for options in job.get(section, []):
+            if 'path' in options:
+                options['path'] = os.path.join(base, os.path.expanduser(options['path']))
+    return job
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Run a Speech Corpus Tools job file without the graphical interface.')
+    parser.add_argument('job', help = 'Path to a JSON job file')
+    args = parser.parse_args()
+
+    try:
+        runner = BatchRunner(load_job(args.job))
+    except JobError as e:
+        print(e, file = sys.stderr)
+        sys.exit(2)
+
+    def handle_interrupt(signum, frame):
+        if runner.cancelled:
+            raise(KeyboardInterrupt)
+        print('Cancelling, press Ctrl-C again to exit immediately...', file = sys.stderr)
+        runner.cancel()
+
+    signal.signal(signal.SIGINT, handle_interrupt)
+    try:
+        runner.run()
+    except JobError as e:
+        print(e, file = sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
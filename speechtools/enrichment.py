@@ -0,0 +1,426 @@
+import csv
+
+from polyglotdb.exceptions import PGError
+
+
+class EnrichmentCancelled(Exception):
+    pass
+
+
+def chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class PropertyRollback(object):
+    """
+    Remembers the values that properties had before each batch of an
+    enrichment overwrote them, so that a cancelled enrichment can put
+    back exactly the nodes it touched.
+
+    Parameters
+    ----------
+    corpus_context : :class:`~polyglotdb.corpus.CorpusContext`
+        Corpus being enriched
+    node_pattern : str
+        Cypher pattern binding the enriched nodes to ``n``, for instance
+        ``(n:word_type:corpus)``
+    properties : list
+        Names of the properties the enrichment writes
+    """
+    def __init__(self, corpus_context, node_pattern, properties):
+        self.corpus_context = corpus_context
+        self.node_pattern = node_pattern
+        self.properties = list(properties)
+        self.saved = []
+
+    def save(self, match_tail = '', where = 'true', **parameters):
+        """
+        Store the current values for the nodes matched by
+        ``MATCH <node_pattern><match_tail> WHERE <where>``.
+        """
+        values = ', '.join('`{0}`: n.`{0}`'.format(p) for p in self.properties)
+        statement = '''MATCH {}{} WHERE {}
+        RETURN DISTINCT n.id AS id, {{{}}} AS properties'''.format(self.node_pattern,
+                                                    match_tail, where, values)
+        results = self.corpus_context.execute_cypher(statement, **parameters)
+        self.saved.extend({'id': r['id'], 'properties': r['properties']} for r in results)
+
+    def restore(self, batch_size = 1000, call_back = None):
+        statement = '''UNWIND {{rows}} AS row
+        MATCH {} WHERE n.id = row.id
+        SET n += row.properties'''.format(self.node_pattern)
+        if call_back is not None:
+            call_back('Rolling back {} nodes...'.format(len(self.saved)))
+            call_back(0, 0)
+        for rows in chunks(self.saved, batch_size):
+            self.corpus_context.execute_cypher(statement, rows = rows)
+        self.saved = []
+
+
+def check_stop(stop_check):
+    if stop_check is not None and stop_check():
+        raise(EnrichmentCancelled())
+
+
+def encode_class(corpus_context, segments, label, batch_size = 10,
+                call_back = None, stop_check = None):
+    """
+    Encode a class of phones a few labels at a time.
+
+    The class is reset first, so on cancellation resetting it again
+    removes exactly what was written.
+
+    Returns
+    -------
+    bool
+        False if the encoding was cancelled
+    """
+    segments = list(segments)
+    corpus_context.reset_class(label)
+    if call_back is not None:
+        call_back('Encoding {}...'.format(label))
+        call_back(0, len(segments))
+    done = 0
+    try:
+        for chunk in chunks(segments, batch_size):
+            check_stop(stop_check)
+            corpus_context.encode_class(chunk, label)
+            done += len(chunk)
+            if call_back is not None:
+                call_back(done)
+    except EnrichmentCancelled:
+        if call_back is not None:
+            call_back('Resetting {}...'.format(label))
+            call_back(0, 0)
+        corpus_context.reset_class(label)
+        return False
+    return True
+
+
+class EnrichmentFileError(PGError):
+    pass
+
+
+NULL_VALUES = set(['', 'none', 'null', 'na'])
+
+# Property names that enrichment files may not overwrite
+RESERVED_PROPERTIES = set(['id', 'label', 'label_insensitive', 'name', 'begin', 'end'])
+
+
+def sanitize_name(name):
+    return name.strip().replace(' ', '_').lower()
+
+
+def _value_type(value):
+    if value.lower() in ('true', 'false'):
+        return bool
+    try:
+        float(value)
+    except ValueError:
+        return str
+    return float
+
+
+def _convert(value, value_type):
+    if value_type is bool:
+        return value.lower() == 'true'
+    if value_type is float:
+        return float(value)
+    return value
+
+
+class EnrichmentCSV(object):
+    """
+    Enrichment file where the first column is the key (a word, phone or
+    speaker) and every other column is a property.
+
+    The file is read once when created to check that it is well formed
+    and to work out the type of each column: bool if every value is true
+    or false, float if every value is numeric, and str otherwise.  Empty
+    cells and the values none, null and na are left unset.  The rows are
+    then streamed in batches by :meth:`batches`, so the whole file is
+    never held in memory.
+
+    Parameters
+    ----------
+    path : str
+        Path to a comma or tab delimited file
+
+    Raises
+    ------
+    EnrichmentFileError
+        If the file has no header, duplicate or reserved column names,
+        rows without a key, or rows with more cells than the header
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'r', encoding = 'utf-8-sig', newline = '') as f:
+            sample = f.read(65536)
+            if not sample.strip():
+                raise(EnrichmentFileError('The file {} is empty.'.format(path)))
+            try:
+                self.dialect = csv.Sniffer().sniff(sample, delimiters = ',\t')
+            except csv.Error:
+                self.dialect = csv.excel_tab if '\t' in sample else csv.excel
+            f.seek(0)
+            reader = csv.reader(f, self.dialect)
+            header = next(reader)
+            self.key_name = header[0]
+            self.properties = [sanitize_name(x) for x in header[1:]]
+            self._validate_header()
+            candidates = [set([bool, float]) for p in self.properties]
+            self.row_count = 0
+            for row in reader:
+                if not row:
+                    continue
+                line = reader.line_num
+                if len(row) > len(header):
+                    raise(EnrichmentFileError('Line {} of {} has {} columns, but the header has {}.'.format(line, path, len(row), len(header))))
+                if not row[0].strip():
+                    raise(EnrichmentFileError('Line {} of {} has no {}.'.format(line, path, self.key_name)))
+                for i, value in enumerate(row[1:]):
+                    value = value.strip()
+                    if value.lower() in NULL_VALUES:
+                        continue
+                    value_type = _value_type(value)
+                    if value_type is not bool:
+                        candidates[i].discard(bool)
+                    if value_type is not float:
+                        candidates[i].discard(float)
+                self.row_count += 1
+        self.types = {}
+        for p, c in zip(self.properties, candidates):
+            if bool in c and float in c:
+                # Every value was null
+                self.types[p] = str
+            elif bool in c:
+                self.types[p] = bool
+            elif float in c:
+                self.types[p] = float
+            else:
+                self.types[p] = str
+
+    def _validate_header(self):
+        if not self.properties:
+            raise(EnrichmentFileError('The file {} has no property columns.'.format(self.path)))
+        seen = set()
+        for p in self.properties:
+            if not p:
+                raise(EnrichmentFileError('The file {} has a column without a name.'.format(self.path)))
+            if p in RESERVED_PROPERTIES:
+                raise(EnrichmentFileError('The column \'{}\' in {} would overwrite a built-in property, please rename it.'.format(p, self.path)))
+            if p in seen:
+                raise(EnrichmentFileError('The column \'{}\' appears more than once in {}.'.format(p, self.path)))
+            seen.add(p)
+
+    def batches(self, batch_size, case_sensitive = True):
+        """
+        Stream the rows as lists of at most `batch_size` dictionaries with
+        a ``key`` and the typed ``properties`` of the row.
+        """
+        with open(self.path, 'r', encoding = 'utf-8-sig', newline = '') as f:
+            reader = csv.reader(f, self.dialect)
+            next(reader)
+            batch = []
+            for row in reader:
+                if not row:
+                    continue
+                key = row[0].strip()
+                if not case_sensitive:
+                    key = key.lower()
+                properties = {}
+                for p, value in zip(self.properties, row[1:]):
+                    value = value.strip()
+                    if value.lower() in NULL_VALUES:
+                        continue
+                    properties[p] = _convert(value, self.types[p])
+                batch.append({'key': key, 'properties': properties})
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+
+def enrich_from_csv(corpus_context, csv_file, node_pattern, key, description,
+                    batch_size = 500, case_sensitive = True,
+                    call_back = None, stop_check = None):
+    """
+    Set the properties of an :class:`EnrichmentCSV` on the nodes whose
+    `key` property matches the first column, with one UNWIND statement
+    per batch of rows.
+
+    Returns
+    -------
+    bool
+        False if the enrichment was cancelled, in which case the nodes that
+        were written have their previous values restored
+    """
+    rollback = PropertyRollback(corpus_context, node_pattern, csv_file.properties)
+    statement = '''UNWIND {{rows}} AS row
+    MATCH {} WHERE n.{} = row.key
+    SET n += row.properties'''.format(node_pattern, key)
+    total = -(-csv_file.row_count // batch_size)
+    if call_back is not None:
+        call_back('Enriching {}...'.format(description))
+        call_back(0, csv_file.row_count)
+    done = 0
+    try:
+        for i, rows in enumerate(csv_file.batches(batch_size, case_sensitive)):
+            check_stop(stop_check)
+            rollback.save(where = 'n.{} IN {{keys}}'.format(key), keys = [r['key'] for r in rows])
+            corpus_context.execute_cypher(statement, rows = rows)
+            done += len(rows)
+            if call_back is not None:
+                call_back('Enriching {} (batch {} of {})...'.format(description, i + 1, total))
+                call_back(done)
+    except EnrichmentCancelled:
+        rollback.restore(call_back = call_back)
+        return False
+    return True
+
+
+def enrich_lexicon(corpus_context, path, case_sensitive = False, batch_size = 500,
+                call_back = None, stop_check = None):
+    """
+    Add properties from a CSV file to word types in batches.
+
+    Returns
+    -------
+    bool
+        False if the enrichment was cancelled
+    """
+    csv_file = EnrichmentCSV(path)
+    node_pattern = '(n:{}_type:{})'.format(corpus_context.word_name, corpus_context.cypher_safe_name)
+    key = 'label' if case_sensitive else 'label_insensitive'
+    if not enrich_from_csv(corpus_context, csv_file, node_pattern, key, 'lexicon',
+                        batch_size, case_sensitive, call_back, stop_check):
+        return False
+    corpus_context.hierarchy.add_type_properties(corpus_context, corpus_context.word_name,
+                                                csv_file.types.items())
+    corpus_context.encode_hierarchy()
+    return True
+
+
+def enrich_features(corpus_context, path, batch_size = 500,
+                    call_back = None, stop_check = None):
+    """
+    Add phonological features from a CSV file to phone types in batches.
+
+    Returns
+    -------
+    bool
+        False if the enrichment was cancelled
+    """
+    csv_file = EnrichmentCSV(path)
+    node_pattern = '(n:{}_type:{})'.format(corpus_context.phone_name, corpus_context.cypher_safe_name)
+    if not enrich_from_csv(corpus_context, csv_file, node_pattern, 'label',
+                        'phonological inventory', batch_size,
+                        call_back = call_back, stop_check = stop_check):
+        return False
+    corpus_context.hierarchy.add_type_properties(corpus_context, corpus_context.phone_name,
+                                                csv_file.types.items())
+    corpus_context.encode_hierarchy()
+    return True
+
+
+def enrich_speakers(corpus_context, path, batch_size = 500,
+                    call_back = None, stop_check = None):
+    """
+    Add properties from a CSV file to speakers in batches.
+
+    Returns
+    -------
+    bool
+        False if the enrichment was cancelled
+    """
+    csv_file = EnrichmentCSV(path)
+    node_pattern = '(n:Speaker:{})'.format(corpus_context.cypher_safe_name)
+    if not enrich_from_csv(corpus_context, csv_file, node_pattern, 'name', 'speakers',
+                        batch_size, call_back = call_back, stop_check = stop_check):
+        return False
+    corpus_context.hierarchy.add_speaker_properties(corpus_context, csv_file.types.items())
+    corpus_context.encode_hierarchy()
+    return True
+
+
+def hierarchical_target(property_type, higher, lower):
+    """
+    Annotation type a count, rate or position property is stored on:
+    the higher annotations for counts and rates, the lower ones for
+    positions.
+    """
+    if property_type == 'position':
+        return lower
+    return higher
+
+
+def encode_hierarchical_discourse(corpus_context, property_type, higher, lower, name,
+                                discourse, subset = None):
+    """
+    Encode a count, rate or position property for the annotations of a
+    single discourse.
+
+    This builds the same query as polyglotdb's ``encode_count``,
+    ``encode_rate`` and ``encode_position``, restricted to one discourse,
+    so the values match those of the corpus-wide encoders.
+    """
+    if property_type == 'position':
+        lower_annotation = getattr(corpus_context, lower)
+        if subset is not None:
+            lower_annotation = lower_annotation.filter_by_subset(subset)
+        column = getattr(getattr(lower_annotation, higher), lower)
+        if subset is not None:
+            column = column.filter_by_subset(subset)
+        q = corpus_context.query_graph(lower_annotation)
+        q = q.filter(lower_annotation.discourse.name == discourse)
+        q.cache(column.position.column_name(name))
+    else:
+        higher_annotation = getattr(corpus_context, higher)
+        column = getattr(higher_annotation, lower)
+        if subset is not None:
+            column = column.filter_by_subset(subset)
+        q = corpus_context.query_graph(higher_annotation)
+        q = q.filter(higher_annotation.discourse.name == discourse)
+        q.cache(getattr(column, property_type).column_name(name))
+
+
+def encode_hierarchical_property(corpus_context, property_type, higher, lower, name,
+                                subset = None, call_back = None, stop_check = None):
+    """
+    Encode a count, rate or position property one discourse at a time.
+
+    Counts and rates are stored on the higher annotations, positions on
+    the lower ones.
+
+    Returns
+    -------
+    bool
+        False if the encoding was cancelled, in which case the annotations
+        that were written have their previous values restored
+    """
+    corpus = corpus_context.cypher_safe_name
+    target = hierarchical_target(property_type, higher, lower)
+    node_pattern = '(n:`{}`:{}:speech)'.format(target, corpus)
+    rollback = PropertyRollback(corpus_context, node_pattern, [name])
+    discourses = sorted(corpus_context.discourses)
+    if call_back is not None:
+        call_back('Encoding {}...'.format(name))
+        call_back(0, len(discourses))
+    try:
+        for i, discourse in enumerate(discourses):
+            check_stop(stop_check)
+            rollback.save(match_tail = '-[:spoken_in]->(d:Discourse:{})'.format(corpus),
+                        where = 'd.name = {discourse}', discourse = discourse)
+            encode_hierarchical_discourse(corpus_context, property_type, higher, lower,
+                                        name, discourse, subset = subset)
+            if call_back is not None:
+                call_back(i + 1)
+    except EnrichmentCancelled:
+        rollback.restore(call_back = call_back)
+        return False
+    corpus_context.hierarchy.add_token_properties(corpus_context, target, [(name, float)])
+    corpus_context.encode_hierarchy()
+    return True
@@ -0,0 +1,497 @@
+import os
+import json
+import hashlib
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from polyglotdb.config import BASE_DIR
+from polyglotdb.exceptions import ParseError
+from polyglotdb.sql.models import SoundFile, Discourse, Pitch, Formants
+
+JOURNAL_DIR = os.path.join(BASE_DIR, 'import_journals')
+MANIFEST_DIR = os.path.join(BASE_DIR, 'import_manifests')
+
+# Number of discourses added to the temporary CSVs before they are
+# imported into the database and journaled
+FINALIZE_CHUNK_SIZE = 50
+
+# Chunk size of bulk imports, which trade how much an interrupted import
+# redoes for fewer, larger LOAD CSV imports
+BULK_CHUNK_SIZE = 1000
+
+
+def find_files(parser, directory):
+    """
+    Find all files under a directory that a parser can read.
+
+    Parameters
+    ----------
+    parser : :class:`~polyglotdb.io.parsers.base.BaseParser`
+        Parser to match file extensions against
+    directory : str
+        Directory to walk, or a single file
+
+    Returns
+    -------
+    list
+        Sorted list of paths
+    """
+    if not os.path.isdir(directory):
+        return [directory]
+    paths = []
+    for root, subdirs, files in os.walk(directory, followlinks = True):
+        for f in files:
+            if not parser.match_extension(f):
+                continue
+            paths.append(os.path.join(root, f))
+    return sorted(paths)
+
+
+def discourse_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class ImportJournal(object):
+    """
+    Record of the files whose discourses have been fully added to a corpus.
+
+    The journal is an append-only text file, the first line is the source
+    directory and each following line is a committed file path relative to
+    it.  Files are only journaled once their discourses have been imported
+    into the database, and every line is flushed to disk, so an interrupted
+    import can pick up where it stopped.
+
+    Parameters
+    ----------
+    corpus_name : str
+        Name of the corpus being imported
+    """
+    def __init__(self, corpus_name):
+        self.corpus_name = corpus_name
+        self.directory = None
+        self._file = None
+
+    @property
+    def path(self):
+        return os.path.join(JOURNAL_DIR, self.corpus_name.replace(' ', '_') + '.journal')
+
+    def committed(self, directory):
+        """
+        Return the set of committed relative paths for an import of
+        `directory`, or None if there is no journal for that directory.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding = 'utf8') as f:
+            lines = [x.rstrip('\n') for x in f]
+        if not lines or lines[0] != os.path.abspath(directory):
+            return None
+        return set(x for x in lines[1:] if x)
+
+    def begin(self, directory):
+        os.makedirs(JOURNAL_DIR, exist_ok = True)
+        self.directory = os.path.abspath(directory)
+        with open(self.path, 'w', encoding = 'utf8') as f:
+            f.write(self.directory + '\n')
+
+    def resume(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def commit(self, path):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding = 'utf8')
+        self._file.write(os.path.relpath(path, self.directory) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def complete(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _hash_file(path, block_size = 1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_fingerprint(path, previous = None):
+    """
+    Fingerprint a file as (size, mtime, sha1).
+
+    The content hash is only recomputed when the size or modification time
+    differs from `previous`.
+    """
+    st = os.stat(path)
+    if previous is not None and previous[0] == st.st_size and previous[1] == st.st_mtime:
+        return tuple(previous)
+    return (st.st_size, st.st_mtime, _hash_file(path))
+
+
+def diff_fingerprints(old, new):
+    """
+    Compare two mappings of relative path to fingerprint.
+
+    Returns
+    -------
+    tuple
+        Sorted lists of added, changed and removed relative paths
+    """
+    added = sorted(x for x in new if x not in old)
+    removed = sorted(x for x in old if x not in new)
+    changed = sorted(x for x in new if x in old and new[x][2] != old[x][2])
+    return added, changed, removed
+
+
+class ImportManifest(object):
+    """
+    Fingerprints of the source files of an imported corpus, used to work
+    out which discourses need reloading on the next sync.
+
+    Parameters
+    ----------
+    corpus_name : str
+        Name of the imported corpus
+    """
+    def __init__(self, corpus_name):
+        self.corpus_name = corpus_name
+
+    @property
+    def path(self):
+        return os.path.join(MANIFEST_DIR, self.corpus_name.replace(' ', '_') + '.json')
+
+    def load(self, directory):
+        """
+        Return the fingerprints recorded for `directory`, or None if the
+        corpus has no manifest for it.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding = 'utf8') as f:
+            manifest = json.load(f)
+        if manifest['directory'] != os.path.abspath(directory):
+            return None
+        return {k: tuple(v) for k, v in manifest['files'].items()}
+
+    def save(self, directory, fingerprints):
+        os.makedirs(MANIFEST_DIR, exist_ok = True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding = 'utf8') as f:
+            json.dump({'directory': os.path.abspath(directory),
+                        'files': fingerprints}, f)
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def fingerprint_directory(parser, directory, previous = None, stop_check = None):
+    """
+    Fingerprint every file under `directory` that `parser` can read,
+    keyed by path relative to `directory`.
+    """
+    if previous is None:
+        previous = {}
+    fingerprints = {}
+    for path in find_files(parser, directory):
+        if stop_check is not None and stop_check():
+            return None
+        rel = os.path.relpath(path, directory)
+        fingerprints[rel] = file_fingerprint(path, previous.get(rel))
+    return fingerprints
+
+
+def _parse(parser, path):
+    try:
+        return path, parser.parse_discourse(path), None
+    except ParseError as e:
+        return path, None, str(e)
+
+
+def parse_in_order(parser, paths, num_processes = None, stop_check = None):
+    """
+    Parse files on a process pool, yielding results in the order of `paths`.
+
+    Only a small window of files (twice the number of processes) is parsed
+    ahead of the consumer, so memory use does not grow with corpus size
+    when the database is slower than the parsers.
+
+    Parameters
+    ----------
+    parser : :class:`~polyglotdb.io.parsers.base.BaseParser`
+        Parser to use, it is pickled to each process
+    paths : list
+        Paths to parse
+    num_processes : int, optional
+        Number of parsing processes, defaults to the number of CPUs
+    stop_check : callable, optional
+        Returns True when parsing should stop
+
+    Yields
+    ------
+    tuple
+        (path, DiscourseData or None, error message or None)
+    """
+    if num_processes is None:
+        num_processes = multiprocessing.cpu_count()
+    # Callbacks are usually bound to a QThread and cannot be pickled
+    call_back, parser.call_back = parser.call_back, None
+    parser_stop_check, parser.stop_check = parser.stop_check, None
+    try:
+        if num_processes <= 1:
+            for path in paths:
+                if stop_check is not None and stop_check():
+                    return
+                yield _parse(parser, path)
+            return
+        remaining = iter(paths)
+        with ProcessPoolExecutor(max_workers = num_processes) as executor:
+            pending = deque(executor.submit(_parse, parser, path)
+                            for path in itertools.islice(remaining, num_processes * 2))
+            while pending:
+                if stop_check is not None and stop_check():
+                    for f in pending:
+                        f.cancel()
+                    return
+                result = pending.popleft().result()
+                path = next(remaining, None)
+                if path is not None:
+                    pending.append(executor.submit(_parse, parser, path))
+                yield result
+    finally:
+        parser.call_back = call_back
+        parser.stop_check = parser_stop_check
+
+
+def merge_hierarchy_properties(target, source):
+    for attr in ('type_properties', 'token_properties'):
+        t = getattr(target, attr, None)
+        s = getattr(source, attr, None)
+        if t is None or s is None:
+            continue
+        for k, v in s.items():
+            t.setdefault(k, set()).update(v)
+
+
+def remove_discourse(corpus_context, name):
+    """
+    Remove everything a discourse added to a corpus: its annotations, its
+    Discourse node and speaker relationships, speakers left without any
+    discourse, and its sound file and acoustic track rows.
+
+    ``CorpusContext.remove_discourse`` only deletes annotations, so adding
+    the discourse again would fail because it still appears to exist.
+    """
+    corpus = corpus_context.cypher_safe_name
+    corpus_context.execute_cypher('''MATCH (n:{corpus}:`{name}`)
+    DETACH DELETE n'''.format(corpus = corpus, name = name))
+    corpus_context.execute_cypher('''MATCH (d:Discourse:{corpus})
+    WHERE d.name = {{discourse}}
+    DETACH DELETE d'''.format(corpus = corpus), discourse = name)
+    corpus_context.execute_cypher('''MATCH (s:Speaker:{corpus})
+    WHERE NOT (s)-[:speaks_in]->()
+    DETACH DELETE s'''.format(corpus = corpus))
+
+    session = corpus_context.sql_session
+    sound_files = session.query(SoundFile).join(Discourse).filter(Discourse.name == name).all()
+    for sound_file in sound_files:
+        for model in (Pitch, Formants):
+            session.query(model).filter(model.sound_file_id == sound_file.id).delete()
+        session.delete(sound_file)
+    session.query(Discourse).filter(Discourse.name == name).delete()
+    session.commit()
+
+
+def remove_partial_discourses(corpus_context, committed_names, call_back = None):
+    """
+    Remove discourses that are in the database but were never journaled
+    as committed, i.e. the ones that were being added when an import was
+    interrupted.
+    """
+    for name in corpus_context.discourses:
+        if name in committed_names:
+            continue
+        if call_back is not None:
+            call_back('Removing partially imported discourse {}...'.format(name))
+        remove_discourse(corpus_context, name)
+
+
+def clear_staged_csvs(corpus_context):
+    """
+    Remove the temporary CSVs that discourses are added to before
+    ``finalize_import`` loads them, so rows are never imported twice and
+    rows left by an interrupted import are not imported at all.
+    """
+    directory = corpus_context.config.temporary_directory('csv')
+    if not os.path.exists(directory):
+        return
+    for f in os.listdir(directory):
+        if f.endswith('.csv'):
+            os.remove(os.path.join(directory, f))
+
+
+def load_parallel(corpus_context, parser, directory, num_processes = None,
+                call_back = None, stop_check = None, journal = None, skip = None,
+                chunk_size = FINALIZE_CHUNK_SIZE):
+    """
+    Import a directory with parsing spread over a process pool.
+
+    Discourses are added to the database one at a time in file order, so
+    writes stay serialized while parsing scales with the number of CPUs.
+    Added discourses are imported into the database every `chunk_size`
+    discourses, and only then recorded in the journal.
+
+    Parameters
+    ----------
+    corpus_context : :class:`~polyglotdb.corpus.CorpusContext`
+        Corpus to load into
+    parser : :class:`~polyglotdb.io.parsers.base.BaseParser`
+        Parser for the corpus format
+    directory : str
+        Directory containing the corpus files
+    num_processes : int, optional
+        Number of parsing processes, defaults to the number of CPUs
+    call_back : callable, optional
+        Progress callback
+    stop_check : callable, optional
+        Returns True when the import should stop
+    journal : :class:`ImportJournal`, optional
+        Journal to record each committed file in
+    skip : set, optional
+        Paths relative to `directory` that are already imported
+    chunk_size : int, optional
+        Number of discourses to import into the database at once
+
+    Returns
+    -------
+    list
+        Paths of files that could not be parsed
+    """
+    paths = find_files(parser, directory)
+    if not paths:
+        raise(ParseError('No files in the specified directory could be read by the parser.'))
+    if skip:
+        paths = [x for x in paths if os.path.relpath(x, directory) not in skip]
+    if call_back is not None:
+        call_back('Importing discourses...')
+        call_back(0, len(paths))
+    could_not_parse = []
+    data = None
+    added = []
+
+    def finalize():
+        corpus_context.finalize_import(data, call_back, stop_check)
+        if stop_check is not None and stop_check():
+            # The import into the database may have been cut short
+            return False
+        clear_staged_csvs(corpus_context)
+        if journal is not None:
+            for path in added:
+                journal.commit(path)
+        del added[:]
+        return True
+
+    clear_staged_csvs(corpus_context)
+    for i, (path, parsed, error) in enumerate(parse_in_order(parser, paths,
+                                        num_processes, stop_check)):
+        if stop_check is not None and stop_check():
+            return could_not_parse
+        if call_back is not None:
+            call_back('Importing {} ({} of {})...'.format(os.path.basename(path), i + 1, len(paths)))
+            call_back(i)
+        if parsed is None:
+            could_not_parse.append(path)
+            continue
+        corpus_context.add_discourse(parsed)
+        added.append(path)
+        if data is not None:
+            merge_hierarchy_properties(parsed.hierarchy, data.hierarchy)
+        data = parsed
+        if len(added) >= chunk_size and not finalize():
+            return could_not_parse
+    if added:
+        finalize()
+    return could_not_parse
+
+
+def sync_directory(corpus_context, parser, directory, manifest, num_processes = None,
+                call_back = None, stop_check = None):
+    """
+    Bring an imported corpus up to date with its source directory.
+
+    Discourses whose files were added or whose contents changed are
+    (re)loaded and discourses whose files disappeared are removed, the
+    rest of the corpus is left untouched.  If the corpus has no manifest
+    yet, every discourse already in the database with a matching file is
+    taken to be current.
+
+    Parameters
+    ----------
+    corpus_context : :class:`~polyglotdb.corpus.CorpusContext`
+        Corpus to update
+    parser : :class:`~polyglotdb.io.parsers.base.BaseParser`
+        Parser for the corpus format
+    directory : str
+        Directory containing the corpus files
+    manifest : :class:`ImportManifest`
+        Manifest of the corpus, updated when the sync finishes
+    num_processes : int, optional
+        Number of parsing processes, defaults to the number of CPUs
+    call_back : callable, optional
+        Progress callback
+    stop_check : callable, optional
+        Returns True when the sync should stop
+
+    Returns
+    -------
+    list
+        Paths of files that could not be parsed
+    """
+    if call_back is not None:
+        call_back('Checking for changed files...')
+    old = manifest.load(directory)
+    fingerprints = fingerprint_directory(parser, directory, old, stop_check)
+    if fingerprints is None:
+        return []
+    if old is None:
+        existing = set(corpus_context.discourses)
+        old = {k: v for k, v in fingerprints.items() if discourse_name(k) in existing}
+        current = set(discourse_name(x) for x in fingerprints)
+        vanished = sorted(x for x in existing if x not in current)
+    else:
+        vanished = []
+    added, changed, removed = diff_fingerprints(old, fingerprints)
+    to_remove = [discourse_name(x) for x in changed + removed] + vanished
+    for name in to_remove:
+        if stop_check is not None and stop_check():
+            return []
+        if call_back is not None:
+            call_back('Removing discourse {}...'.format(name))
+        remove_discourse(corpus_context, name)
+    could_not_parse = []
+    to_load = set(added + changed)
+    if to_load:
+        skip = set(x for x in fingerprints if x not in to_load)
+        could_not_parse = load_parallel(corpus_context, parser, directory, num_processes,
+                                        call_back = call_back, stop_check = stop_check,
+                                        skip = skip)
+    if stop_check is not None and stop_check():
+        return could_not_parse
+    for path in could_not_parse:
+        fingerprints.pop(os.path.relpath(path, directory), None)
+    manifest.save(directory, fingerprints)
+    if call_back is not None:
+        call_back('{} added, {} changed, {} removed.'.format(len(added), len(changed),
+                                                        len(removed) + len(vanished)))
+    return could_not_parse
@@ -16,6 +16,7 @@ from .widgets import (ViewWidget, HelpWidget, DiscourseWidget, QueryWidget, Coll
                         DetailsWidget, ConnectWidget, AcousticDetailsWidget, DetailedMessageBox,
                         CollapsibleTabWidget)
 from .widgets.help import ExportHelpWidget
+from .widgets.query.main import LargeResultsDialog
 
 from .widgets.enrich import (EncodePauseDialog, EncodeUtteranceDialog,
                             EncodeSpeechRateDialog, EncodeUtterancePositionDialog,
@@ -34,8 +35,9 @@ from .workers import (AcousticAnalysisWorker, ImportCorpusWorker,
                     SyllabicEncodingWorker, PhoneSubsetEncodingWorker,
                     SyllableEncodingWorker, LexiconEnrichmentWorker,
                     FeatureEnrichmentWorker, HierarchicalPropertiesWorker,
-                    QueryWorker, ExportQueryWorker, RelativizedMeasuresWorker,
-                     SpeakerEnrichmentWorker, StressEncodingWorker)
+                    QueryWorker, QueryCountWorker, AggregateQueryWorker, ExportQueryWorker, RelativizedMeasuresWorker,
+                     SpeakerEnrichmentWorker, StressEncodingWorker,
+                    RESULTS_PAGE_SIZE, LARGE_RESULT_COUNT)
 
 sct_config_pickle_path = os.path.join(BASE_DIR, 'config')
 
@@ -180,13 +182,29 @@ class MainWindow(QtWidgets.QMainWindow):
             self.rightPane.connectWidget.connectToServer(ignore=True)
 
 
+        self.countWorker = QueryCountWorker()
+        self.countWorker.dataReady.connect(self.checkQueryCount)
+        self.countWorker.errorEncountered.connect(self.showError)
+        self.countWorker.errorEncountered.connect(self.leftPane.queryWidget.queryForm.finishQuery)
+        self.countWorker.finishedCancelling.connect(self.leftPane.queryWidget.queryForm.finishQuery)
+
         self.queryWorker = QueryWorker()
+        self.queryWorker.pageReady.connect(self.leftPane.queryWidget.updateResults)
         self.queryWorker.dataReady.connect(self.leftPane.queryWidget.updateResults)
         self.queryWorker.errorEncountered.connect(self.showError)
+        self.queryWorker.errorEncountered.connect(self.leftPane.queryWidget.cancelResults)
         self.queryWorker.errorEncountered.connect(self.leftPane.queryWidget.queryForm.finishQuery)
         self.queryWorker.dataReady.connect(self.leftPane.queryWidget.queryForm.finishQuery)
+        self.queryWorker.finishedCancelling.connect(self.leftPane.queryWidget.cancelResults)
         self.queryWorker.finishedCancelling.connect(self.leftPane.queryWidget.queryForm.finishQuery)
 
+        self.aggregateWorker = AggregateQueryWorker()
+        self.aggregateWorker.dataReady.connect(self.leftPane.queryWidget.updateAggregateResults)
+        self.aggregateWorker.errorEncountered.connect(self.showError)
+        self.aggregateWorker.errorEncountered.connect(self.leftPane.queryWidget.queryForm.finishQuery)
+        self.aggregateWorker.dataReady.connect(self.leftPane.queryWidget.queryForm.finishQuery)
+        self.aggregateWorker.finishedCancelling.connect(self.leftPane.queryWidget.queryForm.finishQuery)
+
         self.exportWorker = ExportQueryWorker()
         self.exportWorker.errorEncountered.connect(self.showError)
         self.exportWorker.errorEncountered.connect(self.leftPane.queryWidget.queryForm.finishExport)
@@ -254,6 +272,7 @@ class MainWindow(QtWidgets.QMainWindow):
         
         self.rightPane.connectWidget.corporaList.cancelImporter.connect(self.importWorker.stop)
         self.rightPane.connectWidget.corporaList.corpusToImport.connect(self.importCorpus)
+        self.rightPane.connectWidget.corporaList.corpusToSync.connect(self.syncCorpus)
         self.progressWidget = ProgressWidget(self)
 
     def exportQuery(self, query_profile, export_profile, path):
@@ -273,6 +292,46 @@ class MainWindow(QtWidgets.QMainWindow):
         kwargs['config'] = self.corpusConfig
         kwargs['profile'] = query_profile
 
+        if query_profile.is_aggregation:
+            self.aggregateWorker.setParams(kwargs)
+            self.progressWidget.createProgressBar('aggregate query', self.aggregateWorker)
+            self.progressWidget.show()
+            self.aggregateWorker.start()
+            return
+
+        # Count the results first, so that the size of the query is known
+        # before any rows are loaded
+        self.countWorker.setParams(kwargs)
+        self.progressWidget.createProgressBar('count query', self.countWorker)
+        self.progressWidget.show()
+        self.countWorker.start()
+
+    def checkQueryCount(self, results):
+        query_profile, count = results
+        queryForm = self.leftPane.queryWidget.queryForm
+        queryForm.showCount(count, query_profile.is_sample)
+        kwargs = {}
+        kwargs['config'] = self.corpusConfig
+        kwargs['profile'] = query_profile
+        kwargs['count'] = count
+        if count > LARGE_RESULT_COUNT and not query_profile.is_sample:
+            dialog = LargeResultsDialog(count, self)
+            dialog.exec_()
+            if dialog.choice == 'first':
+                kwargs['limit'] = RESULTS_PAGE_SIZE
+            elif dialog.choice == 'sample':
+                queryForm.suggestSample()
+                return
+            elif dialog.choice == 'export':
+                queryForm.finishQuery()
+                queryForm.exportQuery('new')
+                return
+            elif dialog.choice == 'aggregate':
+                queryForm.suggestAggregation()
+                return
+            elif dialog.choice != 'all':
+                queryForm.finishQuery()
+                return
         self.queryWorker.setParams(kwargs)
         self.progressWidget.createProgressBar('query', self.queryWorker)
         self.progressWidget.show()
@@ -637,23 +696,26 @@ class MainWindow(QtWidgets.QMainWindow):
     def analyzeAcoustics(self):
         dialog = AnalyzeAcousticsDialog(self.corpusConfig, self)
         if dialog.exec_() == QtWidgets.QDialog.Accepted:
-            acoustics = dialog.value()
-            kwargs = {'config': self.corpusConfig,
-                    'acoustics': acoustics}
+            kwargs = dialog.value()
+            kwargs['config'] = self.corpusConfig
             self.acousticWorker.setParams(kwargs)
             self.progressWidget.createProgressBar('acoustic', self.acousticWorker)
             self.progressWidget.show()
             self.acousticWorker.start()
 
-    def importCorpus(self, name, directory):
+    def importCorpus(self, name, directory, incremental = False):
         kwargs = {'name': name,
-                'directory': directory}
+                'directory': directory,
+                'incremental': incremental}
         self.importWorker.setParams(kwargs)
         self.progressWidget.createProgressBar('import', self.importWorker)
         self.progressWidget.show()
         self.importWorker.start()
         self.updateStatus()
 
+    def syncCorpus(self, name, directory):
+        self.importCorpus(name, directory, incremental = True)
+
     def encodeStress(self):
        
         dialog = EncodeStressDialog(self.corpusConfig, self)
@@ -18,15 +18,27 @@ def make_safe(data):
 class QueryResultsModel(QtCore.QAbstractTableModel):
     SortRole = 999
     def __init__(self, results, parent = None):
-        if len(results) > 0:
-            self.columns = [x for x in results[0].properties if x not in ['id']] + ['discourse', 'speaker']
-        else:
-            self.columns = ['label', 'begin', 'end', 'discourse', 'speaker']
+        self.columns = self.resultColumns(results)
         self.rows = results
         QtCore.QAbstractTableModel.__init__(self, parent)
 
         self.destroyed.connect(self.reset)
 
+    def resultColumns(self, results):
+        if len(results) > 0:
+            return [x for x in results[0].properties if x not in ['id']] + ['discourse', 'speaker']
+        return ['label', 'begin', 'end', 'discourse', 'speaker']
+
+    def setResults(self, results):
+        """
+        Replace the rows shown, such as when the full results of a query
+        arrive after its first page.
+        """
+        self.beginResetModel()
+        self.columns = self.resultColumns(results)
+        self.rows = results
+        self.endResetModel()
+
     def rowCount(self, parent = None):
         return len(self.rows)
 
@@ -106,6 +118,38 @@ class QueryResultsModel(QtCore.QAbstractTableModel):
             return data
         return None
 
+class AggregateResultsModel(QtCore.QAbstractTableModel):
+    SortRole = 999
+    def __init__(self, header, rows, parent = None):
+        self.columns = header
+        self.rows = rows
+        QtCore.QAbstractTableModel.__init__(self, parent)
+
+    def rowCount(self, parent = None):
+        return len(self.rows)
+
+    def columnCount(self, parent = None):
+        return len(self.columns)
+
+    def headerData(self, col, orientation, role):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.columns[col]
+        if orientation == QtCore.Qt.Vertical and role == QtCore.Qt.DisplayRole:
+            return col
+        return None
+
+    def data(self, index, role = None):
+        if not index.isValid():
+            return None
+        data = self.rows[index.row()][index.column()]
+        if role == QtCore.Qt.DisplayRole:
+            if data is None:
+                return ''
+            return make_safe(data)
+        elif role == self.SortRole:
+            return data
+        return None
+
 class ProxyModel(QtCore.QSortFilterProxyModel):
     # Adapted from http://stackoverflow.com/questions/15111965/qsortfilterproxymodel-and-row-numbers
     def headerData(self, section, orientation, role):
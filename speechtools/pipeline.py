@@ -0,0 +1,311 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .utterances import (stale_discourses, utterance_parameters, speech_rate_parameters,
+                        position_parameters, UTTERANCE_STATE, SPEECH_RATE_STATE,
+                        POSITION_STATE)
+
+
+class PipelineError(Exception):
+    pass
+
+
+class Stage(object):
+    """
+    Description of an enrichment for the pipeline.
+
+    Parameters
+    ----------
+    name : str
+        Name of the enrichment, a key of ``ENRICHMENT_WORKERS``
+    prerequisites : list or callable
+        Names of enrichments that have to be encoded first, or a function
+        of the enrichment options returning them
+    is_encoded : callable, optional
+        Function of a corpus context and the enrichment options that
+        returns True if the enrichment is already encoded.  Enrichments
+        without one are always run.
+    writes_hierarchy : bool
+        Whether the enrichment saves the corpus hierarchy.  Each save
+        replaces the whole hierarchy, so two of these cannot run at the
+        same time without losing one's changes.
+    """
+    def __init__(self, name, prerequisites = None, is_encoded = None,
+                writes_hierarchy = True):
+        self.name = name
+        self.writes_hierarchy = writes_hierarchy
+        self._prerequisites = prerequisites if prerequisites is not None else []
+        self._is_encoded = is_encoded
+
+    def prerequisites(self, kwargs):
+        if callable(self._prerequisites):
+            return self._prerequisites(kwargs)
+        return list(self._prerequisites)
+
+    @property
+    def checkable(self):
+        return self._is_encoded is not None
+
+    def is_encoded(self, corpus_context, kwargs):
+        if self._is_encoded is None:
+            return False
+        return self._is_encoded(corpus_context, kwargs)
+
+
+def _speech_rate_prerequisites(kwargs):
+    prerequisites = ['utterances']
+    if kwargs.get('to_count') == 'syllable':
+        prerequisites.append('syllables')
+    elif kwargs.get('to_count') == 'syllabic':
+        prerequisites.append('syllabics')
+    return prerequisites
+
+
+def _utterances_encoded(corpus_context, kwargs):
+    if 'utterance' not in corpus_context.hierarchy.annotation_types:
+        return False
+    if 'min_pause_length' not in kwargs:
+        return True
+    parameters = utterance_parameters(kwargs['min_pause_length'], kwargs['min_utterance_length'])
+    return not stale_discourses(corpus_context, UTTERANCE_STATE, parameters)
+
+
+def _speech_rate_encoded(corpus_context, kwargs):
+    if not corpus_context.hierarchy.has_token_property('utterance', 'speech_rate'):
+        return False
+    if 'to_count' not in kwargs:
+        return True
+    parameters = speech_rate_parameters(kwargs['to_count'])
+    return not stale_discourses(corpus_context, SPEECH_RATE_STATE, parameters)
+
+
+def _utterance_position_encoded(corpus_context, kwargs):
+    if not corpus_context.hierarchy.has_token_property(corpus_context.word_name, 'position_in_utterance'):
+        return False
+    return not stale_discourses(corpus_context, POSITION_STATE, position_parameters())
+
+
+# Utterance encodings count as encoded only if every discourse is up to
+# date with the requested options, as they are recomputed incrementally
+STAGES = {x.name: x for x in [
+    Stage('pauses',
+        is_encoded = lambda c, kw: c.hierarchy.has_token_subset(c.word_name, 'pause')),
+    Stage('utterances', ['pauses'], is_encoded = _utterances_encoded),
+    Stage('speech_rate', _speech_rate_prerequisites, is_encoded = _speech_rate_encoded),
+    Stage('utterance_position', ['utterances'], is_encoded = _utterance_position_encoded),
+    Stage('syllabics',
+        is_encoded = lambda c, kw: c.hierarchy.has_type_subset(c.phone_name, 'syllabic')),
+    Stage('syllables', ['syllabics'],
+        is_encoded = lambda c, kw: 'syllable' in c.hierarchy.annotation_types),
+    Stage('stress', ['syllables']),
+    Stage('phone_subset',
+        is_encoded = lambda c, kw: c.hierarchy.has_type_subset(c.phone_name, kw['label'])),
+    Stage('hierarchical',
+        is_encoded = lambda c, kw: c.hierarchy.has_token_property(kw['higher'], kw['name'])),
+    Stage('lexicon'),
+    Stage('features'),
+    Stage('speakers'),
+    Stage('relativized'),
+    Stage('acoustics', writes_hierarchy = False),
+    ]}
+
+
+class EnrichmentPlan(object):
+    """
+    Ordered set of enrichments to run, with the dependencies between them.
+
+    Attributes
+    ----------
+    steps : dict
+        (enrichment name, options) of each planned step, keyed by step id.
+        The step id is the enrichment name, suffixed with a number when
+        the same enrichment is requested more than once.
+    order : list
+        Step ids in a valid running order
+    dependencies : dict
+        Step ids each step waits for
+    skipped : list
+        Step ids of requested enrichments that are already encoded
+    """
+    def __init__(self, steps, order, dependencies, skipped):
+        self.steps = steps
+        self.order = order
+        self.dependencies = dependencies
+        self.skipped = skipped
+
+
+def plan_enrichments(corpus_context, targets, force = None):
+    """
+    Work out which enrichments to run and in what order.
+
+    Parameters
+    ----------
+    corpus_context : :class:`~polyglotdb.corpus.CorpusContext`
+        Corpus to plan for
+    targets : list
+        (enrichment name, options) pairs for each requested enrichment
+    force : collection, optional
+        Names of enrichments to run even if already encoded
+
+    Returns
+    -------
+    :class:`EnrichmentPlan`
+        The plan
+    """
+    if force is None:
+        force = set()
+    counts = {}
+    for name, kwargs in targets:
+        if name not in STAGES:
+            raise(PipelineError('Unknown enrichment \'{}\'.'.format(name)))
+        counts[name] = counts.get(name, 0) + 1
+    steps = {}
+    skipped = []
+    planned_by_name = {}
+    skipped_names = set()
+    seen = {}
+    for name, kwargs in targets:
+        seen[name] = seen.get(name, 0) + 1
+        step = name if counts[name] == 1 else '{}:{}'.format(name, seen[name])
+        if name not in force and STAGES[name].is_encoded(corpus_context, kwargs):
+            skipped.append(step)
+            skipped_names.add(name)
+        else:
+            steps[step] = (name, kwargs)
+            planned_by_name.setdefault(name, []).append(step)
+    dependencies = {}
+    for step, (name, kwargs) in steps.items():
+        dependencies[step] = []
+        for p in STAGES[name].prerequisites(kwargs):
+            if p in planned_by_name:
+                dependencies[step].extend(planned_by_name[p])
+            elif p in skipped_names:
+                continue
+            elif not STAGES[p].is_encoded(corpus_context, {}):
+                raise(PipelineError('{} requires {} to be encoded first, please add it to the enrichments.'.format(name, p)))
+
+    order = []
+    remaining = sorted(steps)
+    while remaining:
+        ready = [x for x in remaining if all(d in order for d in dependencies[x])]
+        if not ready:
+            raise(PipelineError('The enrichments {} depend on each other.'.format(', '.join(remaining))))
+        order.extend(ready)
+        remaining = [x for x in remaining if x not in ready]
+    return EnrichmentPlan(steps, order, dependencies, skipped)
+
+
+def writes_hierarchy(plan, step):
+    return STAGES[plan.steps[step][0]].writes_hierarchy
+
+
+def run_plan(plan, run_stage, max_workers = 2, stop_check = None, call_back = None):
+    """
+    Run the enrichments of a plan, starting each one as soon as the ones
+    it depends on have finished.  Only one enrichment that saves the
+    corpus hierarchy runs at a time, others can run alongside it.
+
+    Parameters
+    ----------
+    plan : :class:`EnrichmentPlan`
+        Plan to run
+    run_stage : callable
+        Function taking a step id that runs it to completion and raises
+        an exception on failure
+    max_workers : int
+        Maximum number of enrichments to run at the same time.  Only
+        acoustics does not save the hierarchy, so with the current stages
+        at most two enrichments overlap and larger values have no effect
+    stop_check : callable, optional
+        Returns True when no further enrichments should be started
+    call_back : callable, optional
+        Progress callback
+
+    Returns
+    -------
+    dict
+        (start, end) times of each step that ran
+    """
+    timings = {}
+    done = set()
+    pending = list(plan.order)
+    running = {}
+    if call_back is not None:
+        call_back(0, len(plan.order))
+
+    def timed(name):
+        begin = time.time()
+        run_stage(name)
+        return begin, time.time()
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        while pending or running:
+            if stop_check is None or not stop_check():
+                ready = [x for x in pending if all(d in done for d in plan.dependencies[x])]
+                writing = any(writes_hierarchy(plan, x) for x in running.values())
+                for name in ready:
+                    if len(running) >= max_workers:
+                        break
+                    if writes_hierarchy(plan, name):
+                        if writing:
+                            continue
+                        writing = True
+                    if call_back is not None:
+                        call_back('Starting {}...'.format(name.replace('_', ' ')))
+                    running[executor.submit(timed, name)] = name
+                    pending.remove(name)
+            if not running:
+                break
+            finished, _ = wait(list(running), return_when = FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                # Re-raises the failure, the executor waits for the others
+                timings[name] = future.result()
+                done.add(name)
+                if call_back is not None:
+                    call_back(len(done))
+    return timings
+
+
+def critical_path(plan, timings):
+    """
+    Find the chain of dependent enrichments with the longest total
+    running time, which bounds how fast the pipeline can finish.
+
+    Returns
+    -------
+    tuple
+        List of enrichment names along the path and its total duration
+    """
+    best = {}
+    for name in plan.order:
+        if name not in timings:
+            continue
+        duration = timings[name][1] - timings[name][0]
+        previous = [best[d] for d in plan.dependencies[name] if d in best]
+        if previous:
+            path, length = max(previous, key = lambda x: x[1])
+        else:
+            path, length = [], 0
+        best[name] = (path + [name], length + duration)
+    if not best:
+        return [], 0
+    return max(best.values(), key = lambda x: x[1])
+
+
+def timing_report(plan, timings, wall_time):
+    """
+    Text summary of how long a pipeline took and where the time went.
+    """
+    path, length = critical_path(plan, timings)
+    total = sum(end - begin for begin, end in timings.values())
+    lines = ['Enrichments finished in {:.1f} seconds ({:.1f} seconds of enrichment).'.format(wall_time, total)]
+    for name in plan.order:
+        if name in timings:
+            begin, end = timings[name]
+            lines.append('    {}: {:.1f} seconds'.format(name, end - begin))
+    if plan.skipped:
+        lines.append('Already encoded: {}'.format(', '.join(plan.skipped)))
+    if path:
+        lines.append('Critical path: {} ({:.1f} seconds)'.format(' -> '.join(path), length))
+    return '\n'.join(lines)
@@ -1,8 +1,124 @@
+from itertools import chain
+
 import numpy as np
 
 max_sig = 1
 min_sig = -1
 
+# Samples per envelope column of each cached level of detail of a waveform
+WAVEFORM_LEVEL_FACTORS = (16, 128, 1024, 8192)
+
+def get_waveform_levels(data, factors = WAVEFORM_LEVEL_FACTORS):
+    """
+    Envelopes of a waveform at each level of detail in `factors`, skipping
+    levels with fewer than two columns
+
+    Returns
+    -------
+    dict
+        Vertices and faces of the envelope for each factor
+    """
+    levels = {}
+    for f in factors:
+        num_bins = data.shape[0] // f
+        if num_bins < 2:
+            continue
+        levels[f] = get_envelope_mesh_data(data, num_bins)
+    return levels
+
+def waveform_level(samples_per_pixel, factors, available, envelope_threshold = 3):
+    """
+    Index into `factors` of the coarsest cached level of detail with at
+    least two samples per envelope column at the current zoom, or -1 to
+    draw the exact polyline
+
+    Parameters
+    ----------
+    samples_per_pixel : float
+        Samples of the signal shown per pixel
+    factors : sequence
+        Samples per envelope column of each level, in increasing order
+    available : sequence
+        Whether each level was computed
+    envelope_threshold : float
+        Samples per pixel below which the exact polyline is drawn
+    """
+    chosen = -1
+    if samples_per_pixel > envelope_threshold:
+        for i, f in enumerate(factors):
+            if available[i] and f * 2 <= samples_per_pixel:
+                chosen = i
+    return chosen
+
+def range_amplitude(points, begin, end):
+    """
+    Maximum absolute amplitude of the (time, amplitude) `points` between
+    `begin` and `end`, or 0 if there are none
+    """
+    low, high = np.searchsorted(points[:, 0], [begin, end])
+    if high <= low:
+        return 0
+    return np.abs(points[low:high, 1]).max()
+
+def amplitude_scale(max_sig):
+    """
+    Vertical scale that brings quiet signals up to half the plot height
+    """
+    if 0 < max_sig < 0.5:
+        return 0.5 / max_sig
+    return 1
+
+class DurationTable(object):
+    """
+    Columnar table of annotation labels and durations for the summary
+    histograms.  Labels are stored as integer codes into the sorted array
+    of distinct labels, so selecting durations by label is a lookup of a
+    boolean per code rather than a pass over the annotations.
+
+    Parameters
+    ----------
+    labels : iterable
+        Label of each annotation
+    durations : iterable
+        Duration of each annotation
+    """
+    def __init__(self, labels, durations):
+        self.labels, self.codes = np.unique(np.array(list(labels), dtype = str),
+                                            return_inverse = True)
+        self.codes = self.codes.ravel()
+        self.durations = np.asarray(durations, dtype = float)
+        self._index = {l: i for i, l in enumerate(self.labels.tolist())}
+
+    @classmethod
+    def from_words(cls, annotations):
+        begins = np.fromiter((x['begin'] for x in annotations), dtype = float)
+        ends = np.fromiter((x['end'] for x in annotations), dtype = float)
+        return cls((x['label'] for x in annotations), ends - begins)
+
+    @classmethod
+    def from_phones(cls, annotations):
+        labels = chain.from_iterable(x['phones'] for x in annotations)
+        begins = np.fromiter(chain.from_iterable(x['phone_begins'] for x in annotations), dtype = float)
+        ends = np.fromiter(chain.from_iterable(x['phone_ends'] for x in annotations), dtype = float)
+        return cls(labels, ends - begins)
+
+    def mask(self, labels):
+        """
+        Boolean mask of the annotations with one of `labels`
+        """
+        selected = np.zeros(len(self.labels), dtype = bool)
+        selected[[self._index[l] for l in labels if l in self._index]] = True
+        return selected[self.codes]
+
+    def select(self, labels):
+        return self.durations[self.mask(labels)]
+
+    def counts(self):
+        """
+        Number of annotations with each label in ``labels``
+        """
+        return np.bincount(self.codes, minlength = len(self.labels))
+
 def get_histogram_mesh_data(data, bins=100, color='k', orientation='h'):
     # shamlessly stolen from vispy.visuals.histogram.__init__()
     data = np.asarray(data)
@@ -28,6 +144,46 @@ def get_histogram_mesh_data(data, bins=100, color='k', orientation='h'):
     tris[1::2] = tri_2 + offsets
     return (rr, tris)
 
+def get_envelope_mesh_data(data, num_bins):
+    """
+    Reduce a waveform to a filled min/max envelope with one column per bin
+
+    Parameters
+    ----------
+    data : numpy.array
+        N x 2 array of times and sample values
+    num_bins : int
+        Number of columns in the envelope, normally the width of the
+        plot in pixels
+
+    Returns
+    -------
+    numpy.array
+        2 * num_bins x 3 vertices, alternating minimum and maximum
+    numpy.array
+        Triangles joining consecutive columns
+    """
+    num_samples = data.shape[0]
+    num_bins = max(1, min(int(num_bins), num_samples))
+    edges = np.unique(np.linspace(0, num_samples, num_bins + 1).astype(np.int64))
+    starts = edges[:-1]
+    ends = edges[1:] - 1
+    num_bins = starts.shape[0]
+    sig = data[:, 1]
+
+    rr = np.zeros((2 * num_bins, 3), np.float32)
+    times = (data[starts, 0] + data[ends, 0]) / 2
+    rr[0::2, 0] = times
+    rr[1::2, 0] = times
+    rr[0::2, 1] = np.minimum.reduceat(sig, starts)
+    rr[1::2, 1] = np.maximum.reduceat(sig, starts)
+
+    tris = np.zeros((2 * (num_bins - 1), 3), np.uint32)
+    offsets = 2 * np.arange(num_bins - 1, dtype=np.uint32)[:, np.newaxis]
+    tris[::2] = np.array([0, 1, 2], np.uint32) + offsets
+    tris[1::2] = np.array([1, 3, 2], np.uint32) + offsets
+    return (rr, tris)
+
 def generate_boundaries(annotations, hierarchy, min_time, max_time):
     num_types = len(hierarchy.keys())
     lowest = hierarchy.lowest
@@ -35,12 +191,14 @@ def generate_boundaries(annotations, hierarchy, min_time, max_time):
     line_outputs = {x: [] for x in hierarchy.keys()}
     text_pos = {x: [] for x in hierarchy.keys()}
     text_labels = {x: [] for x in hierarchy.keys()}
+    text_widths = {x: [] for x in hierarchy.keys()}
     subannotation_keys = []
     for k,v in hierarchy.subannotations.items():
         for s in v:
             line_outputs[k,s] = []
             text_pos[k,s] = []
             text_labels[k,s] = []
+            text_widths[k,s] = []
             subannotation_keys.append((k,s))
     subannotation_keys.sort()
 
@@ -71,6 +229,7 @@ def generate_boundaries(annotations, hierarchy, min_time, max_time):
             text = ''
         text_labels[a._type].append(text)
         text_pos[a._type].append((midpoint, main_vert_mid))
+        text_widths[a._type].append(end - begin)
 
         line_outputs[a._type].append([begin,main_vert_min])
         line_outputs[a._type].append([begin,main_vert_max])
@@ -80,11 +239,12 @@ def generate_boundaries(annotations, hierarchy, min_time, max_time):
             for stype in hierarchy.subannotations[a._type]:
                 subs = getattr(a, stype)
                 ind = subannotation_keys[a._type,stype]
-                lines, text_poses, texts = generate_subannotation_lines(subs,
+                lines, text_poses, texts, widths = generate_subannotation_lines(subs,
                                                 ind, sub_size, min_time, max_time)
                 line_outputs[a._type, stype].extend(lines)
                 text_pos[a._type, stype].extend(text_poses)
                 text_labels[a._type, stype].extend(texts)
+                text_widths[a._type, stype].extend(widths)
 
         for i, t in enumerate(hierarchy.get_lower_types(a._type)):
             elements = getattr(a, t)
@@ -111,6 +271,7 @@ def generate_boundaries(annotations, hierarchy, min_time, max_time):
                     text = ''
                 text_labels[t].append(text)
                 text_pos[t].append((midpoint, vert_mid))
+                text_widths[t].append(end - begin)
 
                 line_outputs[t].append([begin,vert_min])
                 line_outputs[t].append([begin,vert_max])
@@ -120,23 +281,84 @@ def generate_boundaries(annotations, hierarchy, min_time, max_time):
                     for stype in hierarchy.subannotations[t]:
                         subs = getattr(e, stype)
                         ind = subannotation_keys[t,stype]
-                        lines, text_poses, texts = generate_subannotation_lines(subs,
+                        lines, text_poses, texts, widths = generate_subannotation_lines(subs,
                                                 ind, sub_size, min_time, max_time)
                         line_outputs[t, stype].extend(lines)
                         text_pos[t, stype].extend(text_poses)
                         text_labels[t, stype].extend(texts)
+                        text_widths[t, stype].extend(widths)
 
     text_outputs = {}
     for t in hierarchy.highest_to_lowest:
         line_outputs[t] = np.array(line_outputs[t])
-        text_outputs[t] = (text_labels[t], np.array(text_pos[t]))
+        text_outputs[t] = (text_labels[t], np.array(text_pos[t]), np.array(text_widths[t]))
     for k in subannotation_keys.keys():
         line_outputs[k] = np.array(line_outputs[k])
-        text_outputs[k] = (text_labels[k], np.array(text_pos[k]))
+        text_outputs[k] = (text_labels[k], np.array(text_pos[k]), np.array(text_widths[k]))
 
     return line_outputs, text_outputs
 
 
+def label_level_of_detail(positions, widths, pps, view_begin, view_end,
+                        min_pixels = 8, merge_pixels = 60):
+    """
+    Select which labels of a tier are worth drawing at the current zoom
+
+    Labels outside the visible time range are culled.  Labels at least
+    ``min_pixels`` wide are drawn individually, while consecutive narrower
+    labels are merged into runs of roughly ``merge_pixels`` that get drawn
+    as a single placeholder.
+
+    Parameters
+    ----------
+    positions : array-like
+        N x 2 (or N x 3) label anchor positions, in time order
+    widths : array-like
+        Durations of the N labelled annotations
+    pps : float
+        Pixels per second of the current view
+
+    Returns
+    -------
+    numpy.array
+        Indices of labels to draw as is
+    numpy.array
+        M x 2 anchor positions of merged runs
+    """
+    positions = np.asarray(positions)
+    widths = np.asarray(widths, dtype = float)
+    empty = np.zeros((0, 2))
+    if positions.shape[0] == 0:
+        return np.zeros(0, dtype = int), empty
+    half = widths / 2
+    visible = np.nonzero((positions[:, 0] + half >= view_begin) &
+                        (positions[:, 0] - half <= view_end))[0]
+    pixels = widths[visible] * pps
+    wide = pixels >= min_pixels
+    keep = visible[wide]
+    narrow = visible[~wide]
+    if narrow.shape[0] == 0:
+        return keep, empty
+    pixels = pixels[~wide]
+
+    # Runs are broken by a wide or off-screen label between narrow ones
+    new_run = np.ones(narrow.shape[0], dtype = bool)
+    new_run[1:] = np.diff(narrow) != 1
+    run_id = np.cumsum(new_run) - 1
+    offset = np.cumsum(pixels) - pixels
+    offset -= offset[new_run][run_id]
+    bucket = np.floor(offset / merge_pixels)
+    new_group = new_run.copy()
+    new_group[1:] |= bucket[1:] != bucket[:-1]
+
+    starts = np.nonzero(new_group)[0]
+    ends = np.append(starts[1:], narrow.shape[0]) - 1
+    left = positions[narrow[starts], 0] - half[narrow[starts]]
+    right = positions[narrow[ends], 0] + half[narrow[ends]]
+    valid = (right - left) * pps >= min_pixels
+    merged = np.column_stack(((left + right) / 2, positions[narrow[starts], 1]))
+    return keep, merged[valid]
+
 def rescale(value, oldmax, newmax):
     return value * newmax/oldmax
 
@@ -145,6 +367,7 @@ def generate_subannotation_lines(subs, ind, sub_size, min_time, max_time):
     output = []
     text_output = []
     text_labels = []
+    text_widths = []
     if len(subs) > 1:
         rel_sub_size = sub_size / len(subs)
     else:
@@ -173,10 +396,11 @@ def generate_subannotation_lines(subs, ind, sub_size, min_time, max_time):
         if text is None:
             text = ''
         text_labels.append(text)
+        text_widths.append(end - begin)
         output.append([begin,sub_vert_min])
         output.append([begin,sub_vert_max])
         output.append([begin, sub_vert_min])
         output.append([end, sub_vert_min])
         output.append([end,sub_vert_min])
         output.append([end,sub_vert_max])
-    return output, text_output, text_labels
+    return output, text_output, text_labels, text_widths
@@ -8,7 +8,7 @@ from vispy import plot as vp, scene
 from .widgets import (SummaryPlotWidget,
                     SpectralPlotWidget, AnnotationPlotWidget)
 
-from .helper import get_histogram_mesh_data
+from .helper import get_histogram_mesh_data, DurationTable
 
 class SCTSummaryWidget(vp.Fig):
     def __init__(self, parent = None):
@@ -17,6 +17,7 @@ class SCTSummaryWidget(vp.Fig):
         self.unfreeze()
         self.parent = parent
         self.annotations = None
+        self.tables = {}
 
     def updatePlots(self, data):
         annotations = data[0]
@@ -24,31 +25,25 @@ class SCTSummaryWidget(vp.Fig):
 
     def plot(self, annotations):
         self.annotations = annotations
+        self.tables = {'w': DurationTable.from_words(annotations),
+                        'p': DurationTable.from_phones(annotations)}
         self[0:2,0].durations(self.init_data('w')) # word duration histogram
         self[2:4,0].durations(self.init_data('p')) # phone duration histogram
 
     def init_data(self, dur_type):
+        table = self.tables[dur_type]
         if dur_type == 'w': # get word durations
-            words = set([x['label'] for x in self.annotations])
-            data = [x['end']-x['begin'] for x in self.annotations]
-            self.parent.wordList.addItems(sorted(list(words)))
+            self.parent.wordList.addItems(table.labels.tolist())
         else: # get phone durations
-            phones = set(np.concatenate([np.array(x['phones']) for x in self.annotations], axis = 0))
-            data = np.concatenate([np.array(x['phone_ends'])-np.array(x['phone_begins']) for x in self.annotations], axis = 0)
-            self.parent.phoneList.addItems(sorted(list(phones)))
-        return data
+            self.parent.phoneList.addItems(table.labels.tolist())
+        return table.durations
 
     def update_data(self, labels, plot_type):
         if self.annotations:
+            data = get_histogram_mesh_data(self.tables[plot_type].select(labels))
             if plot_type == 'w':
-                data = [x['end']-x['begin'] for x in self.annotations if x['label'] in labels]
-                data = get_histogram_mesh_data(data)
                 self[0:2, 0].hist.set_data(*data)
             elif plot_type == 'p':
-                data = np.concatenate([np.array(x['phone_ends'])-np.array(x['phone_begins']) for x in self.annotations], axis = 0)
-                phones = np.concatenate([np.array(x['phones']) for x in self.annotations], axis = 0)
-                data = [p[1] for p in zip(phones, data) if p[0] in labels]
-                data = get_histogram_mesh_data(data)
                 self[2:4, 0].hist.set_data(*data)
 
 
@@ -116,6 +111,12 @@ class AnnotationWidget(vp.Fig):
     def update_signal(self, data):
         self[0:2, 0].set_signal(data)
 
+    def update_signal_cache(self, data, sr, levels = None):
+        self[0:2, 0].set_signal_cache(data, sr, levels)
+
+    def update_signal_view(self, begin, end):
+        self[0:2, 0].show_signal(begin, end)
+
     def update_annotations(self, annotations):
         self[0:2, 0].set_annotations(annotations)
 
@@ -123,19 +124,19 @@ class AnnotationWidget(vp.Fig):
         return self[0:2, 0].play_time_line.pos[0][0]
 
     def transform_pos_to_time(self, pos):
-        tr = self.scene.node_transform(self[0:2, 0].waveform)
+        tr = self.scene.node_transform(self[0:2, 0].view.scene)
         pos = tr.map(pos)
         time = pos[0]
         return time
 
     def transform_time_to_pos(self, time):
-        tr = self.scene.node_transform(self[0:2, 0].waveform)
+        tr = self.scene.node_transform(self[0:2, 0].view.scene)
         pos = tr.imap([time,0])
         pos = pos[0]
         return pos
 
     def get_key(self, pos):
-        tr = self.scene.node_transform(self[0:2, 0].waveform)
+        tr = self.scene.node_transform(self[0:2, 0].view.scene)
         pos = tr.map(pos)
         return self[0:2, 0].pos_to_key(pos)
 
@@ -143,7 +144,7 @@ class AnnotationWidget(vp.Fig):
         if event.source != self:
             return
         pos = event.pos
-        tr = self.scene.node_transform(self[0:2, 0].waveform)
+        tr = self.scene.node_transform(self[0:2, 0].view.scene)
         pos = tr.map(pos)
         time = pos[0]
         vert = pos[1]
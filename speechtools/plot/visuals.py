@@ -13,8 +13,13 @@ from vispy.geometry import Rect
 from vispy.visuals.visual import Visual
 from vispy.visuals.shaders import Function
 from vispy.visuals import collections
+from vispy.visuals.text.text import _text_to_vbo
 from vispy.color import Color, ColorArray, get_colormap
 
+from .helper import (label_level_of_detail, get_envelope_mesh_data,
+                    get_waveform_levels, waveform_level, range_amplitude,
+                    WAVEFORM_LEVEL_FACTORS)
+
 class WaveformLineVisual(visuals.LineVisual):
     def __init__(self):
         super(WaveformLineVisual, self).__init__(method = 'gl', color = 'k')
@@ -29,6 +34,90 @@ class WaveformLineVisual(visuals.LineVisual):
             self._pos = None
             self.update()
 
+class WaveformVisual(visuals.visual.CompoundVisual):
+    level_factors = WAVEFORM_LEVEL_FACTORS
+    def __init__(self, envelope_threshold = 3):
+        self.envelope_threshold = envelope_threshold
+        self._sr = None
+        self._cached = None
+        self._line = WaveformLineVisual()
+        self._envelope = visuals.MeshVisual(color = 'k')
+        self._levels = [visuals.MeshVisual(color = 'k') for x in self.level_factors]
+        self._level_vertices = [None for x in self.level_factors]
+        for v in [self._envelope] + self._levels:
+            v.visible = False
+        visuals.visual.CompoundVisual.__init__(self, [self._line, self._envelope] + self._levels)
+
+    def _clear_levels(self):
+        self._cached = None
+        for i, v in enumerate(self._levels):
+            v.visible = False
+            self._level_vertices[i] = None
+
+    def set_data(self, data, pixel_width = None):
+        """
+        Draw the exact polyline when zoomed in far enough, and a per-pixel
+        min/max envelope when there are more than ``envelope_threshold``
+        samples per pixel
+        """
+        self._clear_levels()
+        if data is None or pixel_width is None or pixel_width <= 0 or \
+                data.shape[0] <= pixel_width * self.envelope_threshold:
+            self._envelope.visible = False
+            self._line.set_data(data)
+            self._line.visible = data is not None
+            return
+        vertices, faces = get_envelope_mesh_data(data, pixel_width)
+        self._line.set_data(None)
+        self._line.visible = False
+        self._envelope.set_data(vertices = vertices, faces = faces, color = 'k')
+        self._envelope.visible = True
+
+    def set_cached_data(self, data, sr, levels = None):
+        """
+        Upload the waveform for a whole cached audio window, as the exact
+        polyline plus one min/max envelope per factor in ``level_factors``.
+        Views inside the window are then selected with ``show_range``
+        without touching the GPU buffers.  Envelopes already computed with
+        ``get_waveform_levels`` can be passed as `levels`.
+        """
+        self._clear_levels()
+        self._envelope.visible = False
+        self._sr = sr
+        if data is None:
+            self._line.set_data(None)
+            self._line.visible = False
+            return
+        self._cached = data
+        self._line.set_data(data)
+        if levels is None:
+            levels = get_waveform_levels(data, self.level_factors)
+        for i, f in enumerate(self.level_factors):
+            if f not in levels:
+                continue
+            vertices, faces = levels[f]
+            self._levels[i].set_data(vertices = vertices, faces = faces, color = 'k')
+            self._level_vertices[i] = vertices
+
+    def show_range(self, begin, end, pixel_width):
+        """
+        Show the level of detail of the cached waveform that suits the given
+        view, and return the maximum absolute amplitude within it
+        """
+        if self._cached is None:
+            return None
+        samples_per_pixel = (end - begin) * self._sr / max(pixel_width, 1)
+        chosen = waveform_level(samples_per_pixel, self.level_factors,
+                                [x is not None for x in self._level_vertices],
+                                self.envelope_threshold)
+        if chosen == -1:
+            points = self._cached
+        else:
+            points = self._level_vertices[chosen]
+        self._line.visible = chosen == -1
+        for i, v in enumerate(self._levels):
+            v.visible = i == chosen
+        return range_amplitude(points, begin, end)
 
 class SCTLineVisual(visuals.LineVisual):
     def __init__(self, *args, **kwargs):
@@ -41,19 +130,38 @@ class SCTLineVisual(visuals.LineVisual):
         except KeyError:
             color = Color(self._color).rgba
         self.non_selected_color = color
+        self._color_buffer = None
+        self._highlighted = (-1, None)
+        self._vert_bounds = None
         self.freeze()
 
+    def _reset_color_buffer(self, size):
+        if self._color_buffer is None or self._color_buffer.shape[0] != size:
+            self._color_buffer = np.empty((size, 4), dtype = np.float32)
+        self._color_buffer[:] = self.non_selected_color
+        self._highlighted = (-1, None)
+
     def set_data(self, data):
         if data is not None:
-            color = np.array([self.non_selected_color for x in range(len(data))])
-            scene.visuals.Line.set_data(self, pos = data, color = color)
+            self._reset_color_buffer(len(data))
+            self._vert_bounds = (data[:, 1].min(), data[:, 1].max())
+            scene.visuals.Line.set_data(self, pos = data, color = self._color_buffer)
         else:
             color = None
             self._bounds = None
             self._changed['pos'] = True
             self._pos = None
+            self._highlighted = (-1, None)
+            self._vert_bounds = None
             self.update()
 
+    def draw(self):
+        visuals.LineVisual.draw(self)
+        # The color buffer is resident on the GPU now, so later highlight
+        # changes can be pushed as sub-buffer updates
+        if self._pos is not None:
+            self._changed['color'] = False
+
     #Adapted from the vispy line_draw example
     def contains_vert(self, pos):
         try:
@@ -63,10 +171,9 @@ class SCTLineVisual(visuals.LineVisual):
                 vert = pos[0]
         except AttributeError:
             vert = pos
-        if self._pos is None:
+        if self._pos is None or self._vert_bounds is None:
             return False
-        min_vert = self._pos[:, 1].min()
-        max_vert = self._pos[:, 1].max()
+        min_vert, max_vert = self._vert_bounds
         if vert <= max_vert and vert >= min_vert:
             return True
         return False
@@ -78,20 +185,18 @@ class SCTLineVisual(visuals.LineVisual):
                     event.source.transform_pos_to_time([0])
         pos_scene = event.source.transform_pos_to_time(event.pos)
 
-        index = -1
-        for p in self.pos:
-            index += 1
-            if index % 2 == 0:
-                if p[0] != self.pos[index+1][0]:
-                    continue
-            else:
-                if p[0] != self.pos[index-1][0]:
-                    continue
-            if np.linalg.norm(pos_scene - p[0]) < radius_time:
-                # point found, return point and its index
-                return p, index
-        # no point found, return None
-        return None, -1
+        times = self.pos[:, 0]
+        # Boundaries are vertical pairs of points, so each point's partner
+        # is the other half of its pair
+        partners = np.minimum(np.arange(times.shape[0]) ^ 1, times.shape[0] - 1)
+        candidates = np.nonzero((times == times[partners]) &
+                        (np.abs(pos_scene - times) < radius_time))[0]
+        if len(candidates) == 0:
+            # no point found, return None
+            return None, -1
+        # point found, return point and its index
+        index = int(candidates[0])
+        return self.pos[index], index
 
     def update_boundary(self, selected_index, new_time):
         if 0 <= selected_index < len(self.pos):
@@ -105,15 +210,38 @@ class SCTLineVisual(visuals.LineVisual):
 
             scene.visuals.Line.set_data(self, pos = p)
 
-
     def update_markers(self, selected_index=-1, highlight_color=(1, 1, 0, 1)):
         """ update marker colors, and highlight a marker with a given color """
-        c = np.array([self.non_selected_color for x in range(len(self.pos))])
-        if 0 <= selected_index < len(self.pos):
-            c[selected_index] = highlight_color
-            c[selected_index + 1] = highlight_color
-
-        scene.visuals.Line.set_data(self, color = c)
+        if self._color_buffer is None or self.pos is None:
+            return
+        if not 0 <= selected_index < len(self.pos) - 1:
+            selected_index = -1
+            highlight_color = None
+        elif highlight_color is not None:
+            highlight_color = tuple(highlight_color)
+        if (selected_index, highlight_color) == self._highlighted:
+            return
+        changed = []
+        previous_index = self._highlighted[0]
+        if previous_index != -1:
+            self._color_buffer[previous_index:previous_index + 2] = self.non_selected_color
+            changed.append(previous_index)
+        if selected_index != -1:
+            self._color_buffer[selected_index:selected_index + 2] = highlight_color
+            changed.append(selected_index)
+        self._highlighted = (selected_index, highlight_color)
+        self._upload_colors(changed)
+
+    def _upload_colors(self, indices):
+        vbo = getattr(self._line_visual, '_color_vbo', None)
+        if self._changed['color'] or vbo is None or vbo.size != self._color_buffer.shape[0]:
+            # Nothing resident to patch yet, so let the next draw upload
+            # the whole buffer
+            self._changed['color'] = True
+        else:
+            for i in indices:
+                vbo.set_subdata(self._color_buffer[i:i + 2], offset = i, copy = True)
+        self.update()
 
 class LineCollectionVisual(visuals.visual.BaseVisual, collections.agg_segment_collection.AggSegmentCollection):
     pass
@@ -326,7 +454,7 @@ PlayLine = scene.visuals.create_visual_node(PlayLineVisual)
 
 Spectrogram = scene.visuals.create_visual_node(SCTSpectrogramVisual)
 SCTLinePlot = scene.visuals.create_visual_node(SCTLineVisual)
-WaveformPlot = scene.visuals.create_visual_node(WaveformLineVisual)
+WaveformPlot = scene.visuals.create_visual_node(WaveformVisual)
 
 class TierRectangle(scene.Rectangle):
     def __init__(self, tier_index, num_types, num_sub_types):
@@ -414,16 +542,58 @@ class ScalingText(scene.visuals.Text):
         self.maxpps = 3000
         self.min_font_size = 1
         self.max_font_size = 18
+        self.min_label_pixels = 8
+        self.merge_pixels = 60
+        self.merged_label = '...'
+        self._all_text = []
+        self._all_pos = None
+        self._all_widths = None
+        self._lod_selection = None
+        self._glyph_cache = {}
         super(ScalingText, self).__init__(*args, **kwargs)
 
     def set_lowest(self):
         self.maxpps = 5000
         self.max_font_size = 16
 
+    def _glyph_layout(self, text):
+        try:
+            return self._glyph_cache[text]
+        except KeyError:
+            pass
+        if len(self._glyph_cache) > 10000:
+            self._glyph_cache = {}
+        vertices = _text_to_vbo(text, self._font, self._anchors[0],
+                                self._anchors[1], self._font._lowres_size)
+        self._glyph_cache[text] = vertices
+        return vertices
+
+    def _update_level_of_detail(self, pps, view_begin, view_end):
+        keep, merged = label_level_of_detail(self._all_pos, self._all_widths, pps,
+                                        view_begin, view_end,
+                                        self.min_label_pixels, self.merge_pixels)
+        selection = (keep.tobytes(), merged.tobytes())
+        if selection == self._lod_selection:
+            return
+        self._lod_selection = selection
+        text = [self._all_text[i] for i in keep]
+        text.extend([self.merged_label] * merged.shape[0])
+        pos = self._all_pos[keep]
+        if merged.shape[0]:
+            merged = np.hstack((merged[:, :2], np.zeros((merged.shape[0], 1), np.float32)))
+            pos = np.vstack((pos, merged.astype(np.float32)))
+        # Set the underlying attributes directly, we are already drawing
+        self._text = text
+        self._pos = pos
+        self._vertices = None
+        self._pos_changed = True
+        self._color_changed = True
+
     def _prepare_draw(self, view):
-        if len(self.text) == 0:
+        if len(self._all_text) == 0:
             return False
-        seconds = view.canvas[0:2,0].view.camera.rect.width
+        rect = view.canvas[0:2,0].view.camera.rect
+        seconds = rect.width
         pixels = view.canvas.physical_size[0]
         pps = pixels / seconds
 
@@ -435,15 +605,38 @@ class ScalingText(scene.visuals.Text):
             per = (pps - self.minpps) / (self.maxpps - self.minpps)
             font_size = self.min_font_size + (self.max_font_size - self.min_font_size) * per
         self.font_size = font_size
+        self._update_level_of_detail(pps, rect.left, rect.right)
+        if len(self.text) == 0:
+            return False
+        if self._vertices is None:
+            n_char = sum(len(t) for t in self.text)
+            if n_char == 0:
+                return False
+            vertices = np.concatenate([self._glyph_layout(t) for t in self.text])
+            self._vertices = gloo.VertexBuffer(vertices)
+            idx = (np.array([0, 1, 2, 0, 2, 3], np.uint32) +
+                   np.arange(0, 4*n_char, 4, dtype=np.uint32)[:, np.newaxis])
+            self._index_buffer = gloo.IndexBuffer(idx.ravel())
+            self.shared_program.bind(self._vertices)
         super(ScalingText, self)._prepare_draw(view)
 
-    def set_data(self, text, pos):
-
+    def set_data(self, text, pos = None, widths = None):
+        if text is None:
+            text = []
+        if pos is None or len(text) == 0:
+            pos = np.zeros((0, 3), np.float32)
+        else:
+            pos = np.atleast_2d(pos).astype(np.float32)
+            if pos.shape[1] == 2:
+                pos = np.hstack((pos, np.zeros((pos.shape[0], 1), np.float32)))
+        if widths is None:
+            widths = np.full(len(text), np.inf)
+        self._all_text = text
+        self._all_pos = pos
+        self._all_widths = np.asarray(widths, dtype = float)
+        self._lod_selection = None
         self.text = None
-        if pos is None:
-            pos = [0,0]
-        self.pos = pos
-        self.text = text
+        self.update()
 
 #ScalingText = scene.visuals.create_visual_node(ScalingTextVisual)
 
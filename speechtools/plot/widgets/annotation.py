@@ -4,6 +4,7 @@ import copy
 import time
 
 from vispy import scene
+from vispy.visuals.transforms import STTransform
 
 from vispy.visuals.text.text import FontManager
 
@@ -11,7 +12,7 @@ from .base import SelectablePlotWidget, PlotWidget
 
 from ..visuals import SCTLinePlot, ScalingText, SCTAnnotation, SelectionLine, TierRectangle, WaveformPlot
 
-from ..helper import generate_boundaries
+from ..helper import generate_boundaries, amplitude_scale
 
 class AnnotationPlotWidget(SelectablePlotWidget):
 
@@ -29,6 +30,7 @@ class AnnotationPlotWidget(SelectablePlotWidget):
         self.font_manager = FontManager()
         self.breakline = SCTLinePlot(None, width = 1, color = 'k')
         self.waveform = WaveformPlot()
+        self.waveform.transform = STTransform()
         self.freeze()
         self._configure_2d()
 
@@ -123,7 +125,8 @@ class AnnotationPlotWidget(SelectablePlotWidget):
                 if text_data[k][0] and (self.max_time - self.min_time < 10 or k != self.hierarchy.lowest):
                         self.line_visuals[k].set_data(line_data[k])
                         self.line_visuals[k].visible = True
-                        self.annotation_visuals[k].set_data(text_data[k][0], pos = text_data[k][1])
+                        self.annotation_visuals[k].set_data(text_data[k][0], pos = text_data[k][1],
+                                                            widths = text_data[k][2])
                         self.annotation_visuals[k].visible = True
                 else:
                     self.line_visuals[k].set_data(None)
@@ -133,7 +136,8 @@ class AnnotationPlotWidget(SelectablePlotWidget):
                     if text_data[k, s][0] and self.max_time - self.min_time < 10:
                         self.line_visuals[k, s].set_data(line_data[k, s])
                         self.line_visuals[k, s].visible = True
-                        self.annotation_visuals[k, s].set_data(text_data[k, s][0], pos = text_data[k, s][1])
+                        self.annotation_visuals[k, s].set_data(text_data[k, s][0], pos = text_data[k, s][1],
+                                                            widths = text_data[k, s][2])
                         self.annotation_visuals[k, s].visible = True
                     else:
                         self.line_visuals[k, s].visible = False
@@ -156,6 +160,7 @@ class AnnotationPlotWidget(SelectablePlotWidget):
         return ranking
 
     def set_signal(self, data):
+        self.waveform.transform.scale = (1, 1)
         if data is None or data.shape[0] == 0:
             self.waveform.visible = False
             self.waveform.set_data(None)
@@ -165,9 +170,24 @@ class AnnotationPlotWidget(SelectablePlotWidget):
             ratio = 0.5 / max_sig
             data[:,1] *=  ratio
 
-        self.waveform.set_data(data)
+        self.waveform.set_data(data, pixel_width = self.view.size[0])
         self.waveform.visible = True
 
+    def set_signal_cache(self, data, sr, levels = None):
+        if data is None or data.shape[0] == 0:
+            self.waveform.visible = False
+            self.waveform.set_cached_data(None, sr)
+            return
+        self.waveform.set_cached_data(data, sr, levels)
+        self.waveform.visible = True
+
+    def show_signal(self, begin, end):
+        max_sig = self.waveform.show_range(begin, end, self.view.size[0])
+        if max_sig is None:
+            return
+        # Amplitude scaling is a transform so that panning never re-uploads
+        self.waveform.transform.scale = (1, amplitude_scale(max_sig))
+
     def set_play_time(self, time):
         if time is None:
             self.play_time_line.visible = False
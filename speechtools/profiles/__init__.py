@@ -1,5 +1,5 @@
 
-from .query import QueryProfile, Filter
+from .query import QueryProfile, Filter, GroupBy, Aggregate, AGGREGATE_FUNCTIONS, SAMPLE_STRATA
 
 from .export import ExportProfile, Column
 
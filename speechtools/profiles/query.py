@@ -1,10 +1,31 @@
 
+import random
+
+from polyglotdb.graph.func import Count, Average, Min, Max, Sum
 
 from .base import BaseProfile
 
+AGGREGATE_FUNCTIONS = {'count': Count, 'mean': Average, 'min': Min,
+                        'max': Max, 'sum': Sum}
+
+# Attributes a sample can be stratified by, from the annotation type found
+SAMPLE_STRATA = {'speaker': ('speaker', 'name'), 'discourse': ('discourse', 'name'),
+                'label': ('label',)}
+
 class ProfileMatchError(Exception):
     pass
 
+def resolve_attribute(corpus_context, attribute):
+    att = corpus_context
+    for a in attribute:
+        if a == '':
+            continue
+        if a.endswith('_name'):
+            att = getattr(att, getattr(corpus_context, a))
+        else:
+            att = getattr(att, a)
+    return att
+
 class Filter(object):
     def __init__(self, attribute, operator, value):
         self.attribute = attribute
@@ -27,24 +48,10 @@ class Filter(object):
         return True
 
     def for_polyglot(self, corpus_context):
-        att = corpus_context
-        for a in self.attribute:
-            if a == '':
-                continue
-            if a.endswith('_name'):
-                att = getattr(att, getattr(corpus_context, a))
-            else:
-                att = getattr(att, a)
+        att = resolve_attribute(corpus_context, self.attribute)
 
         if isinstance(self.value, tuple):
-            value = corpus_context
-            for a in self.value:
-                if a == '':
-                    continue
-                if a.endswith('_name'):
-                    value = getattr(value, getattr(corpus_context, a))
-                else:
-                    value = getattr(value, a)
+            value = resolve_attribute(corpus_context, self.value)
 
         else:
             value = self.value
@@ -75,19 +82,131 @@ class Filter(object):
         elif self.operator == 'regex':
             return att.regex(value)
 
+class GroupBy(object):
+    def __init__(self, attribute, name):
+        self.attribute = attribute
+        self.name = name
+
+    def __repr__(self):
+        return '<GroupBy {}, {}>'.format(self.attribute, self.name)
+
+    def for_polyglot(self, corpus_context):
+        return resolve_attribute(corpus_context, self.attribute).column_name(self.name)
+
+class Aggregate(object):
+    def __init__(self, function, attribute, name):
+        self.function = function
+        self.attribute = attribute
+        self.name = name
+
+    def __repr__(self):
+        return '<Aggregate {}, {}, {}>'.format(self.function, self.attribute, self.name)
+
+    def for_polyglot(self, corpus_context):
+        if self.attribute is None:
+            func = AGGREGATE_FUNCTIONS[self.function]()
+        else:
+            func = AGGREGATE_FUNCTIONS[self.function](resolve_attribute(corpus_context, self.attribute))
+        return func.column_name(self.name)
+
 class QueryProfile(BaseProfile):
     extension = '.queryprofile'
     def __init__(self):
         self.filters = []
         self.name = ''
         self.to_find = None
+        self.group_by = []
+        self.aggregates = []
+        self.sample_size = None
+        self.sample_by = None
+        self.sample_seed = 1
+
+    def __setstate__(self, state):
+        # Profiles saved before a setting existed get its default
+        self.__init__()
+        self.__dict__.update(state)
+
+    @property
+    def is_aggregation(self):
+        return len(self.aggregates) > 0
+
+    @property
+    def is_sample(self):
+        return self.sample_size is not None
 
     def valid_profile(self, corpus_context):
         try:
             self.for_polyglot(corpus_context)
+            self.aggregation_for_polyglot(corpus_context)
         except AttributeError:
             return False
         return True
 
     def for_polyglot(self, corpus_context):
         return [x.for_polyglot(corpus_context) for x in self.filters]
+
+    def aggregation_for_polyglot(self, corpus_context):
+        """
+        Grouping attributes and aggregate functions to pass to the
+        ``group_by`` and ``aggregate`` methods of a graph query.
+        """
+        return ([x.for_polyglot(corpus_context) for x in self.group_by],
+                [x.for_polyglot(corpus_context) for x in self.aggregates])
+
+    def aggregation_table(self, results):
+        """
+        Convert the return value of a graph query's ``aggregate`` into a
+        header and rows, with a column per grouping attribute followed by
+        a column per aggregate.
+        """
+        header = [x.name for x in self.group_by] + [x.name for x in self.aggregates]
+        if not isinstance(results, list):
+            if not self.group_by and len(self.aggregates) == 1:
+                # A single aggregate over the whole query is a plain value
+                return header, [[results]]
+            results = [results]
+        return header, [[r[x] for x in header] for r in results]
+
+    def sample_for_polyglot(self, corpus_context):
+        """
+        Columns to retrieve for drawing a sample: the id of each result,
+        and its stratum if the sample is stratified.
+        """
+        a_type = getattr(corpus_context, self.to_find)
+        columns = [a_type.id.column_name('id')]
+        if self.sample_by is not None:
+            att = a_type
+            for a in SAMPLE_STRATA[self.sample_by]:
+                att = getattr(att, a)
+            columns.append(att.column_name('stratum'))
+        return columns
+
+    def draw_sample(self, rows):
+        """
+        Randomly select `sample_size` results, or `sample_size` results for
+        each stratum, using `sample_seed`.  The same rows and seed always
+        give the same sample, whatever order the rows are in.
+
+        Parameters
+        ----------
+        rows : list
+            Pairs of result id and stratum (None if not stratified)
+
+        Returns
+        -------
+        list
+            Sorted ids of the sampled results
+        """
+        rng = random.Random(self.sample_seed)
+        strata = {}
+        for id, stratum in sorted(rows, key = lambda x: x[0]):
+            if self.sample_by is None:
+                stratum = None
+            strata.setdefault(stratum, []).append(id)
+        sample = []
+        for stratum in sorted(strata, key = str):
+            ids = strata[stratum]
+            if len(ids) > self.sample_size:
+                ids = rng.sample(ids, self.sample_size)
+            sample.extend(ids)
+        return sorted(sample)
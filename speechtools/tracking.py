@@ -0,0 +1,326 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _frames(signal, sr, times, window_length):
+    """
+    Windows of `signal` of `window_length` seconds centred on `times`
+    (in seconds from the start of the signal).  Windows that would run
+    past either end of the signal are left out.
+
+    Returns
+    -------
+    numpy.ndarray
+        One window per row
+    numpy.ndarray
+        Boolean mask of the times that have a window
+    """
+    n = int(round(window_length * sr))
+    starts = np.round(np.asarray(times) * sr).astype(int) - n // 2
+    valid = (starts >= 0) & (starts + n <= signal.shape[0])
+    index = starts[valid, None] + np.arange(n)
+    return signal[index], valid
+
+
+def _autocorrelation(frames, max_lag):
+    n = frames.shape[-1]
+    nfft = 1 << int(np.ceil(np.log2(2 * n)))
+    spectrum = np.fft.rfft(frames, nfft)
+    return np.fft.irfft(np.abs(spectrum) ** 2, nfft)[..., :max_lag + 1]
+
+
+def _resample(signal, sr, new_sr):
+    """
+    Band-limited resampling through the FFT, so that nothing above the
+    new Nyquist frequency aliases into the analysis band.
+    """
+    n = int(round(signal.shape[0] * new_sr / sr))
+    spectrum = np.fft.rfft(signal)[:n // 2 + 1]
+    return np.fft.irfft(spectrum, n) * (n / signal.shape[0])
+
+
+def track_pitch(signal, sr, times, min_pitch = 75, max_pitch = 600,
+                voicing_threshold = 0.45, silence_threshold = 0.03,
+                octave_cost = 0.01):
+    """
+    Estimate the pitch of `signal` at `times` from the peak of the
+    normalized autocorrelation of a Hann window three periods of
+    `min_pitch` long, corrected for the autocorrelation of the window
+    itself (after Boersma, 1993).
+
+    Parameters
+    ----------
+    signal : numpy.ndarray
+        Mono signal
+    sr : int
+        Sampling rate
+    times : numpy.ndarray
+        Times to estimate pitch at, in seconds from the start of `signal`
+    min_pitch, max_pitch : float
+        Pitch range in Hz
+    voicing_threshold : float
+        Minimum autocorrelation peak for a frame to be voiced
+    silence_threshold : float
+        Minimum peak amplitude of a voiced frame, relative to the peak
+        amplitude of `signal`
+    octave_cost : float
+        Preference for higher pitch candidates per octave, to avoid
+        picking multiples of the period
+
+    Returns
+    -------
+    numpy.ndarray
+        Pitch in Hz for each time, 0 where unvoiced
+    """
+    pitch = np.zeros(len(times))
+    window_length = 3 / min_pitch
+    frames, valid = _frames(signal, sr, times, window_length)
+    if not frames.shape[0]:
+        return pitch
+    n = frames.shape[1]
+    min_lag = int(np.ceil(sr / max_pitch))
+    max_lag = min(int(np.floor(sr / min_pitch)), n - 1)
+    window = np.hanning(n)
+    amplitude = np.abs(frames).max(axis = 1)
+    frames = (frames - frames.mean(axis = 1, keepdims = True)) * window
+    r = _autocorrelation(frames, max_lag)
+    r_window = _autocorrelation(window, max_lag)
+    energy = r[:, 0].copy()
+    energy[energy <= 0] = 1
+    r = r / energy[:, None] / (r_window / r_window[0])
+
+    lags = np.arange(min_lag, max_lag + 1)
+    candidates = r[:, min_lag:max_lag + 1]
+    strength = candidates - octave_cost * np.log2(min_pitch * lags / sr)
+    best = np.argmax(strength, axis = 1)
+    rows = np.arange(r.shape[0])
+    peak = candidates[rows, best]
+
+    # Parabolic interpolation of the peak between neighbouring lags
+    lag = (best + min_lag).astype(float)
+    inner = (best > 0) & (best < len(lags) - 1)
+    left = candidates[rows[inner], best[inner] - 1]
+    right = candidates[rows[inner], best[inner] + 1]
+    curvature = left - 2 * peak[inner] + right
+    shift = np.zeros_like(curvature)
+    np.divide(left - right, 2 * curvature, out = shift, where = curvature < 0)
+    lag[inner] += shift
+
+    peak_amplitude = np.abs(signal).max() if signal.shape[0] else 0
+    voiced = (peak > voicing_threshold) & (amplitude > silence_threshold * peak_amplitude)
+    estimates = np.where(voiced, sr / lag, 0)
+    estimates[(estimates < min_pitch) | (estimates > max_pitch)] = 0
+    pitch[valid] = estimates
+    return pitch
+
+
+def _lpc(frames, order):
+    """
+    Linear prediction coefficients of each frame through the
+    Levinson-Durbin recursion, run on all frames at once.
+    """
+    r = _autocorrelation(frames, order)
+    a = np.zeros((frames.shape[0], order + 1))
+    a[:, 0] = 1
+    error = r[:, 0].copy()
+    error[error <= 0] = 1
+    for i in range(1, order + 1):
+        acc = r[:, i] + np.sum(a[:, 1:i] * r[:, i - 1:0:-1], axis = 1)
+        k = -acc / error
+        a[:, 1:i] = a[:, 1:i] + k[:, None] * a[:, i - 1:0:-1]
+        a[:, i] = k
+        error *= 1 - k ** 2
+        error[error <= 0] = 1e-12
+    return a
+
+
+def track_formants(signal, sr, times, num_formants = 3, max_formant = 5500,
+                    window_length = 0.025, order = 10, max_bandwidth = 700):
+    """
+    Estimate formants of `signal` at `times` from the roots of an LPC
+    model, after resampling to twice `max_formant` and preemphasis from
+    50 Hz, as in Praat's Burg formant tracker.
+
+    Parameters
+    ----------
+    signal : numpy.ndarray
+        Mono signal
+    sr : int
+        Sampling rate
+    times : numpy.ndarray
+        Times to estimate formants at, in seconds from the start of `signal`
+    num_formants : int
+        Number of formants to return
+    max_formant : float
+        Ceiling of the formant search in Hz
+    window_length : float
+        Analysis window length in seconds
+    order : int
+        Order of the LPC model, two coefficients per formant modelled
+    max_bandwidth : float
+        Broadest bandwidth in Hz of a pole that counts as a formant
+
+    Returns
+    -------
+    dict
+        Frequencies in Hz for each time, keyed by 'F1', 'F2'..., 0 where
+        a formant was not found
+    """
+    formants = np.zeros((len(times), num_formants))
+    new_sr = 2 * max_formant
+    if sr > new_sr and signal.shape[0]:
+        signal = _resample(signal, sr, new_sr)
+    else:
+        new_sr = sr
+    alpha = np.exp(-2 * np.pi * 50 / new_sr)
+    signal = np.append(signal[:1], signal[1:] - alpha * signal[:-1])
+    frames, valid = _frames(signal, new_sr, times, window_length)
+    if frames.shape[0]:
+        frames = frames * np.hamming(frames.shape[1])
+        coefficients = _lpc(frames, order)
+        silent = np.abs(frames).max(axis = 1) == 0
+        estimates = np.zeros((frames.shape[0], num_formants))
+        for i, a in enumerate(coefficients):
+            if silent[i]:
+                continue
+            roots = np.roots(a)
+            roots = roots[np.imag(roots) > 0]
+            freqs = np.angle(roots) * new_sr / (2 * np.pi)
+            bandwidths = -np.log(np.abs(roots)) * new_sr / np.pi
+            freqs = np.sort(freqs[(freqs > 50) & (freqs < max_formant - 50) &
+                                (bandwidths < max_bandwidth)])[:num_formants]
+            estimates[i, :len(freqs)] = freqs
+        formants[valid] = estimates
+    return {'F{}'.format(i + 1): formants[:, i] for i in range(num_formants)}
+
+
+class TrackCache(object):
+    """
+    Pitch and formant tracks computed from audio held in memory, for
+    showing in the discourse viewer when no stored tracks are available.
+
+    Tracks are computed and cached in fixed blocks of `block_duration`
+    seconds, so panning and zooming only compute the blocks that come
+    into view.  The least recently used blocks are dropped once more than
+    `max_blocks` are cached.  The cache can be read from the GUI thread
+    while a worker thread fills it.
+
+    Parameters
+    ----------
+    time_step : float
+        Time between track points in seconds
+    block_duration : float
+        Duration of each cached block in seconds
+    max_blocks : int
+        Maximum number of blocks to keep
+    """
+    # Longest analysis window either side of a track point
+    margin = 0.025
+
+    def __init__(self, time_step = 0.01, block_duration = 1.0, max_blocks = 600):
+        self.time_step = time_step
+        self.block_duration = block_duration
+        self.max_blocks = max_blocks
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+    def _block_indices(self, audio, begin, end):
+        begin = max(begin, 0)
+        end = min(end, audio.duration)
+        first = int(np.floor(begin / self.block_duration))
+        last = int(np.ceil(end / self.block_duration))
+        return range(first, max(last, first + 1))
+
+    def _key(self, audio, channel, index):
+        return (audio.path, channel, index)
+
+    def _get_block(self, key):
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+            return block
+
+    def _compute_block(self, audio, channel, index):
+        """
+        Compute one block from the audio currently cached, returning the
+        block and whether it was complete enough to keep.
+        """
+        block_begin = index * self.block_duration
+        steps = int(round(self.block_duration / self.time_step))
+        times = block_begin + np.arange(steps) * self.time_step
+        times = times[times < audio.duration]
+        begin = max(block_begin - self.margin, audio.cached_begin)
+        end = min(block_begin + self.block_duration + self.margin, audio.cached_end)
+        complete = (begin <= max(block_begin - self.margin, 0) and
+                    end >= min(block_begin + self.block_duration + self.margin, audio.duration))
+        if end <= begin:
+            return None, False
+        first = int(np.floor((begin - audio.cached_begin) * audio.sr))
+        last = int(np.ceil((end - audio.cached_begin) * audio.sr))
+        signal = audio.signal[first:last, channel].astype(float)
+        offset = audio.cached_begin + first / audio.sr
+        relative = times - offset
+        pitch = track_pitch(signal, audio.sr, relative)
+        formants = track_formants(signal, audio.sr, relative)
+        return (times, pitch, formants), complete
+
+    def get(self, audio, channel, begin, end):
+        """
+        Tracks between `begin` and `end` if every block is cached,
+        otherwise None.
+        """
+        blocks = []
+        for index in self._block_indices(audio, begin, end):
+            block = self._get_block(self._key(audio, channel, index))
+            if block is None:
+                return None
+            blocks.append(block)
+        return self._join(blocks, begin, end)
+
+    def compute(self, audio, channel, begin, end, stop_check = None):
+        """
+        Tracks between `begin` and `end`, computing and caching any
+        blocks that are missing.
+
+        Returns
+        -------
+        tuple
+            Pitch and formant tracks in the format of stored tracks, with
+            times relative to `begin`, or None if stopped
+        """
+        blocks = []
+        for index in self._block_indices(audio, begin, end):
+            if stop_check is not None and stop_check():
+                return None
+            key = self._key(audio, channel, index)
+            block = self._get_block(key)
+            if block is None:
+                block, complete = self._compute_block(audio, channel, index)
+                if block is None:
+                    continue
+                if complete:
+                    with self._lock:
+                        self._blocks[key] = block
+                        while len(self._blocks) > self.max_blocks:
+                            self._blocks.popitem(last = False)
+            blocks.append(block)
+        return self._join(blocks, begin, end)
+
+    def _join(self, blocks, begin, end):
+        if not blocks:
+            return [], {}
+        times = np.concatenate([b[0] for b in blocks])
+        pitch = np.concatenate([b[1] for b in blocks])
+        formants = {k: np.concatenate([b[2][k] for b in blocks]) for k in blocks[0][2]}
+        visible = (times >= begin) & (times <= end)
+        times = times[visible] - begin
+        pitch = list(zip(times.tolist(), pitch[visible].tolist()))
+        formants = {k: list(zip(times.tolist(), v[visible].tolist())) for k, v in formants.items()}
+        return pitch, formants
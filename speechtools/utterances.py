@@ -0,0 +1,251 @@
+import json
+from uuid import uuid1
+
+from .enrichment import (EnrichmentCancelled, hierarchical_target,
+                        encode_hierarchical_discourse, check_stop)
+
+# Discourse properties recording the parameters each discourse was last
+# encoded with
+UTTERANCE_STATE = 'sct_utterance_parameters'
+SPEECH_RATE_STATE = 'sct_speech_rate_parameters'
+POSITION_STATE = 'sct_utterance_position_parameters'
+
+ALL_STATES = [UTTERANCE_STATE, SPEECH_RATE_STATE, POSITION_STATE]
+
+# Encodings that have to be redone when a discourse's utterances change
+DEPENDENT_STATES = [SPEECH_RATE_STATE, POSITION_STATE]
+
+
+def _parameters(**parameters):
+    return json.dumps(parameters, sort_keys = True)
+
+
+def utterance_parameters(min_pause_length, min_utterance_length):
+    return _parameters(min_pause_length = float(min_pause_length),
+                    min_utterance_length = float(min_utterance_length))
+
+
+def speech_rate_parameters(to_count):
+    return _parameters(to_count = to_count)
+
+
+def position_parameters():
+    return _parameters()
+
+
+def stale_discourses(corpus_context, state, parameters):
+    """
+    Names of discourses that have not been encoded with `parameters`,
+    either because they were encoded with others or were added since.
+    """
+    statement = '''MATCH (d:Discourse:{corpus})
+    WHERE d.`{state}` IS NULL OR d.`{state}` <> {{parameters}}
+    RETURN d.name AS name'''.format(corpus = corpus_context.cypher_safe_name, state = state)
+    results = corpus_context.execute_cypher(statement, parameters = parameters)
+    return sorted(r['name'] for r in results)
+
+
+def clear_state(corpus_context, states, discourse = None):
+    """
+    Forget which parameters discourses were encoded with, for one
+    discourse or the whole corpus.
+    """
+    removals = ', '.join('d.`{}`'.format(s) for s in states)
+    statement = 'MATCH (d:Discourse:{}) '.format(corpus_context.cypher_safe_name)
+    if discourse is not None:
+        statement += 'WHERE d.name = {discourse} '
+    statement += 'REMOVE ' + removals
+    corpus_context.execute_cypher(statement, discourse = discourse)
+
+
+def mark_encoded(corpus_context, state, discourse, parameters):
+    statement = '''MATCH (d:Discourse:{}) WHERE d.name = {{discourse}}
+    SET d.`{}` = {{parameters}}'''.format(corpus_context.cypher_safe_name, state)
+    corpus_context.execute_cypher(statement, discourse = discourse, parameters = parameters)
+
+
+def _remove_utterances(corpus_context, discourse):
+    statement = '''MATCH (u:utterance:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus})
+    WHERE d.name = {{discourse}}
+    OPTIONAL MATCH (u)-[:is_a]->(t:utterance_type:{corpus})
+    DETACH DELETE u
+    WITH DISTINCT t WHERE t IS NOT NULL AND NOT (t)<-[:is_a]-()
+    DELETE t'''.format(corpus = corpus_context.cypher_safe_name)
+    corpus_context.execute_cypher(statement, discourse = discourse)
+
+
+def _add_utterances(corpus_context, discourse, utterances):
+    corpus = corpus_context.cypher_safe_name
+    rows = [{'id': str(uuid1()), 'begin': begin, 'end': end} for begin, end in utterances]
+    if not rows:
+        return
+    statement = '''UNWIND {{rows}} AS row
+    MATCH (d:Discourse:{corpus}) WHERE d.name = {{discourse}}
+    MATCH (w:{word}:{corpus}:speech)-[:spoken_in]->(d)
+    WHERE w.begin >= row.begin AND w.end <= row.end
+    WITH row, d, w ORDER BY w.begin
+    WITH row, d, collect(w) AS words
+    WITH row, d, words, head(words) AS first
+    MATCH (first)-[:spoken_by]->(s:Speaker:{corpus})
+    CREATE (u:utterance:{corpus}:speech {{id: row.id, begin: row.begin, end: row.end}}),
+        (u)-[:is_a]->(:utterance_type:{corpus}),
+        (u)-[:spoken_in]->(d),
+        (u)-[:spoken_by]->(s)
+    FOREACH (w IN words | CREATE (w)-[:contained_by]->(u))
+    RETURN row.id AS id'''.format(corpus = corpus, word = corpus_context.word_name)
+    results = corpus_context.execute_cypher(statement, rows = rows, discourse = discourse)
+    # Stretches without words, such as pauses only, create no utterance,
+    # so the chain links each created utterance to the previous created one
+    created = set(r['id'] for r in results)
+    ids = [row['id'] for row in rows if row['id'] in created]
+    links = [{'previous_id': p, 'id': u} for p, u in zip(ids, ids[1:])]
+    if not links:
+        return
+    statement = '''UNWIND {{links}} AS link
+    MATCH (p:utterance:{corpus}:speech {{id: link.previous_id}}),
+        (u:utterance:{corpus}:speech {{id: link.id}})
+    CREATE (p)-[:precedes]->(u)'''.format(corpus = corpus)
+    corpus_context.execute_cypher(statement, links = links)
+
+
+def encode_utterances(corpus_context, min_pause_length, min_utterance_length,
+                    incremental = True, call_back = None, stop_check = None):
+    """
+    Encode utterances, only recomputing discourses that were added or
+    were encoded with other parameters since the last run.
+
+    A discourse is marked as encoded only once its utterances are
+    complete, so a cancelled run picks up where it stopped.
+
+    Parameters
+    ----------
+    corpus_context : :class:`~polyglotdb.corpus.CorpusContext`
+        Corpus to encode
+    min_pause_length : float
+        Minimum pause duration that separates utterances
+    min_utterance_length : float
+        Minimum utterance duration
+    incremental : bool
+        If False, every discourse is recomputed
+
+    Returns
+    -------
+    bool
+        False if the encoding was cancelled
+    """
+    parameters = utterance_parameters(min_pause_length, min_utterance_length)
+    if 'utterance' not in corpus_context.hierarchy.annotation_types:
+        # First encoding, polyglotdb also sets up the hierarchy
+        clear_state(corpus_context, ALL_STATES)
+        corpus_context.encode_utterances(min_pause_length, min_utterance_length,
+                                        call_back = call_back, stop_check = stop_check)
+        if stop_check is not None and stop_check():
+            if call_back is not None:
+                call_back('Resetting utterances...')
+                call_back(0, 0)
+            corpus_context.reset_utterances()
+            return False
+        for d in corpus_context.discourses:
+            mark_encoded(corpus_context, UTTERANCE_STATE, d, parameters)
+        return True
+    if not incremental:
+        clear_state(corpus_context, ALL_STATES)
+    discourses = stale_discourses(corpus_context, UTTERANCE_STATE, parameters)
+    if call_back is not None:
+        call_back('Encoding utterances for {} discourses...'.format(len(discourses)))
+        call_back(0, len(discourses))
+    try:
+        for i, d in enumerate(discourses):
+            check_stop(stop_check)
+            if call_back is not None:
+                call_back('Encoding utterances for discourse {} of {} ({})...'.format(i + 1, len(discourses), d))
+            clear_state(corpus_context, [UTTERANCE_STATE] + DEPENDENT_STATES, d)
+            utterances = corpus_context.get_utterances(d, min_pause_length, min_utterance_length)
+            _remove_utterances(corpus_context, d)
+            _add_utterances(corpus_context, d, utterances)
+            mark_encoded(corpus_context, UTTERANCE_STATE, d, parameters)
+            if call_back is not None:
+                call_back(i + 1)
+    except EnrichmentCancelled:
+        return False
+    return True
+
+
+def _encode_per_discourse(corpus_context, state, parameters, property_type, lower,
+                        name, subset, incremental, description, call_back, stop_check):
+    target = hierarchical_target(property_type, 'utterance', lower)
+    if not incremental or not corpus_context.hierarchy.has_token_property(target, name):
+        clear_state(corpus_context, [state])
+    discourses = stale_discourses(corpus_context, state, parameters)
+    if call_back is not None:
+        call_back('Encoding {} for {} discourses...'.format(description, len(discourses)))
+        call_back(0, len(discourses))
+    try:
+        for i, d in enumerate(discourses):
+            check_stop(stop_check)
+            clear_state(corpus_context, [state], d)
+            encode_hierarchical_discourse(corpus_context, property_type, 'utterance',
+                                        lower, name, d, subset = subset)
+            mark_encoded(corpus_context, state, d, parameters)
+            if call_back is not None:
+                call_back(i + 1)
+    except EnrichmentCancelled:
+        return False
+    if not corpus_context.hierarchy.has_token_property(target, name):
+        corpus_context.hierarchy.add_token_properties(corpus_context, target, [(name, float)])
+        corpus_context.encode_hierarchy()
+    return True
+
+
+def speech_rate_units(corpus_context, to_count):
+    """
+    Annotation type and subset counted for the speech rate: syllable
+    annotations for ``'syllable'``, otherwise phones in the subset
+    `to_count`.
+
+    Returns
+    -------
+    str
+        Annotation type to count
+    str
+        Subset of it to count, or None for all of them
+    """
+    if to_count == 'syllable':
+        return 'syllable', None
+    return corpus_context.phone_name, to_count
+
+
+def encode_speech_rate(corpus_context, to_count, incremental = True,
+                    call_back = None, stop_check = None):
+    """
+    Encode the rate of syllables, or of phones in the subset `to_count`,
+    per second of each utterance, only for discourses whose utterances or
+    subset changed.
+
+    Returns
+    -------
+    bool
+        False if the encoding was cancelled
+    """
+    lower, subset = speech_rate_units(corpus_context, to_count)
+    return _encode_per_discourse(corpus_context, SPEECH_RATE_STATE,
+                                speech_rate_parameters(to_count), 'rate',
+                                lower, 'speech_rate', subset,
+                                incremental, 'speech rate', call_back, stop_check)
+
+
+def encode_utterance_position(corpus_context, incremental = True,
+                            call_back = None, stop_check = None):
+    """
+    Encode the position of each word in its utterance, only for discourses
+    whose utterances changed.
+
+    Returns
+    -------
+    bool
+        False if the encoding was cancelled
+    """
+    return _encode_per_discourse(corpus_context, POSITION_STATE, position_parameters(),
+                                'position', corpus_context.word_name,
+                                'position_in_utterance', None, incremental,
+                                'utterance positions', call_back, stop_check)
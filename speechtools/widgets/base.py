@@ -94,7 +94,11 @@ class DataListWidget(QtWidgets.QListWidget):
         self.itemSelectionChanged.connect(self.update_plot)
 
     def selectAll(self):
+        # Update the plot once rather than once per item
+        self.blockSignals(True)
         for i in range(self.count()): self.item(i).setSelected(True)
+        self.blockSignals(False)
+        self.update_plot()
 
     def update_plot(self):
         labels = [i.text() for i in self.selectedItems()]
@@ -15,6 +15,7 @@ class CorporaList(QtWidgets.QGroupBox):
     selectionChanged = QtCore.pyqtSignal(object)
     cancelImporter = QtCore.pyqtSignal()
     corpusToImport = QtCore.pyqtSignal(object, object)
+    corpusToSync = QtCore.pyqtSignal(object, object)
     
     def __init__(self, parent = None):
         super(CorporaList, self).__init__('Available corpora', parent)
@@ -64,16 +65,8 @@ class CorporaList(QtWidgets.QGroupBox):
             if reply == QtWidgets.QMessageBox.Cancel:
                 return
             self.cancelImporter.emit()
-        try:
-            if name in get_corpora_list(CorpusConfig('',graph_host = 'localhost', graph_port=7474)):
-                reply = QtWidgets.QMessageBox.warning(self, "Overwrite corpus?",
-                'The {} corpus appears to be imported already.  Would you like to overwrite it?'.format(name),
-                buttons = QtWidgets.QMessageBox.Ok | QtWidgets.QMessageBox.Cancel)
-                if reply == QtWidgets.QMessageBox.Cancel:
-                    return
-        except ConnectionError:
-            reply = QtWidgets.QMessageBox.critical(self,
-                    "Could not connect to local server", 'Please make sure there is a local Neo4j server running.')
+        mode = self.confirmOverwrite(name)
+        if mode is None:
             return
 
         directory = QtWidgets.QFileDialog.getExistingDirectory(self,
@@ -81,7 +74,7 @@ class CorporaList(QtWidgets.QGroupBox):
                         os.path.expanduser('~'))
         if directory == '':
             return
-        self.corpusToImport.emit(name, directory)
+        self.emitImport(mode, name, directory)
 
     def importForceAligned(self):
         if not self.importFree:
@@ -98,18 +91,38 @@ class CorporaList(QtWidgets.QGroupBox):
         if directory == '':
             return
         name = os.path.basename(directory)
+        mode = self.confirmOverwrite(name)
+        if mode is None:
+            return
+        self.emitImport(mode, name, directory)
+
+    def confirmOverwrite(self, name):
         try:
-            if name in get_corpora_list(CorpusConfig('',graph_host = 'localhost', graph_port=7474)):
-                reply = QtWidgets.QMessageBox.warning(self, "Overwrite corpus?",
-                'The {} corpus appears to be imported already.  Would you like to overwrite it?'.format(name),
-                buttons = QtWidgets.QMessageBox.Ok | QtWidgets.QMessageBox.Cancel)
-                if reply == QtWidgets.QMessageBox.Cancel:
-                    return
+            if name not in get_corpora_list(CorpusConfig('',graph_host = 'localhost', graph_port=7474)):
+                return 'import'
         except ConnectionError:
             reply = QtWidgets.QMessageBox.critical(self,
                     "Could not connect to local server", 'Please make sure there is a local Neo4j server running.')
-            return
-        self.corpusToImport.emit(name, directory)
+            return None
+        box = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Warning, "Overwrite corpus?",
+                'The {} corpus appears to be imported already.  Would you like to overwrite it, '
+                'or only load files that were added or changed since it was imported?'.format(name),
+                parent = self)
+        overwriteButton = box.addButton('Overwrite', QtWidgets.QMessageBox.AcceptRole)
+        syncButton = box.addButton('Update changed files', QtWidgets.QMessageBox.AcceptRole)
+        box.addButton(QtWidgets.QMessageBox.Cancel)
+        box.exec_()
+        if box.clickedButton() == overwriteButton:
+            return 'import'
+        elif box.clickedButton() == syncButton:
+            return 'sync'
+        return None
+
+    def emitImport(self, mode, name, directory):
+        if mode == 'sync':
+            self.corpusToSync.emit(name, directory)
+        else:
+            self.corpusToImport.emit(name, directory)
 
     def clear(self):
         self.corporaList.clear()
@@ -222,6 +235,7 @@ class ConnectWidget(QtWidgets.QWidget):
 
         self.finderWorker = AudioFinderWorker()
         self.finderWorker.dataReady.connect(self.doneFinding)
+        self.finderWorker.errorEncountered.connect(self.findingFailed)
 
     def connectToServer(self, ignore = False):
         host = self.hostEdit.text()
@@ -324,7 +338,7 @@ class ConnectWidget(QtWidgets.QWidget):
     def findAudio(self):
         if self.corporaList.text() is not None:
             directory = QtWidgets.QFileDialog.getExistingDirectory(self, "Select Directory")
-            if directory is None:
+            if not directory:
                 return
             kwargs = {}
             kwargs['config'] = self.createConfig()
@@ -334,13 +348,19 @@ class ConnectWidget(QtWidgets.QWidget):
             self.finderWorker.setParams(kwargs)
             self.finderWorker.start()
 
-    def doneFinding(self, success):
-        if success:
+    def doneFinding(self, match):
+        if match is not None and match.all_found:
             self.audioLookupButton.setText('Audio found')
             self.audioLookupButton.setEnabled(False)
         else:
             self.audioLookupButton.setText('Find local audio files')
-            self.setEnabled(True)
+            self.audioLookupButton.setEnabled(True)
+        if match is not None:
+            QtWidgets.QMessageBox.information(self, 'Audio lookup', match.report())
+
+    def findingFailed(self, error):
+        self.doneFinding(None)
+        QtWidgets.QMessageBox.critical(self, 'Audio lookup', str(error))
 
     def getHelp(self):
         self.corporaHelpBroadcast.emit()
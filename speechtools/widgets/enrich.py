@@ -7,6 +7,8 @@ from PyQt5 import QtGui, QtCore, QtWidgets
 
 from polyglotdb import CorpusContext
 
+from ..acoustics import AnalysisRecord, find_pending
+
 from .base import RadioSelectWidget
 
 from .lexicon import StressToneSelectWidget, WordSelectWidget
@@ -122,6 +124,7 @@ class EncodeUtterancePositionDialog(BaseDialog):
 class AnalyzeAcousticsDialog(BaseDialog):
     def __init__(self, config, parent):
         super(AnalyzeAcousticsDialog, self).__init__(parent)
+        self.config = config
 
         self.setWindowTitle('Analyze acoustics')
 
@@ -129,16 +132,31 @@ class AnalyzeAcousticsDialog(BaseDialog):
 
         self.acousticsWidget = RadioSelectWidget('Acoustics to encode',
                                             OrderedDict([
-                                            ('Pitch (REAPER)','pitch'),
+                                            ('Pitch (autocorrelation)','pitch'),
                                             #('Formants (LPC)','formants'),
                                             ]))
 
         layout.addRow(self.acousticsWidget)
 
+        self.reanalyzeCheck = QtWidgets.QCheckBox('Reanalyze sound files that are up to date')
+        layout.addRow(self.reanalyzeCheck)
+
+        self.pendingButton = QtWidgets.QPushButton('Check pending work')
+        self.pendingButton.clicked.connect(self.showPending)
+        layout.addRow(self.pendingButton)
+
         self.layout().insertLayout(0, layout)
 
+    def showPending(self):
+        value = self.value()
+        with CorpusContext(self.config) as c:
+            pending = find_pending(c, value['acoustics'], AnalysisRecord(c.corpus_name),
+                                    value['reanalyze'])
+        QtWidgets.QMessageBox.information(self, 'Pending analysis', pending.report())
+
     def value(self):
-        return self.acousticsWidget.value()
+        return {'acoustics': self.acousticsWidget.value(),
+                'reanalyze': self.reanalyzeCheck.isChecked()}
 
 class EncodeSyllabicsDialog(BaseDialog):
     def __init__(self, config, parent):
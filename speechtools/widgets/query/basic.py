@@ -3,11 +3,9 @@ from PyQt5 import QtGui, QtCore, QtWidgets
 
 from polyglotdb import CorpusContext
 
-from polyglotdb.graph.func import Sum, Count
-
 from ..base import NonScrollingComboBox
 
-from ...profiles import QueryProfile, Filter
+from ...profiles import QueryProfile, Filter, GroupBy, Aggregate, SAMPLE_STRATA
 
 from ...helper import get_system_font_height
 
@@ -1040,6 +1038,214 @@ class FilterBox(QtWidgets.QGroupBox):
         if len(label) > 5 and label == ['phone', 'subset', '==', 'syllabic', 'delete', 'delete2'] or label == ['phone', 'alignment', 'Right aligned with', 'word', 'delete', 'delete2']:
             self.clearFilters()
 
+class GroupByWidget(QtWidgets.QWidget):
+    needsDelete = QtCore.pyqtSignal()
+
+    def __init__(self, config, to_find):
+        super(GroupByWidget, self).__init__()
+        mainLayout = QtWidgets.QHBoxLayout()
+        mainLayout.setSpacing(10)
+        mainLayout.setContentsMargins(0,0,0,0)
+
+        self.attributeWidget = AttributeWidget(config, to_find)
+        mainLayout.addWidget(self.attributeWidget)
+
+        self.deleteButton = QtWidgets.QPushButton()
+        self.deleteButton.setIcon(QtWidgets.qApp.style().standardIcon(QtWidgets.QStyle.SP_DialogCancelButton))
+        self.deleteButton.clicked.connect(self.needsDelete.emit)
+        self.deleteButton.setSizePolicy(QtWidgets.QSizePolicy.Fixed,QtWidgets.QSizePolicy.Fixed)
+        mainLayout.addWidget(self.deleteButton)
+
+        self.setLayout(mainLayout)
+
+    def setToFind(self, to_find):
+        self.attributeWidget.setToFind(to_find)
+
+    def toGroupBy(self):
+        att = self.attributeWidget.attribute()
+        return GroupBy(att, '_'.join(att[1:]))
+
+    def fromGroupBy(self, group_by):
+        self.attributeWidget.setAttribute(group_by.attribute)
+
+class AggregateWidget(GroupByWidget):
+    def __init__(self, config, to_find):
+        super(AggregateWidget, self).__init__(config, to_find)
+        self.functionSelect = NonScrollingComboBox()
+        for f in ['count', 'mean', 'min', 'max', 'sum']:
+            self.functionSelect.addItem(f)
+        self.functionSelect.currentIndexChanged.connect(self.updateFunction)
+        self.layout().insertWidget(0, self.functionSelect)
+        self.updateFunction()
+
+    def updateFunction(self):
+        # Counts are of the tokens in each group
+        self.attributeWidget.setEnabled(self.functionSelect.currentText() != 'count')
+
+    def toAggregate(self):
+        function = self.functionSelect.currentText()
+        if function == 'count':
+            return Aggregate(function, None, 'count')
+        att = self.attributeWidget.attribute()
+        return Aggregate(function, att, '_'.join([function] + list(att[1:])))
+
+    def fromAggregate(self, aggregate):
+        self.functionSelect.setCurrentIndex(self.functionSelect.findText(aggregate.function))
+        if aggregate.attribute is not None:
+            self.attributeWidget.setAttribute(aggregate.attribute)
+
+class AggregateBox(QtWidgets.QGroupBox):
+    """
+    Settings for running a query as an aggregation, which groups the
+    results by attributes and computes counts and other summaries in the
+    database instead of returning each token.
+    """
+    def __init__(self):
+        super(AggregateBox, self).__init__('Aggregate results')
+        self.setCheckable(True)
+        self.setChecked(False)
+        self.config = None
+        self.to_find = None
+
+        layout = QtWidgets.QFormLayout()
+        self.groupByLayout = QtWidgets.QVBoxLayout()
+        self.groupByLayout.setContentsMargins(0,0,0,0)
+        self.aggregateLayout = QtWidgets.QVBoxLayout()
+        self.aggregateLayout.setContentsMargins(0,0,0,0)
+
+        self.addGroupByButton = QtWidgets.QPushButton('+')
+        self.addGroupByButton.clicked.connect(self.addNewGroupBy)
+        self.addAggregateButton = QtWidgets.QPushButton('+')
+        self.addAggregateButton.clicked.connect(self.addNewAggregate)
+
+        layout.addRow('Group by', self.groupByLayout)
+        layout.addRow(self.addGroupByButton)
+        layout.addRow('Compute', self.aggregateLayout)
+        layout.addRow(self.addAggregateButton)
+        self.setLayout(layout)
+        self.setEnabled(False)
+
+    def deleteWidget(self):
+        widget = self.sender()
+        self.groupByLayout.removeWidget(widget)
+        self.aggregateLayout.removeWidget(widget)
+        widget.deleteLater()
+
+    def clear(self):
+        for l in [self.groupByLayout, self.aggregateLayout]:
+            while l.count() > 0:
+                item = l.takeAt(0)
+                if item.widget() is None:
+                    continue
+                item.widget().deleteLater()
+
+    def setConfig(self, config):
+        self.config = config
+        self.clear()
+        self.setChecked(False)
+        self.setEnabled(True)
+
+    def setToFind(self, to_find):
+        self.to_find = to_find
+        for l in [self.groupByLayout, self.aggregateLayout]:
+            for i in range(l.count()):
+                l.itemAt(i).widget().setToFind(to_find)
+
+    def addNewGroupBy(self):
+        if self.config is None:
+            return None
+        widget = GroupByWidget(self.config, self.to_find)
+        widget.needsDelete.connect(self.deleteWidget)
+        self.groupByLayout.addWidget(widget)
+        return widget
+
+    def addNewAggregate(self):
+        if self.config is None:
+            return None
+        widget = AggregateWidget(self.config, self.to_find)
+        widget.needsDelete.connect(self.deleteWidget)
+        self.aggregateLayout.addWidget(widget)
+        return widget
+
+    def widgets(self, layout, cls):
+        widgets = []
+        for i in range(layout.count()):
+            widget = layout.itemAt(i).widget()
+            if type(widget) is cls:
+                widgets.append(widget)
+        return widgets
+
+    def setAggregation(self, group_by, aggregates):
+        self.clear()
+        for g in group_by:
+            self.addNewGroupBy().fromGroupBy(g)
+        for a in aggregates:
+            self.addNewAggregate().fromAggregate(a)
+        self.setChecked(len(aggregates) > 0)
+
+    def groupBy(self):
+        if not self.isChecked():
+            return []
+        return [w.toGroupBy() for w in self.widgets(self.groupByLayout, GroupByWidget)]
+
+    def aggregates(self):
+        if not self.isChecked():
+            return []
+        return [w.toAggregate() for w in self.widgets(self.aggregateLayout, AggregateWidget)]
+
+class SampleBox(QtWidgets.QGroupBox):
+    """
+    Settings for loading a random sample of a query's results, either
+    overall or a fixed number for each speaker, discourse or label.
+    """
+    def __init__(self):
+        super(SampleBox, self).__init__('Sample results')
+        self.setCheckable(True)
+        self.setChecked(False)
+
+        layout = QtWidgets.QFormLayout()
+
+        self.sizeEdit = QtWidgets.QSpinBox()
+        self.sizeEdit.setRange(1, 1000000)
+        self.sizeEdit.setValue(100)
+
+        self.strataSelect = NonScrollingComboBox()
+        self.strataSelect.addItem('whole query')
+        for k in sorted(SAMPLE_STRATA):
+            self.strataSelect.addItem(k)
+
+        self.seedEdit = QtWidgets.QSpinBox()
+        self.seedEdit.setRange(0, 2 ** 31 - 1)
+        self.seedEdit.setValue(1)
+
+        layout.addRow('Number of results', self.sizeEdit)
+        layout.addRow('Per', self.strataSelect)
+        layout.addRow('Random seed', self.seedEdit)
+        self.setLayout(layout)
+
+    def setSample(self, size, sample_by, seed):
+        self.setChecked(size is not None)
+        if size is not None:
+            self.sizeEdit.setValue(size)
+        if sample_by is None:
+            self.strataSelect.setCurrentIndex(0)
+        else:
+            self.strataSelect.setCurrentIndex(self.strataSelect.findText(sample_by))
+        self.seedEdit.setValue(seed)
+
+    def sampleSize(self):
+        if not self.isChecked():
+            return None
+        return self.sizeEdit.value()
+
+    def sampleBy(self):
+        if not self.isChecked() or self.strataSelect.currentIndex() == 0:
+            return None
+        return self.strataSelect.currentText()
+
+    def seed(self):
+        return self.seedEdit.value()
+
 class BasicQuery(QtWidgets.QWidget):
     needsHelp = QtCore.pyqtSignal(object)
     changetofind = QtCore.pyqtSignal(object)
@@ -1067,9 +1273,15 @@ class BasicQuery(QtWidgets.QWidget):
         self.filterWidget.checkboxToUncheck.connect(self.basicFilterWidget.uncheck)
 
         self.filterWidget.needsHelp.connect(self.needsHelp.emit)
+
+        self.aggregateWidget = AggregateBox()
+        self.sampleWidget = SampleBox()
+
         mainLayout.addRow('Linguistic objects to find', self.toFindWidget)
         mainLayout.addRow(self.filterWidget)
         mainLayout.addRow(self.basicFilterWidget)
+        mainLayout.addRow(self.aggregateWidget)
+        mainLayout.addRow(self.sampleWidget)
 
         self.setLayout(mainLayout)
 
@@ -1078,11 +1290,13 @@ class BasicQuery(QtWidgets.QWidget):
     def updateToFind(self, annotation_types):
         to_find = self.toFindWidget.currentText()
         self.filterWidget.setToFind(to_find)
+        self.aggregateWidget.setToFind(to_find)
         self.changetofind.emit([to_find, annotation_types])
 
     def checkboxUpdateToFind(self, to_find):
         to_find = to_find[0]
         self.filterWidget.setToFind(to_find)
+        self.aggregateWidget.setToFind(to_find)
         index = self.toFindWidget.findText(to_find)
         self.toFindWidget.setCurrentIndex(index)
 
@@ -1091,6 +1305,7 @@ class BasicQuery(QtWidgets.QWidget):
         with CorpusContext(config) as c:
             self.hierarchy = c.hierarchy
         self.filterWidget.setConfig(config)
+        self.aggregateWidget.setConfig(config)
         self.toFindWidget.clear()
 
         self.toFindWidget.currentIndexChanged.disconnect(self.updateToFind)
@@ -1110,9 +1325,16 @@ class BasicQuery(QtWidgets.QWidget):
                 to_find = profile.to_find
             self.toFindWidget.setCurrentIndex(self.toFindWidget.findText(to_find))
         self.filterWidget.setFilters(profile.filters)
+        self.aggregateWidget.setAggregation(profile.group_by, profile.aggregates)
+        self.sampleWidget.setSample(profile.sample_size, profile.sample_by, profile.sample_seed)
 
     def profile(self):
         profile = QueryProfile()
         profile.to_find = self.toFindWidget.currentText()
         profile.filters = self.filterWidget.filters()
+        profile.group_by = self.aggregateWidget.groupBy()
+        profile.aggregates = self.aggregateWidget.aggregates()
+        profile.sample_size = self.sampleWidget.sampleSize()
+        profile.sample_by = self.sampleWidget.sampleBy()
+        profile.sample_seed = self.sampleWidget.seed()
         return profile
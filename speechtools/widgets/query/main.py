@@ -3,15 +3,13 @@ from PyQt5 import QtGui, QtCore, QtWidgets
 
 from polyglotdb import CorpusContext
 
-from polyglotdb.graph.func import Sum, Count
-
 from ..base import DetailedMessageBox, CollapsibleTabWidget
 
-from ...models import QueryResultsModel, ProxyModel
+from ...models import QueryResultsModel, AggregateResultsModel, ProxyModel
 
 from ...views import ResultsView
 
-from ...workers import (QueryWorker, ExportQueryWorker)
+from ...workers import (QueryWorker, ExportQueryWorker, RESULTS_PAGE_SIZE)
 
 from .graphical import GraphicalQuery
 
@@ -192,6 +190,30 @@ class QueryForm(QtWidgets.QWidget):
         self.executeButton.setText('Run query')
         self.setEnabled(True)
 
+    def showCount(self, count, sample = False):
+        if sample:
+            self.executeButton.setText('Sampling from {:,} results...'.format(count))
+        else:
+            self.executeButton.setText('Loading {:,} results...'.format(count))
+
+    def suggestSample(self):
+        """
+        Switch the query to loading a random sample of its results.
+        """
+        self.finishQuery()
+        self.queryWidget.sampleWidget.setChecked(True)
+
+    def suggestAggregation(self):
+        """
+        Switch the query to aggregation, with a count of its results to
+        start from.
+        """
+        self.finishQuery()
+        aggregateWidget = self.queryWidget.aggregateWidget
+        aggregateWidget.setChecked(True)
+        if not aggregateWidget.aggregates():
+            aggregateWidget.addNewAggregate()
+
     def saveProfile(self):
         default = self.profileWidget.currentName()
         if default == 'New query':
@@ -253,11 +275,46 @@ class QueryForm(QtWidgets.QWidget):
         self.saveButton.setDisabled(False)
         self.queryWidget.updateConfig(config)
 
+class LargeResultsDialog(QtWidgets.QDialog):
+    """
+    Dialog shown when a query has so many results that loading them all
+    would take a long time and a lot of memory, offering lighter options.
+    """
+    def __init__(self, count, parent = None):
+        super(LargeResultsDialog, self).__init__(parent)
+        self.setWindowTitle('Large query')
+        self.choice = None
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(QtWidgets.QLabel('This query has {:,} results.  Loading them all '
+                                        'may take a long time and a lot of memory.'.format(count)))
+
+        self.buttons = []
+        options = [('sample', 'Load a random sample of the results'),
+                    ('first', 'Load the first {:,} results only'.format(RESULTS_PAGE_SIZE)),
+                    ('export', 'Export the results to a file instead'),
+                    ('aggregate', 'Aggregate the results instead'),
+                    ('all', 'Load all results')]
+        for choice, text in options:
+            button = QtWidgets.QPushButton(text)
+            button.clicked.connect(lambda checked, choice = choice: self.choose(choice))
+            layout.addWidget(button)
+        cancelButton = QtWidgets.QPushButton('Cancel')
+        cancelButton.clicked.connect(self.reject)
+        layout.addWidget(cancelButton)
+
+        self.setLayout(layout)
+
+    def choose(self, choice):
+        self.choice = choice
+        self.accept()
+
 class QueryResults(QtWidgets.QWidget):
     def __init__(self, results):
         super(QueryResults, self).__init__()
 
         self.query = results[0]
+        self.loading = False
 
         self.resultsModel = QueryResultsModel(results[1])
 
@@ -275,6 +332,34 @@ class QueryResults(QtWidgets.QWidget):
 
         self.setLayout(layout)
 
+    def setResults(self, results):
+        self.query = results[0]
+        self.resultsModel.setResults(results[1])
+        self.loading = False
+
+class AggregateResults(QtWidgets.QWidget):
+    def __init__(self, results):
+        super(AggregateResults, self).__init__()
+
+        self.profile, header, rows = results
+
+        self.resultsModel = AggregateResultsModel(header, rows)
+
+        self.tableWidget = QtWidgets.QTableView()
+        self.tableWidget.setSortingEnabled(True)
+
+        self.proxyModel = ProxyModel()
+        self.proxyModel.setSourceModel(self.resultsModel)
+        self.proxyModel.setSortRole( AggregateResultsModel.SortRole )
+        self.proxyModel.setDynamicSortFilter(False)
+        self.tableWidget.setModel(self.proxyModel)
+
+        layout = QtWidgets.QVBoxLayout()
+
+        layout.addWidget(self.tableWidget)
+
+        self.setLayout(layout)
+
 class QueryWidget(CollapsibleTabWidget):
     viewRequested = QtCore.pyqtSignal(str, float, float)
     needsHelp = QtCore.pyqtSignal(object)
@@ -283,6 +368,7 @@ class QueryWidget(CollapsibleTabWidget):
         super(QueryWidget, self).__init__()
         self.config = None
         self.currentIndex = 1
+        self.loadingResults = None
         self.queryForm = QueryForm()
 
         self.queryForm.queryWidget.needsHelp.connect(self.needsHelp.emit)
@@ -306,10 +392,41 @@ class QueryWidget(CollapsibleTabWidget):
         self.queryForm.updateConfig(config)
 
     def updateResults(self, results):
+        """
+        Show results in a new tab.  Results with a third element are the
+        first page of a query whose full results are still loading, and
+        are replaced when the full results arrive.
+        """
+        if self.loadingResults is not None:
+            self.loadingResults.setResults(results)
+        else:
+            name = 'Query {}'.format(self.currentIndex)
+            self.currentIndex += 1
+            self.loadingResults = QueryResults(results)
+            self.loadingResults.tableWidget.viewRequested.connect(self.viewRequested.emit)
+            self.addTab(self.loadingResults, name)
+        widget = self.loadingResults
+        index = self.indexOf(widget)
+        if len(results) > 2:
+            widget.loading = True
+            self.setTabText(index, '{} (loading {:,})'.format(self.tabText(index).split(' (')[0], results[2]))
+        else:
+            self.setTabText(index, self.tabText(index).split(' (')[0])
+            self.loadingResults = None
+
+    def cancelResults(self):
+        if self.loadingResults is None:
+            return
+        index = self.indexOf(self.loadingResults)
+        self.setTabText(index, '{} (first {:,})'.format(self.tabText(index).split(' (')[0],
+                                                        self.loadingResults.resultsModel.rowCount()))
+        self.loadingResults.loading = False
+        self.loadingResults = None
+
+    def updateAggregateResults(self, results):
         name = 'Query {}'.format(self.currentIndex)
         self.currentIndex += 1
-        widget = QueryResults(results)
-        widget.tableWidget.viewRequested.connect(self.viewRequested.emit)
+        widget = AggregateResults(results)
         self.addTab(widget, name)
 
     def markAnnotated(self, value):
@@ -14,7 +14,9 @@ from .structure import HierarchyWidget
 
 from ..plot import AnnotationWidget, SpectralWidget
 
-from ..workers import PrecedingCacheWorker, FollowingCacheWorker, AudioCacheWorker
+from ..tracking import TrackCache
+
+from ..workers import PrecedingCacheWorker, FollowingCacheWorker, AudioCacheWorker, LocalTrackWorker
 
 class SelectableAudioWidget(QtWidgets.QWidget):
     discourseHelpBroadcast = QtCore.pyqtSignal()
@@ -103,6 +105,15 @@ class SelectableAudioWidget(QtWidgets.QWidget):
         self.audioCacheWorker.dataReady.connect(self.updateAudio)
         self.audioCacheWorker.errorEncountered.connect(self.showError)
 
+        self.trackCache = TrackCache()
+        self.local_tracks_running = None
+        self.local_tracks_pending = False
+        self.localTrackWorker = LocalTrackWorker()
+        self.localTrackWorker.dataReady.connect(self.updateLocalTracks)
+        self.localTrackWorker.finishedCancelling.connect(self.localTracksFinished)
+        self.localTrackWorker.errorEncountered.connect(self.localTracksFinished)
+        self.localTrackWorker.errorEncountered.connect(self.showError)
+
     def showError(self, e):
         reply = DetailedMessageBox()
         reply.setDetailedText(str(e))
@@ -115,6 +126,16 @@ class SelectableAudioWidget(QtWidgets.QWidget):
             self.m_audioOutput.setMedia(QtMultimedia.QMediaContent(p))
             self.spectrumWidget.update_sampling_rate(self.audio.sr)
             self.hierarchyWidget.setNumChannels(self.audio.num_channels)
+        self.uploadSignal()
+        if self.audio is not None and self.view_begin is not None:
+            self.audioWidget.update_signal_view(self.view_begin, self.view_end)
+
+    def uploadSignal(self):
+        if self.audio is None:
+            self.audioWidget.update_signal_cache(None, None)
+            return
+        self.audioWidget.update_signal_cache(self.audio.waveforms[self.channel], self.audio.sr,
+                                            self.audio.levels[self.channel])
 
     def cachePreceding(self):
         if self.audio is not None:
@@ -165,6 +186,7 @@ class SelectableAudioWidget(QtWidgets.QWidget):
 
     def updateChannel(self, channel):
         self.channel = channel
+        self.uploadSignal()
         self.updateVisible()
 
     def handleAudioState(self, state):
@@ -614,23 +636,11 @@ class SelectableAudioWidget(QtWidgets.QWidget):
             self.audioWidget.update_signal(None)
             self.spectrumWidget.update_signal(None)
         else:
-            if self.view_end - self.view_begin < 15:
-                sig = self.audio.visible_signal(self.view_begin, self.view_end, self.channel)
-                sr = self.audio.sr
-            elif self.view_end - self.view_begin < 60:
-                sig = self.audio.visible_downsampled_1000(self.view_begin, self.view_end, self.channel)
-                sr = 1000
-            else:
-                sig = self.audio.visible_downsampled_100(self.view_begin, self.view_end, self.channel)
-                sr = 100
+            # The whole cached window is already on the GPU, only the
+            # level of detail and amplitude scaling follow the view
+            self.audioWidget.update_signal_view(self.view_begin, self.view_end)
             preemph_signal  = self.audio.visible_preemph_signal(self.view_begin, self.view_end, self.channel)
 
-            t = np.arange(sig.shape[0]) / (sr) + self.view_begin
-
-            data = np.array((t, sig)).T
-            begin = time.time()
-            self.audioWidget.update_signal(data)
-            begin = time.time()
             self.spectrumWidget.update_sampling_rate(self.audio.sr)
             self.spectrumWidget.update_signal(preemph_signal)
             self.updatePlayTime(self.view_begin)
@@ -639,6 +649,7 @@ class SelectableAudioWidget(QtWidgets.QWidget):
         discourse_model, begin, end = discourse_model
         self.discourse_model = discourse_model
         self.audio = None
+        self.uploadSignal()
         if discourse_model.sound_file is not None:
             self.audioCacheWorker.setParams({'sound_file':self.discourse_model.sound_file, 'begin': begin, 'end': end})
             self.audioCacheWorker.start()
@@ -656,11 +667,68 @@ class SelectableAudioWidget(QtWidgets.QWidget):
 
     def drawPitch(self):
         pitch = self.discourse_model.pitch_from_begin(begin = self.view_begin, end = self.view_end, channel = self.channel)
+        if pitch is None:
+            pitch = self.localTracks()[0]
         self.spectrumWidget.update_pitch(pitch)
 
     def drawFormants(self):
         formants = self.discourse_model.formants_from_begin(begin = self.view_begin, end = self.view_end, channel = self.channel)
+        if formants is None:
+            formants = self.localTracks()[1]
+        self.spectrumWidget.update_formants(formants)
+
+    def localTracks(self):
+        """
+        Pitch and formants computed from the loaded audio for the visible
+        window, for discourses without stored tracks.  Windows that are
+        not cached yet are computed in the background and drawn once ready.
+        """
+        if self.audio is None:
+            return None, None
+        tracks = self.trackCache.get(self.audio, self.channel, self.view_begin, self.view_end)
+        if tracks is None:
+            self.requestLocalTracks()
+            return None, None
+        return tracks
+
+    def requestLocalTracks(self):
+        window = (self.audio, self.channel, self.view_begin, self.view_end)
+        if self.local_tracks_running == window:
+            return
+        if self.local_tracks_running is not None:
+            # Blocks finished so far stay cached, the rest are computed
+            # for the new window once the worker stops
+            self.local_tracks_pending = True
+            self.localTrackWorker.stop()
+            return
+        self.localTrackWorker.wait()
+        self.local_tracks_running = window
+        self.localTrackWorker.setParams({'audio': self.audio, 'cache': self.trackCache,
+                                        'channel': self.channel,
+                                        'begin': self.view_begin, 'end': self.view_end})
+        self.localTrackWorker.start()
+
+    def updateLocalTracks(self, results):
+        audio, channel, begin, end, tracks = results
+        self.local_tracks_running = None
+        if self.discourse_model is None or audio is not self.audio:
+            return
+        if self.local_tracks_pending or (channel, begin, end) != (self.channel, self.view_begin, self.view_end):
+            self.local_tracks_pending = False
+            self.drawFormants()
+            self.drawPitch()
+            return
+        pitch, formants = tracks
         self.spectrumWidget.update_formants(formants)
+        self.spectrumWidget.update_pitch(pitch)
+
+    def localTracksFinished(self, *args):
+        self.local_tracks_running = None
+        if self.local_tracks_pending:
+            self.local_tracks_pending = False
+            if self.discourse_model is not None:
+                self.drawFormants()
+                self.drawPitch()
 
     def changeView(self, begin, end):
         if self.discourse_model is None:
@@ -670,6 +738,8 @@ class SelectableAudioWidget(QtWidgets.QWidget):
 
     def clearDiscourse(self):
         self.discourse_model = None
+        if self.local_tracks_running is not None:
+            self.localTrackWorker.stop()
 
         self.min_selected_time = None
         self.max_selected_time = None
@@ -1,4 +1,5 @@
 
+import os
 import sys
 import traceback
 import time
@@ -15,13 +16,24 @@ from polyglotdb.config import CorpusConfig
 from polyglotdb.io import (inspect_buckeye, inspect_textgrid, inspect_timit,
                         inspect_labbcat, inspect_mfa, inspect_fave, inspect_partitur,
                         guess_textgrid_format)
-from polyglotdb.io.enrichment import enrich_lexicon_from_csv, enrich_features_from_csv, enrich_speakers_from_csv
 
-from polyglotdb.utils import update_sound_files, gp_language_stops, gp_speakers
+from polyglotdb.utils import gp_language_stops, gp_speakers
 
-from polyglotdb.acoustics.analysis import acoustic_analysis
 from polyglotdb.graph.discourse import LongSoundFile
 
+from .importing import (load_parallel, sync_directory, fingerprint_directory,
+                        ImportJournal, ImportManifest, remove_partial_discourses,
+                        discourse_name, FINALIZE_CHUNK_SIZE, BULK_CHUNK_SIZE)
+from .enrichment import (encode_class, enrich_lexicon, enrich_features, enrich_speakers,
+                        encode_hierarchical_property)
+from .acoustics import AnalysisRecord, find_pending, analyze_parallel, analysis_error
+from .audio_index import AudioIndex, match_discourses, register_sound_files
+from .audio_cache import decoded_sound_file, AudioWindow
+from .utterances import (encode_utterances, encode_speech_rate, encode_utterance_position,
+                        clear_state, ALL_STATES)
+from .pipeline import plan_enrichments, run_plan, timing_report, PipelineError
+from .cancellation import CancellableCorpusContext, is_cancellation
+
 class FunctionWorker(QtCore.QThread):
     updateProgress = QtCore.pyqtSignal(object)
     updateMaximum = QtCore.pyqtSignal(object)
@@ -61,8 +73,30 @@ class FunctionWorker(QtCore.QThread):
                 self.updateMaximum.emit(args[1])
             self.updateProgress.emit(progress)
 
+# Number of rows shown while the rest of a query's results load
+RESULTS_PAGE_SIZE = 500
+
+# Number of results above which the user is asked before loading them all
+LARGE_RESULT_COUNT = 100000
+
 class QueryWorker(FunctionWorker):
     connectionIssues = QtCore.pyqtSignal()
+    pageReady = QtCore.pyqtSignal(object)
+    def __init__(self):
+        super(QueryWorker, self).__init__()
+        self.corpusContext = None
+
+    def cancellableContext(self, config):
+        self.corpusContext = CancellableCorpusContext(config)
+        if self.stopped:
+            self.corpusContext.cancelled = True
+        return self.corpusContext
+
+    def stop(self):
+        super(QueryWorker, self).stop()
+        if self.corpusContext is not None:
+            self.corpusContext.cancel()
+
     def run(self):
         finished = False
         time.sleep(0.1)
@@ -85,9 +119,16 @@ class QueryWorker(FunctionWorker):
 
             if not success:
                 raise(ConnectionError('The query could not be completed.  Please check your internet connectivity.'))
+            self.corpusContext = None
 
         
         except Exception as e:
+            query_tag = getattr(self.corpusContext, 'query_tag', None)
+            self.corpusContext = None
+            if self.stopped and is_cancellation(e, query_tag):
+                self.finished = True
+                self.finishedCancelling.emit()
+                return
             if not isinstance(e, PGError):
                 exc_type, exc_value, exc_traceback = sys.exc_info()
                 e = ''.join(traceback.format_exception(exc_type, exc_value,exc_traceback))
@@ -104,15 +145,50 @@ class QueryWorker(FunctionWorker):
         
         self.finished = True
         
+    def buildQuery(self, corpus_context, profile):
+        a_type = getattr(corpus_context, profile.to_find)
+        query = corpus_context.query_graph(a_type)
+        query.call_back = self.kwargs['call_back']
+        query.stop_check = self.kwargs['stop_check']
+        query = query.filter(*profile.for_polyglot(corpus_context))
+        return query
+
     def run_query(self):
         profile = self.kwargs['profile']
         config = self.kwargs['config']
-        with CorpusContext(config) as c:
+        count = self.kwargs.get('count', None)
+        limit = self.kwargs.get('limit', None)
+        call_back = self.kwargs['call_back']
+        with self.cancellableContext(config) as c:
             a_type = getattr(c, profile.to_find)
-            query = c.query_graph(a_type)
-            query.call_back = self.kwargs['call_back']
-            query.stop_check = self.kwargs['stop_check']
-            query = query.filter(*profile.for_polyglot(c))
+            if profile.is_sample:
+                # Only ids and strata are transferred to draw the sample,
+                # then the full rows of the sampled results
+                call_back('Drawing a sample...')
+                query = self.buildQuery(c, profile).columns(*profile.sample_for_polyglot(c))
+                rows = [(r['id'], r['stratum'] if profile.sample_by is not None else None)
+                        for r in query.all()]
+                ids = profile.draw_sample(rows)
+                call_back('Loading a sample of {} results...'.format(len(ids)))
+                query = self.buildQuery(c, profile).filter(a_type.id.in_(ids))
+                query = query.preload(getattr(a_type, 'speaker'), getattr(a_type,'discourse'))
+                results = query.all()
+                self.actionCompleted.emit('query')
+                return query, results
+            if limit is None and count is not None and count > RESULTS_PAGE_SIZE:
+                # Show the first page while the rest loads
+                call_back('Loading the first {} of {} results...'.format(RESULTS_PAGE_SIZE, count))
+                query = self.buildQuery(c, profile).limit(RESULTS_PAGE_SIZE)
+                query = query.preload(getattr(a_type, 'speaker'), getattr(a_type,'discourse'))
+                results = query.all()
+                if self.stopped:
+                    return query, results
+                self.pageReady.emit((query, results, count))
+            if count is not None:
+                call_back('Loading {} results...'.format(count if limit is None else min(count, limit)))
+            query = self.buildQuery(c, profile)
+            if limit is not None:
+                query = query.limit(limit)
             query = query.preload(getattr(a_type, 'speaker'), getattr(a_type,'discourse'))
             print(query.cypher())
 
@@ -122,6 +198,34 @@ class QueryWorker(FunctionWorker):
         self.actionCompleted.emit('query')
         return query, results
 
+class QueryCountWorker(QueryWorker):
+    def run_query(self):
+        profile = self.kwargs['profile']
+        config = self.kwargs['config']
+        with self.cancellableContext(config) as c:
+            self.kwargs['call_back']('Counting results...')
+            count = self.buildQuery(c, profile).count()
+        self.actionCompleted.emit('counting results')
+        return profile, count
+
+class AggregateQueryWorker(QueryWorker):
+    def run_query(self):
+        profile = self.kwargs['profile']
+        config = self.kwargs['config']
+        with self.cancellableContext(config) as c:
+            query = self.buildQuery(c, profile)
+            group_by, aggregates = profile.aggregation_for_polyglot(c)
+            if group_by:
+                query = query.group_by(*group_by)
+            print(query.cypher())
+
+            # Grouping and aggregation run in the database, only the
+            # aggregated rows are transferred
+            results = query.aggregate(*aggregates)
+        self.actionCompleted.emit('query')
+        header, rows = profile.aggregation_table(results)
+        return profile, header, rows
+
 
 class ImportCorpusWorker(QueryWorker):
 
@@ -129,14 +233,22 @@ class ImportCorpusWorker(QueryWorker):
         time.sleep(0.1)
         name = self.kwargs['name']
         directory = self.kwargs['directory']
-        reset = True
-        config = CorpusConfig(name, graph_host = 'localhost', graph_port = 7474)
+        num_processes = self.kwargs.get('num_processes', None)
+        resume = self.kwargs.get('resume', True)
+        incremental = self.kwargs.get('incremental', False)
+        chunk_size = FINALIZE_CHUNK_SIZE
+        if self.kwargs.get('bulk', False):
+            chunk_size = self.kwargs.get('batch_size', BULK_CHUNK_SIZE)
+        corpus_format = self.kwargs.get('format', name)
+        config = self.kwargs.get('config', None)
+        if config is None:
+            config = CorpusConfig(name, graph_host = 'localhost', graph_port = 7474)
         with CorpusContext(config) as c:
-            if name == 'buckeye':
+            if corpus_format == 'buckeye':
                 parser = inspect_buckeye(directory)
-            elif name == 'timit':
+            elif corpus_format == 'timit':
                 parser = inspect_timit(directory)
-            elif name == 'partitur':
+            elif corpus_format == 'partitur':
                 parser = inspect_partitur(directory)
             else:
                 form = guess_textgrid_format(directory)
@@ -151,13 +263,54 @@ class ImportCorpusWorker(QueryWorker):
 
             parser.call_back = self.kwargs['call_back']
             parser.stop_check = self.kwargs['stop_check']
-            parser.call_back('Resetting corpus...')
-            if reset:
+            manifest = ImportManifest(name)
+            if incremental and os.path.isdir(directory):
+                could_not_parse = sync_directory(c, parser, directory, manifest, num_processes,
+                                    call_back = self.kwargs['call_back'],
+                                    stop_check = self.kwargs['stop_check'])
+                self.actionCompleted.emit('importing corpus')
+                return could_not_parse
+            if not os.path.isdir(directory):
+                manifest.remove()
+                parser.call_back('Resetting corpus...')
+                c.reset(call_back = self.kwargs['call_back'], stop_check = self.kwargs['stop_check'])
+                could_not_parse = c.load(parser, directory)
+                self.actionCompleted.emit('importing corpus')
+                return could_not_parse
+            journal = ImportJournal(name)
+            committed = None
+            if resume:
+                committed = journal.committed(directory)
+            if committed is None:
+                parser.call_back('Resetting corpus...')
                 c.reset(call_back = self.kwargs['call_back'], stop_check = self.kwargs['stop_check'])
-            could_not_parse = c.load(parser, directory)
+                manifest.remove()
+                journal.begin(directory)
+            else:
+                parser.call_back('Resuming import, {} files already imported...'.format(len(committed)))
+                journal.resume(directory)
+                remove_partial_discourses(c, set(discourse_name(x) for x in committed),
+                                        call_back = self.kwargs['call_back'])
+            try:
+                could_not_parse = load_parallel(c, parser, directory, num_processes,
+                                    call_back = self.kwargs['call_back'],
+                                    stop_check = self.kwargs['stop_check'],
+                                    journal = journal, skip = committed,
+                                    chunk_size = chunk_size)
+            finally:
+                journal.close()
+            if not self.stopped:
+                journal.complete()
+                self.saveManifest(manifest, parser, directory, could_not_parse)
             self.actionCompleted.emit('importing corpus') 
         return could_not_parse
 
+    def saveManifest(self, manifest, parser, directory, could_not_parse):
+        fingerprints = fingerprint_directory(parser, directory)
+        for path in could_not_parse:
+            fingerprints.pop(os.path.relpath(path, directory), None)
+        manifest.save(directory, fingerprints)
+
 class ExportQueryWorker(QueryWorker):
     def run_query(self):
         profile = self.kwargs['profile']
@@ -165,7 +318,7 @@ class ExportQueryWorker(QueryWorker):
         config = self.kwargs['config']
         export_path = self.kwargs['path']
 
-        with CorpusContext(config) as c:
+        with self.cancellableContext(config) as c:
             a_type = getattr(c, profile.to_find)
             query = c.query_graph(a_type)
             query.call_back = self.kwargs['call_back']
@@ -196,10 +349,16 @@ class AudioFinderWorker(QueryWorker):
     def run_query(self):
         config = self.kwargs['config']
         directory = self.kwargs['directory']
+        call_back = self.kwargs['call_back']
+        stop_check = self.kwargs['stop_check']
+        index = AudioIndex(directory)
+        if not index.update(num_threads = self.kwargs.get('num_threads', 8),
+                            call_back = call_back, stop_check = stop_check):
+            return None
         with CorpusContext(config) as c:
-            update_sound_files(c, directory)
-            all_found = c.has_all_sound_files()
-        return all_found
+            match = match_discourses(index, c.discourses)
+            register_sound_files(c, match, call_back = call_back, stop_check = stop_check)
+        return match
 
 class AudioCheckerWorker(QueryWorker):
     def run_query(self):
@@ -212,11 +371,28 @@ class AcousticAnalysisWorker(QueryWorker):
     def run_query(self):
         config = self.kwargs['config']
         acoustics = self.kwargs['acoustics']
+        num_processes = self.kwargs.get('num_processes', None)
+        reanalyze = self.kwargs.get('reanalyze', False)
+        dry_run = self.kwargs.get('dry_run', False)
+        call_back = self.kwargs['call_back']
         with CorpusContext(config) as c:
-            acoustic_analysis(c,
-                            stop_check = self.kwargs['stop_check'],
-                            call_back = self.kwargs['call_back'],
-                            acoustics = acoustics)
+            record = AnalysisRecord(c.corpus_name)
+            call_back('Checking for sound files to analyze...')
+            call_back(0, 0)
+            pending = find_pending(c, acoustics, record, reanalyze)
+            if dry_run:
+                return pending.report()
+            try:
+                errors = analyze_parallel(c, pending, num_processes, record = record,
+                                        call_back = call_back,
+                                        stop_check = self.kwargs['stop_check'])
+            finally:
+                record.close()
+            if self.stopped:
+                return False
+            record.compact(set(c.discourses))
+            if errors:
+                raise(analysis_error(errors))
             self.actionCompleted.emit('analysing acousics')         
         return True
 
@@ -227,6 +403,8 @@ class PauseEncodingWorker(QueryWorker):
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
         with CorpusContext(config) as c:
+            # Utterances depend on pauses
+            clear_state(c, ALL_STATES)
             c.encode_pauses(pause_words,
                             stop_check = stop_check,
                             call_back = call_back)
@@ -243,51 +421,41 @@ class UtteranceEncodingWorker(QueryWorker):
         config = self.kwargs['config']
         min_pause_length = self.kwargs['min_pause_length']
         min_utterance_length = self.kwargs['min_utterance_length']
+        incremental = self.kwargs.get('incremental', True)
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
         with CorpusContext(config) as c:
-            c.encode_utterances(min_pause_length, min_utterance_length,
-                            stop_check = stop_check,
-                            call_back = call_back)
-            self.actionCompleted.emit('encoding utterances') 
-            if stop_check():
-                call_back('Resetting utterances...')
-                call_back(0, 0)
-                c.reset_utterances()
+            if not encode_utterances(c, min_pause_length, min_utterance_length, incremental,
+                                    call_back = call_back, stop_check = stop_check):
                 return False
+            self.actionCompleted.emit('encoding utterances') 
         return True
 
 class SpeechRateWorker(QueryWorker):
     def run_query(self):
         config = self.kwargs['config']
         to_count = self.kwargs['to_count']
+        incremental = self.kwargs.get('incremental', True)
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
         with CorpusContext(config) as c:
-            c.encode_speech_rate(to_count, stop_check = stop_check,
-                            call_back = call_back)
-            self.actionCompleted.emit('encoding speech rate') 
-            if stop_check():
-                call_back('Resetting speech rate...')
-                call_back(0, 0)
-                c.reset_speech_rate()
+            if not encode_speech_rate(c, to_count, incremental,
+                                    call_back = call_back, stop_check = stop_check):
                 return False
+            self.actionCompleted.emit('encoding speech rate') 
         return True
 
 class UtterancePositionWorker(QueryWorker):
     def run_query(self):
         config = self.kwargs['config']
+        incremental = self.kwargs.get('incremental', True)
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
         with CorpusContext(config) as c:
-            c.encode_utterance_position(stop_check = stop_check,
-                            call_back = call_back)
-            self.actionCompleted.emit('encoding utterance position')            
-            if stop_check():
-                call_back('Resetting utterance positions...')
-                call_back(0, 0)
-                c.reset_utterance_position()
+            if not encode_utterance_position(c, incremental,
+                                    call_back = call_back, stop_check = stop_check):
                 return False
+            self.actionCompleted.emit('encoding utterance position')            
         return True
 
 class SyllabicEncodingWorker(QueryWorker):
@@ -296,17 +464,11 @@ class SyllabicEncodingWorker(QueryWorker):
         segments = self.kwargs['segments']
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        call_back('Encoding syllabics...')
-        call_back(0, 0)
         with CorpusContext(config) as c:
-            c.reset_class('syllabic')
-            c.encode_class(segments, 'syllabic')
-            self.actionCompleted.emit('encoding syllabics')
-            if stop_check():
-                call_back('Resetting syllabics...')
-                call_back(0, 0)
-                c.reset_class('syllabic')
+            if not encode_class(c, segments, 'syllabic',
+                                call_back = call_back, stop_check = stop_check):
                 return False
+            self.actionCompleted.emit('encoding syllabics')
         return True
 
 class SyllableEncodingWorker(QueryWorker):
@@ -335,56 +497,40 @@ class PhoneSubsetEncodingWorker(QueryWorker):
         label = self.kwargs['label']
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        call_back('Resetting {}s...'.format(label))
-        call_back(0, 0)
         with CorpusContext(config) as c:
-            c.reset_class(label)
-            c.encode_class(segments, label)
-            self.actionCompleted.emit('encoding '+ self.kwargs['label'].replace('_',' '))
-            if stop_check():
-                call_back('Resetting {}s...'.format(label))
-                call_back(0, 0)
-                c.reset_class(label)
+            if not encode_class(c, segments, label,
+                                call_back = call_back, stop_check = stop_check):
                 return False
+            self.actionCompleted.emit('encoding '+ self.kwargs['label'].replace('_',' '))
         return True
 
 class LexiconEnrichmentWorker(QueryWorker):
     def run_query(self):
-        print("in the lexical worker")
         config = self.kwargs['config']
-        case_sensitive = self.kwargs['case_sensitive']
+        case_sensitive = self.kwargs.get('case_sensitive', False)
         path = self.kwargs['path']
+        batch_size = self.kwargs.get('batch_size', 500)
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        call_back('Enriching lexicon...')
-        call_back(0, 0)
         with CorpusContext(config) as c:
-            enrich_lexicon_from_csv(c, path)
-            self.actionCompleted.emit('enriching lexicon')
-            if stop_check():
-                call_back('Resetting lexicon...')
-                call_back(0, 0)
-                c.reset_lexicon()
-                
+            if not enrich_lexicon(c, path, case_sensitive, batch_size,
+                                call_back = call_back, stop_check = stop_check):
                 return False
+            self.actionCompleted.emit('enriching lexicon')
         return True
 
 class FeatureEnrichmentWorker(QueryWorker):
     def run_query(self):
         config = self.kwargs['config']
         path = self.kwargs['path']
+        batch_size = self.kwargs.get('batch_size', 500)
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        call_back('Enriching phonological inventory...')
-        call_back(0, 0)
         with CorpusContext(config) as c:
-            enrich_features_from_csv(c, path)
-            self.actionCompleted.emit('enriching phonological inventory')
-            if stop_check():
-                call_back('Resetting phonological inventory...')
-                call_back(0, 0)
-                c.reset_lexicon()
+            if not enrich_features(c, path, batch_size,
+                                call_back = call_back, stop_check = stop_check):
                 return False
+            self.actionCompleted.emit('enriching phonological inventory')
         return True
 
 
@@ -392,14 +538,14 @@ class SpeakerEnrichmentWorker(QueryWorker):
     def run_query(self):
         config = self.kwargs['config']
         path = self.kwargs['path']
+        batch_size = self.kwargs.get('batch_size', 500)
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        call_back('Enriching speakers...')
-        call_back(0,0)
         with CorpusContext(config) as c:
-            enrich_speakers_from_csv(c, path)
+            if not enrich_speakers(c, path, batch_size,
+                                call_back = call_back, stop_check = stop_check):
+                return False
             self.actionCompleted.emit('enriching speakers')
-            
         return True
 
 class HierarchicalPropertiesWorker(QueryWorker):
@@ -407,38 +553,30 @@ class HierarchicalPropertiesWorker(QueryWorker):
         config = self.kwargs['config']
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        call_back('Encoding {}...'.format(self.kwargs['name']))
-        call_back(0, 0)
         with CorpusContext(config) as c:
-            if self.kwargs['type'] == 'count':
-                c.encode_count(self.kwargs['higher'], self.kwargs['lower'],
-                            self.kwargs['name'], subset = self.kwargs['subset'])
-            elif self.kwargs['type'] == 'position':
-                c.encode_position(self.kwargs['higher'], self.kwargs['lower'],
-                            self.kwargs['name'], subset = self.kwargs['subset'])
-            elif self.kwargs['type'] == 'rate':
-                c.encode_rate(self.kwargs['higher'], self.kwargs['lower'],
-                            self.kwargs['name'], subset = self.kwargs['subset'])
-            self.actionCompleted.emit('encoding '+ self.kwargs['name'].replace('_',' '))
-            if stop_check():
+            if not encode_hierarchical_property(c, self.kwargs['type'],
+                            self.kwargs['higher'], self.kwargs['lower'],
+                            self.kwargs['name'], subset = self.kwargs.get('subset', None),
+                            call_back = call_back, stop_check = stop_check):
                 return False
+            self.actionCompleted.emit('encoding '+ self.kwargs['name'].replace('_',' '))
         return True
 
 class RelativizedMeasuresWorker(QueryWorker):
     def run_query(self):
-        res  = ""
-        data_type = 'word'
         config = self.kwargs['config']
+        measure = self.kwargs['measure']
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        call_back('Encoding {}...'.format(self.kwargs['measure']))
+        if stop_check():
+            return False
+        call_back('Encoding {}...'.format(measure))
         call_back(0, 0)
         with CorpusContext(config) as c:
-            string = "!"
-            c.encode_measure(self.kwargs['measure'])
-            self.actionCompleted.emit('encoding '+ self.kwargs['measure'].replace('_',' '))
-            if stop_check():
-                return False
+            # polyglotdb computes each measure in a single statement, so
+            # it can only be cancelled before it starts
+            c.encode_measure(measure)
+            self.actionCompleted.emit('encoding '+ measure.replace('_',' '))
         return True
 
 
@@ -507,10 +645,20 @@ class AudioCacheWorker(QueryWorker):
         sound_file = self.kwargs['sound_file']
         begin = self.kwargs['begin']
         end = self.kwargs['end']
-        f = LongSoundFile(sound_file, begin, end)
+        f = AudioWindow(LongSoundFile(decoded_sound_file(sound_file), begin, end))
         print('finished audio caching')
         return f
 
+class LocalTrackWorker(QueryWorker):
+    def run_query(self):
+        audio = self.kwargs['audio']
+        cache = self.kwargs['cache']
+        channel = self.kwargs['channel']
+        begin = self.kwargs['begin']
+        end = self.kwargs['end']
+        tracks = cache.compute(audio, channel, begin, end, stop_check = self.kwargs['stop_check'])
+        return audio, channel, begin, end, tracks
+
 class StressEncodingWorker(QueryWorker):
     def run_query(self):
        
@@ -525,3 +673,85 @@ class StressEncodingWorker(QueryWorker):
             c.encode_stresstone_to_syllables(encode_type, regex)
         self.actionCompleted.emit('encoding stress/tone')  
         return True
+
+ENRICHMENT_WORKERS = {'pauses': PauseEncodingWorker,
+                    'utterances': UtteranceEncodingWorker,
+                    'speech_rate': SpeechRateWorker,
+                    'utterance_position': UtterancePositionWorker,
+                    'syllabics': SyllabicEncodingWorker,
+                    'syllables': SyllableEncodingWorker,
+                    'phone_subset': PhoneSubsetEncodingWorker,
+                    'lexicon': LexiconEnrichmentWorker,
+                    'features': FeatureEnrichmentWorker,
+                    'speakers': SpeakerEnrichmentWorker,
+                    'hierarchical': HierarchicalPropertiesWorker,
+                    'relativized': RelativizedMeasuresWorker,
+                    'stress': StressEncodingWorker,
+                    'acoustics': AcousticAnalysisWorker}
+
+def run_worker(worker, kwargs):
+    """
+    Run a worker to completion in the calling thread, without needing a
+    Qt event loop.  Signals connected with ``QtCore.Qt.DirectConnection``
+    before calling are delivered as the worker runs.
+
+    Returns
+    -------
+    tuple
+        Result of the worker (or None) and the error it encountered (or None)
+    """
+    results = []
+    errors = []
+    direct = QtCore.Qt.DirectConnection
+    worker.dataReady.connect(results.append, direct)
+    worker.errorEncountered.connect(errors.append, direct)
+    worker.setParams(kwargs)
+    worker.run()
+    worker.dataReady.disconnect(results.append)
+    worker.errorEncountered.disconnect(errors.append)
+    return (results[0] if results else None), (errors[0] if errors else None)
+
+class EnrichmentPipelineWorker(QueryWorker):
+    def __init__(self):
+        super(EnrichmentPipelineWorker, self).__init__()
+        self.activeWorkers = []
+
+    def stop(self):
+        super(EnrichmentPipelineWorker, self).stop()
+        for w in list(self.activeWorkers):
+            w.stop()
+
+    def run_query(self):
+        config = self.kwargs['config']
+        targets = self.kwargs['targets']
+        force = self.kwargs.get('force', None)
+        max_workers = self.kwargs.get('max_workers', 2)
+        stop_check = self.kwargs['stop_check']
+        call_back = self.kwargs['call_back']
+        call_back('Planning enrichments...')
+        with CorpusContext(config) as c:
+            plan = plan_enrichments(c, targets, force)
+
+        def run_stage(step):
+            name, options = plan.steps[step]
+            kwargs = dict(options)
+            kwargs['config'] = config
+            worker = ENRICHMENT_WORKERS[name]()
+            worker.updateProgressText.connect(lambda x: call_back('[{}] {}'.format(step, x)),
+                                            QtCore.Qt.DirectConnection)
+            self.activeWorkers.append(worker)
+            try:
+                result, error = run_worker(worker, kwargs)
+            finally:
+                self.activeWorkers.remove(worker)
+            if error is not None:
+                raise(PipelineError('{} failed:\n{}'.format(step, error)))
+
+        begin = time.time()
+        timings = run_plan(plan, run_stage, max_workers, stop_check, call_back)
+        if stop_check():
+            return False
+        report = timing_report(plan, timings, time.time() - begin)
+        call_back(report)
+        self.actionCompleted.emit('running enrichments')
+        return report
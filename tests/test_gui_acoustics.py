@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+import numpy as np
+
+from speechtools import acoustics
+from speechtools.acoustics import AnalysisRecord, PendingAnalysis
+from speechtools.audio_cache import write_pcm
+
+def test_analyses():
+    assert acoustics.analyses('all') == ['pitch', 'formants']
+    assert acoustics.analyses('pitch') == ['pitch']
+    assert acoustics.analyses(['formants']) == ['formants']
+
+def test_analysis_record(tmpdir, monkeypatch):
+    monkeypatch.setattr(acoustics, 'RECORD_DIR', str(tmpdir))
+    record = AnalysisRecord('test corpus')
+    assert record.load() == {}
+    record.commit('s01_a', {'pitch': [1, 10, 0.0, None]})
+    record.commit('s01_b', {'pitch': [2, 10, 0.0, None]})
+    record.commit('s01_a', {'pitch': [3, 10, 0.0, None], 'formants': [3, 10, 0.0, None]})
+    record.close()
+    with open(record.path, 'a') as f:
+        f.write('{"discourse": "s01_c", "anal')
+    assert record.load() == {'s01_a': {'pitch': [3, 10, 0.0, None], 'formants': [3, 10, 0.0, None]},
+                            's01_b': {'pitch': [2, 10, 0.0, None]}}
+    record.compact(set(['s01_a']))
+    assert list(record.load()) == ['s01_a']
+    record.remove()
+    assert not os.path.exists(record.path)
+
+def test_pending_report():
+    pending = PendingAnalysis()
+    pending.total = 3
+    assert pending.report() == 'All 3 sound files are up to date.'
+    pending.tasks = {'a': ['pitch'], 'b': ['pitch', 'formants']}
+    pending.new = ['a']
+    pending.outdated = ['b']
+    pending.size = 2000000
+    report = pending.report()
+    assert report.startswith('2 of 3 sound files need analyzing (2.0 MB of audio)')
+    assert 'formants: 1 files' in report
+
+def test_compute_track(monkeypatch):
+    sr = 16000
+    t = np.arange(sr) / sr
+    signal = 0.5 * np.sin(2 * np.pi * 200 * t)
+    times, values = acoustics.compute_track(signal, sr, 'pitch')
+    assert len(times) == 100
+    assert list(values) == ['F0']
+    # Small blocks give the same track
+    monkeypatch.setattr(acoustics, 'BLOCK_POINTS', 7)
+    blocked_times, blocked = acoustics.compute_track(signal, sr, 'pitch')
+    assert blocked['F0'] == pytest.approx(values['F0'])
+    voiced = values['F0'][values['F0'] > 0]
+    assert len(voiced) > 80
+    assert np.median(voiced) == pytest.approx(200, rel = 0.02)
+
+    times, values = acoustics.compute_track(signal, sr, 'formants')
+    assert sorted(values) == ['F1', 'F2', 'F3']
+    assert values['F1'].shape == times.shape
+
+def test_analyze_sound_file(tmpdir):
+    path = str(tmpdir.join('s01.wav'))
+    sr = 16000
+    t = np.arange(sr // 2) / sr
+    write_pcm(path, np.array([np.sin(2 * np.pi * 150 * t), np.zeros(t.shape)]).T, sr)
+    discourse, tracks, error = acoustics.analyze_sound_file('s01', path, ['pitch'])
+    assert (discourse, error) == ('s01', None)
+    assert sorted(tracks) == ['pitch']
+    rows = tracks['pitch']
+    assert len(rows) == 100
+    assert set(rows[0]) == set(['time', 'channel', 'source', 'F0'])
+    assert max(r['F0'] for r in rows if r['channel'] == 1) == 0
+
+    discourse, tracks, error = acoustics.analyze_sound_file('s02', str(tmpdir.join('missing.wav')), ['pitch'])
+    assert tracks is None and error is not None
+
+def test_analyze_parallel_writes_before_recording(tmpdir, monkeypatch):
+    monkeypatch.setattr(acoustics, 'RECORD_DIR', str(tmpdir))
+    events = []
+
+    def analyze(discourse, path, todo):
+        if discourse == 'bad':
+            return discourse, None, 'Could not read the sound file.'
+        return discourse, {'pitch': [{'time': 0.0, 'F0': 100.0}]}, None
+
+    def write(corpus_context, sound_file_id, tracks):
+        events.append(('write', sound_file_id, tracks))
+
+    class Record(object):
+        def commit(self, discourse, signature):
+            events.append(('record', discourse))
+
+    monkeypatch.setattr(acoustics, 'analyze_sound_file', analyze)
+    monkeypatch.setattr(acoustics, 'write_tracks', write)
+    pending = PendingAnalysis()
+    pending.tasks = {'a': ['pitch'], 'bad': ['pitch']}
+    pending.files = {'a': (1, 'a.wav'), 'bad': (2, 'bad.wav')}
+    pending.signatures = {'a': {'pitch': [1, 10, 0.0, 'sct_autocorrelation']}, 'bad': {}}
+    errors = acoustics.analyze_parallel(object(), pending, num_processes = 1, record = Record())
+    assert errors == {'bad': 'Could not read the sound file.'}
+    assert events == [('write', 1, {'pitch': [{'time': 0.0, 'F0': 100.0}]}), ('record', 'a')]
@@ -0,0 +1,76 @@
+import os
+import wave
+
+import numpy as np
+
+from speechtools import audio_cache
+from speechtools.audio_cache import DecodedAudioCache, decoded_sound_file, AudioWindow
+
+class SoundFile(object):
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.duration = 1.0
+
+def test_decoded_audio_cache(tmpdir, monkeypatch):
+    decoded = []
+    def load(path, sr = None, mono = True):
+        decoded.append(path)
+        return np.zeros((2, 1000), dtype = np.float32), 16000
+    monkeypatch.setattr(audio_cache.librosa, 'load', load)
+
+    sources = []
+    for i in range(3):
+        path = str(tmpdir.join('s0{}.mp3'.format(i)))
+        with open(path, 'w') as f:
+            f.write(str(i))
+        sources.append(path)
+    wav_path = str(tmpdir.join('s04.wav'))
+    cache = DecodedAudioCache(str(tmpdir.join('cache')), max_size = 10000)
+
+    assert cache.get(wav_path) == wav_path
+    first = cache.get(sources[0])
+    assert first.endswith('.wav')
+    with wave.open(first, 'rb') as f:
+        assert (f.getnchannels(), f.getframerate(), f.getnframes()) == (2, 16000, 1000)
+    assert cache.get(sources[0]) == first
+    assert decoded == [sources[0]]
+
+    os.utime(first, (0, 0))
+    second = cache.get(sources[1])
+    cache.get(sources[2])
+    assert not os.path.exists(first)
+    assert os.path.exists(second)
+    assert cache.size() <= 10000
+
+    sound_file = decoded_sound_file(SoundFile(sources[1]), cache)
+    assert sound_file.filepath == second
+    assert sound_file.duration == 1.0
+    original = SoundFile(wav_path)
+    assert decoded_sound_file(original, cache) is original
+
+class LoadedSound(object):
+    def __init__(self, signal, sr, cached_begin):
+        self.path = 'loaded.wav'
+        self.signal = signal
+        self.sr = sr
+        self.num_channels = signal.shape[1]
+        self.duration = 100
+        self.cached_begin = cached_begin
+        self.cached_end = cached_begin + signal.shape[0] / sr
+
+def test_audio_window():
+    sr = 1000
+    signal = np.random.RandomState(0).randn(5000, 2)
+    window = AudioWindow(LoadedSound(signal, sr, 10))
+    assert window.waveforms[1].dtype == np.float32
+    assert window.waveforms[1][0, 0] == 10
+    assert np.allclose(window.waveforms[1][:, 1], signal[:, 1])
+    expected = signal[:, 0].copy()
+    expected[1:] -= 0.95 * signal[:-1, 0]
+    assert np.allclose(window.preemph_signals[0], expected, atol = 1e-5)
+    assert sorted(window.levels[0]) == [16, 128, 1024]
+
+    visible = window.visible_preemph_signal(11, 12, channel = 0)
+    assert visible.shape == (1000,)
+    assert np.shares_memory(visible, window.preemph_signals[0])
+    assert np.allclose(window.visible_signal(11, 12, channel = 1), signal[1000:2000, 1])
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from speechtools import audio_index
+from speechtools.audio_index import AudioIndex, match_discourses
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'w') as f:
+        f.write('RIFF')
+
+def test_audio_index(tmpdir, monkeypatch):
+    monkeypatch.setattr(audio_index, 'INDEX_DIR', str(tmpdir.join('indexes')))
+    root = str(tmpdir.join('audio'))
+    touch(os.path.join(root, 's01', 's01_a.wav'))
+    touch(os.path.join(root, 's01', 's01_a.txt'))
+    touch(os.path.join(root, 's02', 'deep', 's02_a.WAV'))
+    touch(os.path.join(root, 's03', 's01_a.wav'))
+
+    index = AudioIndex(root)
+    assert index.update(num_threads = 2)
+    assert index.scanned == 5
+    paths, duplicates = index.paths()
+    assert paths == {'s01_a': os.path.join(root, 's01', 's01_a.wav'),
+                    's02_a': os.path.join(root, 's02', 'deep', 's02_a.WAV')}
+    assert list(duplicates) == ['s01_a']
+
+    match = match_discourses(index, ['s02_a', 's01_a', 's04_a'])
+    assert sorted(match.matched) == ['s01_a', 's02_a']
+    assert match.missing == ['s04_a']
+    assert not match.all_found
+    assert 'Found sound files for 2 of 3 discourses' in match.report()
+
+    touch(os.path.join(root, 's04', 's04_a.wav'))
+    index = AudioIndex(root)
+    assert index.update()
+    assert (index.scanned, index.reused) == (2, 4)
+    assert match_discourses(index, ['s01_a', 's04_a']).all_found
+
+    assert not AudioIndex(root).update(stop_check = lambda: True)
+
+def test_audio_index_symlink_loop(tmpdir, monkeypatch):
+    monkeypatch.setattr(audio_index, 'INDEX_DIR', str(tmpdir.join('indexes')))
+    root = str(tmpdir.join('audio'))
+    touch(os.path.join(root, 's01', 's01_a.wav'))
+    try:
+        os.symlink(root, os.path.join(root, 's01', 'up'))
+    except (OSError, NotImplementedError):
+        pytest.skip('Symbolic links are not supported')
+
+    index = AudioIndex(root)
+    assert index.update()
+    assert index.paths()[0] == {'s01_a': os.path.join(root, 's01', 's01_a.wav')}
+
+def test_audio_index_compressed(tmpdir, monkeypatch):
+    monkeypatch.setattr(audio_index, 'INDEX_DIR', str(tmpdir.join('indexes')))
+    root = str(tmpdir.join('audio'))
+    touch(os.path.join(root, 's01', 's01_a.mp3'))
+    touch(os.path.join(root, 's01', 's01_b.FLAC'))
+    touch(os.path.join(root, 's01', 's01_b.wav'))
+    touch(os.path.join(root, 's01', 's01_c.txt'))
+
+    index = AudioIndex(root)
+    assert index.update()
+    paths, duplicates = index.paths()
+    # WAV files are used over compressed ones with the same name
+    assert paths == {'s01_a': os.path.join(root, 's01', 's01_a.mp3'),
+                    's01_b': os.path.join(root, 's01', 's01_b.wav')}
+    assert duplicates == {}
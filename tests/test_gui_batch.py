@@ -0,0 +1,46 @@
+import os
+import json
+
+import pytest
+
+from polyglotdb import CorpusContext
+
+from speechtools.command_line.batch import load_job, BatchRunner, JobError
+
+def test_load_job(tmpdir):
+    path = tmpdir.join('job.json')
+    path.write(json.dumps({'corpus': 'test',
+                        'import': {'directory': 'textgrids'},
+                        'queries': [{'query_profile': 'q', 'export_profile': 'e',
+                                    'path': 'out.csv'}]}))
+    job = load_job(str(path))
+    assert job['import']['directory'] == os.path.join(str(tmpdir), 'textgrids')
+    assert job['queries'][0]['path'] == os.path.join(str(tmpdir), 'out.csv')
+
+def test_batch_runner_errors():
+    with pytest.raises(JobError):
+        BatchRunner({})
+    runner = BatchRunner({'corpus': 'test'})
+    with pytest.raises(JobError):
+        runner.run_enrichments([{'enrichment': 'not_an_enrichment'}])
+    with pytest.raises(JobError):
+        runner.run_enrichments([{'to_count': 'syllabic'}])
+
+def test_batch_runner_enrichment_options(monkeypatch):
+    runner = BatchRunner({'corpus': 'test'})
+    ran = []
+    monkeypatch.setattr(runner, 'run_worker', lambda worker, kwargs, stage: ran.append(kwargs))
+    runner.run_enrichments([{'enrichment': 'stress', 'type': 'tone', 'regex': '[0-9]'},
+                            {'enrichment': 'pauses', 'pause_words': ['sil'], 'force': True}])
+    assert ran[0]['targets'] == [('stress', {'type': 'tone', 'regex': '[0-9]'}),
+                                ('pauses', {'pause_words': ['sil']})]
+    assert ran[0]['force'] == set(['pauses'])
+
+def test_batch_hierarchical(acoustic_config, graph_db):
+    job = {'corpus': acoustic_config.corpus_name,
+            'connection': {'host': graph_db['graph_host'], 'port': graph_db['graph_port']},
+            'enrichments': [{'enrichment': 'hierarchical', 'type': 'count', 'higher': 'word',
+                            'lower': 'phone', 'name': 'num_phones', 'force': True}]}
+    BatchRunner(job, stream = open(os.devnull, 'w')).run()
+    with CorpusContext(acoustic_config) as c:
+        assert c.hierarchy.has_token_property('word', 'num_phones')
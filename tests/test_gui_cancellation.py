@@ -0,0 +1,96 @@
+import pytest
+
+from polyglotdb import CorpusContext
+
+from speechtools.cancellation import CancellableCorpusContext, QueryCancelled, is_cancellation
+
+class Server(object):
+    """
+    Stand-in for the graph database, recording the statements sent.
+    """
+    def __init__(self, error = None):
+        self.statements = []
+        self.running = []
+        self.error = error
+        # Statements that only show up once the running ones are listed
+        self.arriving = []
+
+    def execute_cypher(self, context, statement, **parameters):
+        self.statements.append((statement, parameters))
+        if 'dbms.listQueries' in statement:
+            if self.error is not None:
+                raise(self.error)
+            running = [{'queryId': i, 'query': q} for i, q in self.running]
+            self.running.extend(self.arriving)
+            self.arriving = []
+            return running
+        if 'dbms.killQuery' in statement:
+            self.running = [(i, q) for i, q in self.running if i != parameters['id']]
+        else:
+            self.running.append(('query-{}'.format(len(self.running) + 1), statement))
+        return []
+
+    def killed(self):
+        return [p['id'] for s, p in self.statements if 'dbms.killQuery' in s]
+
+@pytest.fixture
+def server(monkeypatch):
+    server = Server()
+    monkeypatch.setattr(CorpusContext, '__init__', lambda self, *args, **kwargs: None)
+    monkeypatch.setattr(CorpusContext, 'execute_cypher',
+                        lambda self, statement, **parameters: server.execute_cypher(self, statement, **parameters))
+    return server
+
+def test_kill_running(server):
+    c = CancellableCorpusContext('test')
+    other = CancellableCorpusContext('test')
+    assert(c.query_tag.startswith('sct-'))
+    c.execute_cypher('MATCH (n) RETURN n')
+    other.execute_cypher('MATCH (n) RETURN n')
+    assert(server.statements[0][0] == '// {}\nMATCH (n) RETURN n'.format(c.query_tag))
+    assert(c.kill_running())
+    assert(server.killed() == ['query-1'])
+    with pytest.raises(QueryCancelled):
+        c.execute_cypher('MATCH (n) RETURN n')
+
+def test_kill_running_relists(server):
+    c = CancellableCorpusContext('test')
+    c.execute_cypher('MATCH (n) RETURN n')
+    server.arriving.append(('query-late', '// {}\nMATCH (m) RETURN m'.format(c.query_tag)))
+    assert(c.kill_running(interval = 0))
+    assert(server.killed() == ['query-1', 'query-late'])
+    assert(server.running == [])
+
+    # A statement that never stops is only killed once
+    stuck = CancellableCorpusContext('test')
+    stuck.running_queries = lambda: ['query-stuck']
+    assert(not stuck.kill_running(timeout = 0.05, interval = 0.01))
+    assert(server.killed().count('query-stuck') == 1)
+
+def test_is_cancellation():
+    class Terminated(Exception):
+        code = 'Neo.TransientError.Transaction.Terminated'
+    assert(is_cancellation(QueryCancelled('The query was cancelled.')))
+    assert(is_cancellation(Terminated('The transaction has been terminated.')))
+    assert(is_cancellation(ValueError('Failed: // sct-abc\nMATCH (n) RETURN n'), 'sct-abc'))
+    assert(not is_cancellation(ValueError('Invalid input'), 'sct-abc'))
+    assert(not is_cancellation(ZeroDivisionError('division by zero')))
+
+def test_kill_running_errors(server):
+    class ProcedureNotFound(Exception):
+        code = 'Neo.ClientError.Procedure.ProcedureNotFound'
+    server.error = ProcedureNotFound('There is no procedure with the name `dbms.listQueries`')
+    c = CancellableCorpusContext('test')
+    assert(not c.kill_running())
+    assert(c.cancelled)
+
+    server.error = ValueError('Unexpected')
+    with pytest.raises(ValueError):
+        CancellableCorpusContext('test').kill_running()
+
+def test_cancellable_context(acoustic_config):
+    with CancellableCorpusContext(acoustic_config) as c:
+        c.execute_cypher('MATCH (d:Discourse:{}) RETURN count(d) AS n'.format(c.cypher_safe_name))
+        c.kill_running()
+        with pytest.raises(QueryCancelled):
+            c.execute_cypher('MATCH (d:Discourse:{}) RETURN count(d) AS n'.format(c.cypher_safe_name))
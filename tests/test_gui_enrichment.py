@@ -4,6 +4,11 @@ from speechtools.widgets.query.basic import ValueWidget
 from polyglotdb import CorpusContext
 import collections
 
+from speechtools.enrichment import (EnrichmentCSV, EnrichmentFileError, chunks,
+								encode_hierarchical_property)
+from speechtools.utterances import (utterance_parameters, speech_rate_parameters, speech_rate_units,
+								encode_utterances, _remove_utterances, _add_utterances)
+
 def test_enrich_stress(stressed_config, qtbot):
 	#config = stressed_config
 	syllabics= "AA0,AA1,AA2,AH0,AH1,AH2,AE0,AE1,AE2,AY0,AY1,AY2,ER0,ER1,ER2,EH0,EH1,EH2,EY1,EY2,IH0,IH1,IH2,IY0,IY1,IY2,UW0,UW1,UW2".split(",")
@@ -30,4 +35,80 @@ def test_enrich_relativized(acoustic_config, qtbot):
 	qtbot.addWidget(query)
 	query.changeType('word','median_duration',float)
 
-	assert(isinstance(query.valueWidget,QtWidgets.QLineEdit))
\ No newline at end of file
+	assert(isinstance(query.valueWidget,QtWidgets.QLineEdit))
+
+def test_hierarchical_property_matches_polyglotdb(acoustic_config):
+	with CorpusContext(acoustic_config) as c:
+		word, phone = c.word_name, c.phone_name
+		for property_type in ['count', 'rate', 'position']:
+			name = 'sct_{}'.format(property_type)
+			polyglotdb_name = 'pg_{}'.format(property_type)
+			getattr(c, 'encode_' + property_type)(word, phone, polyglotdb_name)
+			assert(encode_hierarchical_property(c, property_type, word, phone, name))
+			target = phone if property_type == 'position' else word
+			statement = '''MATCH (n:`{}`:{}:speech)
+			RETURN n.`{}` AS ours, n.`{}` AS theirs'''.format(target, c.cypher_safe_name,
+														name, polyglotdb_name)
+			results = list(c.execute_cypher(statement))
+			assert(len(results) > 0)
+			for r in results:
+				assert(r['ours'] == r['theirs'])
+
+def test_add_utterances_pause_only(acoustic_config):
+	with CorpusContext(acoustic_config) as c:
+		c.encode_pauses(['sil'])
+		assert(encode_utterances(c, 0.15, 0))
+		discourse = sorted(c.discourses)[0]
+		stretches = list(c.get_utterances(discourse, 0.15, 0))
+		assert(len(stretches) > 1)
+		# The pause between the first two utterances has no words in it
+		pause = (stretches[0][1], stretches[1][0])
+		stretches.insert(1, pause)
+		_remove_utterances(c, discourse)
+		_add_utterances(c, discourse, stretches)
+
+		statement = '''MATCH (u:utterance:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus})
+		WHERE d.name = {{discourse}}
+		OPTIONAL MATCH (p:utterance:{corpus}:speech)-[:precedes]->(u)
+		RETURN u.begin AS begin, count(p) AS previous
+		ORDER BY begin'''.format(corpus = c.cypher_safe_name)
+		results = list(c.execute_cypher(statement, discourse = discourse))
+		assert(len(results) == len(stretches) - 1)
+		assert([r['previous'] for r in results] == [0] + [1] * (len(results) - 1))
+		c.reset_utterances()
+		c.reset_pauses()
+
+def test_enrichment_csv(tmpdir):
+	path = str(tmpdir.join('lexicon.txt'))
+	with open(path, 'w') as f:
+		f.write('word\tFrequency\tpos\tis content\nCats\t12\tN\tTrue\nare\tNA\tV\tfalse\n')
+	csv_file = EnrichmentCSV(path)
+	assert(csv_file.row_count == 2)
+	assert(csv_file.types == {'frequency': float, 'pos': str, 'is_content': bool})
+	batches = list(csv_file.batches(1, case_sensitive = False))
+	assert(batches[0] == [{'key': 'cats', 'properties': {'frequency': 12.0, 'pos': 'N', 'is_content': True}}])
+	assert(batches[1] == [{'key': 'are', 'properties': {'pos': 'V', 'is_content': False}}])
+
+	bad_path = str(tmpdir.join('bad.txt'))
+	with open(bad_path, 'w') as f:
+		f.write('word,label\ncats,a\n')
+	with pytest.raises(EnrichmentFileError):
+		EnrichmentCSV(bad_path)
+	with open(bad_path, 'w') as f:
+		f.write('word,frequency\ncats,1,2\n')
+	with pytest.raises(EnrichmentFileError):
+		EnrichmentCSV(bad_path)
+
+def test_chunks():
+	assert(list(chunks(range(5), 2)) == [[0, 1], [2, 3], [4]])
+
+def test_utterance_parameters():
+	assert(utterance_parameters(1, 0) == utterance_parameters(1.0, 0.0))
+	assert(utterance_parameters(0.5, 0) != utterance_parameters(0.6, 0))
+	assert(speech_rate_parameters('syllabic') != speech_rate_parameters('vowel'))
+
+def test_speech_rate_units():
+	class Corpus(object):
+		phone_name = 'phone'
+	assert(speech_rate_units(Corpus(), 'syllable') == ('syllable', None))
+	assert(speech_rate_units(Corpus(), 'syllabic') == ('phone', 'syllabic'))
@@ -0,0 +1,163 @@
+import os
+
+from polyglotdb.io import inspect_textgrid
+
+from speechtools import importing
+from speechtools.importing import find_files, parse_in_order, ImportJournal
+
+def test_parse_in_order(textgrid_test_dir):
+    path = os.path.join(textgrid_test_dir, 'acoustic_corpus.TextGrid')
+    parser = inspect_textgrid(path)
+    paths = [path] * 5
+    serial = list(parse_in_order(parser, paths, num_processes = 1))
+    parallel = list(parse_in_order(parser, paths, num_processes = 2))
+    assert [x[0] for x in parallel] == paths
+    assert all(x[2] is None for x in parallel)
+    assert [x[1].name for x in parallel] == [x[1].name for x in serial]
+
+def test_find_files(textgrid_test_dir):
+    path = os.path.join(textgrid_test_dir, 'acoustic_corpus.TextGrid')
+    parser = inspect_textgrid(path)
+    paths = find_files(parser, textgrid_test_dir)
+    assert [os.path.basename(x) for x in paths] == ['acoustic_corpus.TextGrid', 'stressed_corpus.TextGrid']
+
+def test_import_journal(tmpdir, monkeypatch):
+    monkeypatch.setattr(importing, 'JOURNAL_DIR', str(tmpdir))
+    directory = os.path.abspath(str(tmpdir.mkdir('corpus')))
+    journal = ImportJournal('test corpus')
+    assert journal.committed(directory) is None
+    journal.begin(directory)
+    journal.commit(os.path.join(directory, 's01', 'a.TextGrid'))
+    journal.commit(os.path.join(directory, 'b.TextGrid'))
+    journal.close()
+    assert journal.committed(directory) == set([os.path.join('s01', 'a.TextGrid'), 'b.TextGrid'])
+    assert journal.committed(os.path.join(directory, 's01')) is None
+    journal.complete()
+    assert journal.committed(directory) is None
+
+def test_diff_fingerprints(tmpdir):
+    path = tmpdir.join('a.TextGrid')
+    path.write('first')
+    first = importing.file_fingerprint(str(path))
+    assert importing.file_fingerprint(str(path), first) == first
+    path.write('second version')
+    second = importing.file_fingerprint(str(path), first)
+    assert second[2] != first[2]
+
+    old = {'a.TextGrid': first, 'b.TextGrid': (1, 0.0, 'x'), 'c.TextGrid': (1, 0.0, 'y')}
+    new = {'a.TextGrid': second, 'c.TextGrid': (1, 5.0, 'y'), 'd.TextGrid': (1, 0.0, 'z')}
+    added, changed, removed = importing.diff_fingerprints(old, new)
+    assert added == ['d.TextGrid']
+    assert changed == ['a.TextGrid']
+    assert removed == ['b.TextGrid']
+
+class StagingCorpus(object):
+    """
+    Stand-in for a corpus context that stages discourses in temporary
+    CSVs and only loads them into the database in ``finalize_import``.
+    """
+    def __init__(self, csv_directory, journal, directory):
+        self.csv_directory = csv_directory
+        self.journal = journal
+        self.directory = directory
+        self.config = self
+        self.stop = False
+        self.stop_in_finalize = False
+        self.journaled_at_finalize = []
+
+    def temporary_directory(self, name):
+        return self.csv_directory
+
+    def add_discourse(self, data):
+        with open(os.path.join(self.csv_directory, data.name + '.csv'), 'w') as f:
+            f.write(data.name)
+
+    def finalize_import(self, data, call_back = None, stop_check = None):
+        self.journaled_at_finalize.append(len(self.journal.committed(self.directory)))
+        if self.stop_in_finalize:
+            self.stop = True
+
+def test_load_parallel_journals_after_finalize(tmpdir, monkeypatch, textgrid_test_dir):
+    monkeypatch.setattr(importing, 'JOURNAL_DIR', str(tmpdir.mkdir('journals')))
+    source = os.path.join(textgrid_test_dir, 'acoustic_corpus.TextGrid')
+    corpus_dir = tmpdir.mkdir('corpus')
+    for name in ['a', 'b', 'c']:
+        corpus_dir.join(name + '.TextGrid').write_binary(open(source, 'rb').read())
+    directory = str(corpus_dir)
+    csv_directory = str(tmpdir.mkdir('csv'))
+    parser = inspect_textgrid(source)
+
+    journal = ImportJournal('staging')
+    journal.begin(directory)
+    c = StagingCorpus(csv_directory, journal, directory)
+    importing.load_parallel(c, parser, directory, num_processes = 1,
+                            journal = journal, chunk_size = 2)
+    journal.close()
+    # Files are journaled only once the chunk they are in is finalized
+    assert c.journaled_at_finalize == [0, 2]
+    assert journal.committed(directory) == set(['a.TextGrid', 'b.TextGrid', 'c.TextGrid'])
+    assert os.listdir(csv_directory) == []
+
+    # An import stopped during finalizing journals nothing from that chunk
+    journal.begin(directory)
+    c = StagingCorpus(csv_directory, journal, directory)
+    c.stop_in_finalize = True
+    importing.load_parallel(c, parser, directory, num_processes = 1,
+                            journal = journal, chunk_size = 2,
+                            stop_check = lambda: c.stop)
+    journal.close()
+    assert journal.committed(directory) == set()
+
+def test_sync_changed_file(tmpdir, monkeypatch, graph_db, textgrid_test_dir):
+    from polyglotdb import CorpusContext
+    from polyglotdb.config import CorpusConfig
+    monkeypatch.setattr(importing, 'MANIFEST_DIR', str(tmpdir.mkdir('manifests')))
+    source = os.path.join(textgrid_test_dir, 'acoustic_corpus.TextGrid')
+    with open(source, 'rb') as f:
+        contents = f.read()
+    corpus_dir = tmpdir.mkdir('corpus')
+    path = corpus_dir.join('acoustic_corpus.TextGrid')
+    path.write_binary(contents)
+    directory = str(corpus_dir)
+    parser = inspect_textgrid(str(path))
+    config = CorpusConfig('sync', **graph_db)
+    manifest = importing.ImportManifest('sync')
+    with CorpusContext(config) as c:
+        c.reset()
+        assert importing.sync_directory(c, parser, directory, manifest, num_processes = 1) == []
+        assert c.discourses == ['acoustic_corpus']
+        num_phones = c.query_graph(c.phone).count()
+
+        # Changing the file reloads its discourse in place
+        path.write_binary(contents + b'\n')
+        mtime = os.stat(str(path)).st_mtime + 10
+        os.utime(str(path), (mtime, mtime))
+        assert importing.sync_directory(c, parser, directory, manifest, num_processes = 1) == []
+        assert c.discourses == ['acoustic_corpus']
+        assert c.query_graph(c.phone).count() == num_phones
+
+def test_bulk_import_matches_normal_import(tmpdir, graph_db, textgrid_test_dir):
+    from polyglotdb import CorpusContext
+    from polyglotdb.config import CorpusConfig
+    from speechtools.acoustics import sound_files
+    corpus_dir = tmpdir.mkdir('corpus')
+    for name in ['a', 'b', 'c']:
+        for ext in ['.TextGrid', '.wav']:
+            with open(os.path.join(textgrid_test_dir, 'acoustic_corpus' + ext), 'rb') as f:
+                corpus_dir.join(name + ext).write_binary(f.read())
+    directory = str(corpus_dir)
+    parser = inspect_textgrid(os.path.join(directory, 'a.TextGrid'))
+    summaries = []
+    for name, chunk_size in [('normal', importing.FINALIZE_CHUNK_SIZE), ('bulk', importing.BULK_CHUNK_SIZE)]:
+        with CorpusContext(CorpusConfig(name, **graph_db)) as c:
+            c.reset()
+            assert importing.load_parallel(c, parser, directory, num_processes = 1,
+                                        chunk_size = chunk_size) == []
+            summaries.append((sorted(c.discourses),
+                            sorted(c.hierarchy.annotation_types),
+                            c.query_graph(c.phone).count(),
+                            c.query_graph(c.word).count(),
+                            sorted(sound_files(c))))
+    assert summaries[0] == summaries[1]
+    assert summaries[0][0] == ['a', 'b', 'c']
+    assert summaries[0][4] == ['a', 'b', 'c']
@@ -1,7 +1,25 @@
 
 import pytest
 
+from PyQt5 import QtCore
+
 from speechtools.models import ProxyModel, QueryResultsModel, make_safe
 
 def test_models(qtbot):
     pass
+
+class Result(object):
+    properties = ['id', 'label', 'begin', 'end']
+    def __init__(self, label):
+        self.label = label
+        self.begin = 0
+        self.end = 1
+
+def test_query_results_set_results(qtbot):
+    model = QueryResultsModel([])
+    assert(model.rowCount() == 0)
+    assert(model.columns == ['label', 'begin', 'end', 'discourse', 'speaker'])
+    model.setResults([Result('a'), Result('b')])
+    assert(model.rowCount() == 2)
+    assert(model.columns == ['label', 'begin', 'end', 'discourse', 'speaker'])
+    assert(model.data(model.index(1, 0), QtCore.Qt.DisplayRole) == 'b')
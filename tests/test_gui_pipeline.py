@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from speechtools.pipeline import (plan_enrichments, run_plan, critical_path,
+                                PipelineError)
+
+class Hierarchy(object):
+    def __init__(self, annotation_types = None, token_subsets = None):
+        self.annotation_types = annotation_types or ['word', 'phone']
+        self.token_subsets = token_subsets or set()
+
+    def has_token_subset(self, a_type, subset):
+        return (a_type, subset) in self.token_subsets
+
+    def has_type_subset(self, a_type, subset):
+        return False
+
+    def has_token_property(self, a_type, prop):
+        return False
+
+class Corpus(object):
+    word_name = 'word'
+    phone_name = 'phone'
+    def __init__(self, hierarchy):
+        self.hierarchy = hierarchy
+
+def test_plan_enrichments():
+    c = Corpus(Hierarchy())
+    plan = plan_enrichments(c, [('speech_rate', {'to_count': 'syllable'}),
+                                ('syllables', {}), ('syllabics', {}),
+                                ('utterances', {}), ('pauses', {})])
+    assert plan.order.index('pauses') < plan.order.index('utterances')
+    assert plan.order.index('syllabics') < plan.order.index('syllables')
+    assert sorted(plan.dependencies['speech_rate']) == ['syllables', 'utterances']
+
+    with pytest.raises(PipelineError):
+        plan_enrichments(c, [('utterances', {})])
+
+    c = Corpus(Hierarchy(token_subsets = set([('word', 'pause')])))
+    plan = plan_enrichments(c, [('utterances', {}), ('pauses', {})])
+    assert plan.skipped == ['pauses']
+    assert plan.order == ['utterances']
+    plan = plan_enrichments(c, [('utterances', {}), ('pauses', {})], force = ['pauses'])
+    assert plan.order == ['pauses', 'utterances']
+
+    plan = plan_enrichments(c, [('phone_subset', {'label': 'a'}), ('phone_subset', {'label': 'b'})])
+    assert plan.order == ['phone_subset:1', 'phone_subset:2']
+
+def test_run_plan():
+    c = Corpus(Hierarchy())
+    plan = plan_enrichments(c, [('pauses', {}), ('utterances', {}), ('syllabics', {}),
+                                ('acoustics', {})])
+    started = []
+    def run_stage(step):
+        started.append(step)
+        time.sleep(0.05)
+    timings = run_plan(plan, run_stage, max_workers = 2)
+    assert sorted(timings) == ['acoustics', 'pauses', 'syllabics', 'utterances']
+    assert timings['utterances'][0] >= timings['pauses'][1]
+    # Enrichments saving the hierarchy never overlap, acoustics can run
+    # alongside them
+    writing = sorted(timings[x] for x in ['pauses', 'syllabics', 'utterances'])
+    for (begin, end), (next_begin, next_end) in zip(writing, writing[1:]):
+        assert next_begin >= end
+    assert timings['acoustics'][0] < writing[0][1]
+    path, length = critical_path(plan, timings)
+    assert path == ['pauses', 'utterances']
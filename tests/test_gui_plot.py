@@ -1,4 +1,82 @@
 
 import pytest
 
+import numpy as np
 
+from speechtools.plot.helper import (label_level_of_detail, get_envelope_mesh_data, DurationTable,
+                                    get_waveform_levels, waveform_level, range_amplitude,
+                                    amplitude_scale, WAVEFORM_LEVEL_FACTORS)
+
+def test_label_level_of_detail():
+    positions = np.array([[0.5, 0], [1.05, 0], [1.15, 0], [1.25, 0], [2, 0], [5, 0]])
+    widths = np.array([1, 0.1, 0.1, 0.1, 1, 1])
+    keep, merged = label_level_of_detail(positions, widths, 100, 0, 3,
+                                    min_pixels = 15, merge_pixels = 20)
+    assert keep.tolist() == [0, 4]
+    assert merged.shape == (1, 2)
+    assert merged[0, 0] == pytest.approx(1.1)
+
+    keep, merged = label_level_of_detail(positions, widths, 1000, 0, 3)
+    assert keep.tolist() == [0, 1, 2, 3, 4]
+    assert merged.shape[0] == 0
+
+def test_envelope_mesh_data():
+    t = np.arange(44100) / 44100
+    sig = np.sin(2 * np.pi * 100 * t)
+    vertices, faces = get_envelope_mesh_data(np.array((t, sig)).T, 800)
+    assert vertices.shape == (1600, 3)
+    assert faces.shape == (1598, 3)
+    assert faces.max() == vertices.shape[0] - 1
+    assert np.all(vertices[0::2, 1] <= vertices[1::2, 1])
+
+def test_waveform_levels():
+    sr = 16000
+    t = np.arange(2 * sr) / sr
+    sig = np.where(t < 1, 0.25, 0.1) * np.sin(2 * np.pi * 100 * t)
+    data = np.array((t, sig)).T
+    levels = get_waveform_levels(data)
+    assert sorted(levels) == list(WAVEFORM_LEVEL_FACTORS)
+    available = [True for f in WAVEFORM_LEVEL_FACTORS]
+
+    # Whole window over 1000 pixels is 32 samples per pixel
+    assert waveform_level(32, WAVEFORM_LEVEL_FACTORS, available) == 0
+    assert waveform_level(320, WAVEFORM_LEVEL_FACTORS, available) == 1
+    assert waveform_level(320, WAVEFORM_LEVEL_FACTORS, [True, False, True, True]) == 0
+    assert waveform_level(1e6, WAVEFORM_LEVEL_FACTORS, available) == 3
+    # Zoomed in, the exact polyline is drawn
+    assert waveform_level(2, WAVEFORM_LEVEL_FACTORS, available) == -1
+    assert waveform_level(20, WAVEFORM_LEVEL_FACTORS, [False] * 4) == -1
+
+    # Envelopes keep the times of the window, so a view maps onto them
+    vertices, faces = levels[128]
+    assert vertices[0, 0] >= 0 and vertices[-1, 0] <= t[-1]
+    assert range_amplitude(vertices, 0.2, 0.8) == pytest.approx(0.25, abs = 1e-3)
+    assert range_amplitude(vertices, 1.2, 1.8) == pytest.approx(0.1, abs = 1e-3)
+    assert range_amplitude(data, 1.2, 1.8) == pytest.approx(0.1, abs = 1e-3)
+    assert range_amplitude(vertices, 3, 4) == 0
+
+    assert amplitude_scale(0.1) == pytest.approx(5)
+    assert amplitude_scale(0.8) == 1
+    assert amplitude_scale(0) == 1
+
+def test_duration_table():
+    annotations = [{'label': 'cat', 'begin': 0, 'end': 0.5,
+                    'phones': ['k', 'ae', 't'], 'phone_begins': [0, 0.1, 0.4],
+                    'phone_ends': [0.1, 0.4, 0.5]},
+                    {'label': 'at', 'begin': 1, 'end': 1.25,
+                    'phones': ['ae', 't'], 'phone_begins': [1, 1.2],
+                    'phone_ends': [1.2, 1.25]},
+                    {'label': 'cat', 'begin': 2, 'end': 2.75,
+                    'phones': ['k', 'ae', 't'], 'phone_begins': [2, 2.1, 2.5],
+                    'phone_ends': [2.1, 2.5, 2.75]}]
+    words = DurationTable.from_words(annotations)
+    assert words.labels.tolist() == ['at', 'cat']
+    assert words.counts().tolist() == [1, 2]
+    assert words.select(['cat']) == pytest.approx([0.5, 0.75])
+    assert words.select(['dog']).shape == (0,)
+
+    phones = DurationTable.from_phones(annotations)
+    assert phones.labels.tolist() == ['ae', 'k', 't']
+    assert phones.durations.shape == (8,)
+    assert phones.select(['ae', 't']) == pytest.approx([0.3, 0.1, 0.2, 0.05, 0.4, 0.25])
+    assert phones.mask([]).sum() == 0
@@ -0,0 +1,66 @@
+
+import pytest
+
+import numpy as np
+
+from speechtools.tracking import track_pitch, track_formants, TrackCache
+
+def resonate(signal, sr, frequency, bandwidth):
+    r = np.exp(-np.pi * bandwidth / sr)
+    a1, a2 = -2 * r * np.cos(2 * np.pi * frequency / sr), r * r
+    out = np.zeros_like(signal)
+    for i in range(signal.shape[0]):
+        out[i] = signal[i] - a1 * out[i - 1] * (i > 0) - a2 * out[i - 2] * (i > 1)
+    return out
+
+@pytest.fixture(scope = 'module')
+def vowel():
+    sr = 16000
+    signal = np.zeros(sr)
+    signal[::sr // 125] = 1
+    for frequency, bandwidth in [(700, 80), (1200, 90), (2600, 120)]:
+        signal = resonate(signal, sr, frequency, bandwidth)
+    signal /= np.abs(signal).max()
+    signal[int(0.8 * sr):] = 0
+    return signal, sr
+
+class SoundFile(object):
+    def __init__(self, signal, sr):
+        self.path = 'vowel.wav'
+        self.sr = sr
+        self.signal = signal[:, np.newaxis]
+        self.duration = signal.shape[0] / sr
+        self.cached_begin = 0
+        self.cached_end = self.duration
+
+def test_track_pitch(vowel):
+    signal, sr = vowel
+    times = np.arange(0.05, 0.95, 0.01)
+    pitch = track_pitch(signal, sr, times)
+    voiced = times < 0.75
+    assert np.allclose(pitch[voiced], 125, atol = 1)
+    assert np.all(pitch[times > 0.85] == 0)
+    assert track_pitch(signal, sr, [0, 1])[0] == 0
+
+def test_track_formants(vowel):
+    signal, sr = vowel
+    times = np.arange(0.1, 0.7, 0.05)
+    formants = track_formants(signal, sr, times)
+    for k, expected in [('F1', 700), ('F2', 1200), ('F3', 2600)]:
+        assert np.median(formants[k]) == pytest.approx(expected, rel = 0.1)
+
+def test_track_cache(vowel):
+    audio = SoundFile(*vowel)
+    cache = TrackCache(block_duration = 0.5)
+    assert cache.get(audio, 0, 0.2, 0.4) is None
+    pitch, formants = cache.compute(audio, 0, 0.2, 0.4)
+    assert len(pitch) == 21
+    assert pitch[0][0] == pytest.approx(0)
+    assert sorted(formants) == ['F1', 'F2', 'F3']
+    assert cache.get(audio, 0, 0.2, 0.4) == (pitch, formants)
+    assert cache.get(audio, 0, 0.2, 0.6) is None
+
+    cache.max_blocks = 1
+    cache.compute(audio, 0, 0.6, 0.7)
+    assert cache.get(audio, 0, 0.2, 0.4) is None
+    assert cache.compute(audio, 0, 0.6, 0.7, stop_check = lambda: True) is None
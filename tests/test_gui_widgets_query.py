@@ -1,10 +1,12 @@
 
 import pytest
 
-from speechtools.widgets.query.main import QueryWidget, QueryForm, QueryResults
+from speechtools.widgets.query.main import QueryWidget, QueryForm, QueryResults, LargeResultsDialog
 
 from speechtools.widgets.query.basic import ValueWidget
 
+from speechtools.profiles import QueryProfile, GroupBy, Aggregate
+
 def test_query_widget(qtbot):
     w = QueryWidget()
     qtbot.addWidget(w)
@@ -13,6 +15,13 @@ def test_query_form(qtbot):
     w = QueryForm()
     qtbot.addWidget(w)
 
+def test_large_results_dialog(qtbot):
+    w = LargeResultsDialog(1000000)
+    qtbot.addWidget(w)
+    assert(w.choice is None)
+    w.choose('aggregate')
+    assert(w.choice == 'aggregate')
+
 @pytest.mark.xfail
 def test_query_results(qtbot):
     w = QueryResults()
@@ -31,5 +40,47 @@ def test_value_widget(acoustic_config, qtbot):
     assert(w.value() == '')
 
 
+def test_aggregation_table():
+    profile = QueryProfile()
+    assert(not profile.is_aggregation)
+    profile.aggregates = [Aggregate('count', None, 'count')]
+    assert(profile.is_aggregation)
+    assert(profile.aggregation_table(12) == (['count'], [[12]]))
+
+    profile.group_by = [GroupBy(('phone', 'label'), 'label')]
+    profile.aggregates.append(Aggregate('mean', ('phone', 'duration'), 'mean_duration'))
+    rows = [{'label': 'aa', 'count': 2, 'mean_duration': 0.1},
+            {'label': 'b', 'count': 1, 'mean_duration': 0.05}]
+    header, rows = profile.aggregation_table(rows)
+    assert(header == ['label', 'count', 'mean_duration'])
+    assert(rows == [['aa', 2, 0.1], ['b', 1, 0.05]])
+
+def test_old_profile_defaults():
+    profile = QueryProfile()
+    state = profile.__dict__.copy()
+    del state['group_by']
+    del state['aggregates']
+    old = QueryProfile.__new__(QueryProfile)
+    old.__setstate__(state)
+    assert(old.group_by == [])
+    assert(not old.is_aggregation)
+
+def test_draw_sample():
+    profile = QueryProfile()
+    assert(not profile.is_sample)
+    profile.sample_size = 2
+    assert(profile.is_sample)
+    rows = [(str(i), 'a' if i < 6 else 'b') for i in range(10)]
+    sample = profile.draw_sample(rows)
+    assert(len(sample) == 2)
+    assert(sample == profile.draw_sample(list(reversed(rows))))
 
+    profile.sample_by = 'speaker'
+    sample = profile.draw_sample(rows)
+    assert(len(sample) == 4)
+    assert(len([x for x in sample if int(x) < 6]) == 2)
 
+    profile.sample_size = 5
+    sample = profile.draw_sample(rows)
+    assert(len(sample) == 9)
+    assert(all(str(i) in sample for i in range(6, 10)))